@@ -10,7 +10,8 @@ CREATE TABLE Books (
 	BookCondition VARCHAR(15),
     IsInStock TINYINT(1) NOT NULL DEFAULT 1,
     ShelfLocation VARCHAR(45),
-    ShelfRow INT
+    ShelfRow INT,
+    FULLTEXT INDEX ft_books_search (Title, Author, Genre)
 );
 
 CREATE TABLE Friends (
@@ -40,6 +41,89 @@ CREATE TABLE Contacts (
     FOREIGN KEY (FriendID) REFERENCES Friends(FriendID)
 );
 
+-- Single-row counters kept up to date by Write.py for the Home page metrics
+CREATE TABLE LibraryStats (
+	StatsID TINYINT PRIMARY KEY,
+    TotalBooks INT NOT NULL DEFAULT 0,
+    BorrowedBooks INT NOT NULL DEFAULT 0
+);
+
+-- Change counters bumped by Write.py, so cached copies of a table know when they are stale
+CREATE TABLE TableVersions (
+	TableName VARCHAR(45) PRIMARY KEY,
+    Version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Keys changed by Write.py, numbered in commit order per table; change_feed patches cached views from it
+CREATE TABLE ChangeLog (
+	Seq INT auto_increment PRIMARY KEY,
+    TableName VARCHAR(45) NOT NULL,
+    RowKey VARCHAR(45) NOT NULL,
+    Op CHAR(1) NOT NULL,
+    ChangedAt DATETIME NOT NULL
+);
+
+-- Returned loans, moved out of Loans by Write.py so Loans only holds active ones.
+-- Partitioned by return year, so a date-range query reads only the years it covers;
+-- the partition column has to be in the primary key, and partitioned tables can't
+-- have foreign keys (the history also outlives deleted books and friends).
+-- Add next years with ALTER TABLE LoanHistory REORGANIZE PARTITION pmax INTO (...).
+CREATE TABLE LoanHistory (
+	LoanID INT NOT NULL,
+    BorrowDate DATETIME NOT NULL,
+    DueDate DATETIME NOT NULL,
+    ReturnDate DATETIME NOT NULL,
+    ISBN CHAR(17),
+    FriendID INT,
+    PRIMARY KEY (ReturnDate, LoanID)
+) PARTITION BY RANGE (YEAR(ReturnDate)) (
+    PARTITION p_old VALUES LESS THAN (2022),
+    PARTITION p2022 VALUES LESS THAN (2023),
+    PARTITION p2023 VALUES LESS THAN (2024),
+    PARTITION p2024 VALUES LESS THAN (2025),
+    PARTITION p2025 VALUES LESS THAN (2026),
+    PARTITION p2026 VALUES LESS THAN (2027),
+    PARTITION p2027 VALUES LESS THAN (2028),
+    PARTITION p2028 VALUES LESS THAN (2029),
+    PARTITION p2029 VALUES LESS THAN (2030),
+    PARTITION p2030 VALUES LESS THAN (2031),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- Circulation per day and book / friend, added to by Write.py for the Analytics page (see circulation_rollups.py)
+CREATE TABLE BookDailyStats (
+	Day DATE NOT NULL,
+    ISBN CHAR(17) NOT NULL,
+    Checkouts INT NOT NULL DEFAULT 0,
+    Returned INT NOT NULL DEFAULT 0,
+    LoanDays INT NOT NULL DEFAULT 0,
+    LateReturns INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (Day, ISBN)
+);
+
+CREATE TABLE FriendDailyStats (
+	Day DATE NOT NULL,
+    FriendID INT NOT NULL,
+    Checkouts INT NOT NULL DEFAULT 0,
+    Returned INT NOT NULL DEFAULT 0,
+    LoanDays INT NOT NULL DEFAULT 0,
+    LateReturns INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (Day, FriendID)
+);
+
+-- Secondary indexes for the hot queries (older databases get them from migrations.py)
+CREATE INDEX ix_loans_due_date ON Loans (DueDate);
+CREATE INDEX ix_loans_return_reminder ON Loans (ReturnReminder);
+CREATE INDEX ix_books_stock_title ON Books (IsInStock, Title);
+CREATE INDEX ix_books_title_isbn ON Books (Title, ISBN);
+CREATE INDEX ix_books_genre_title ON Books (Genre, Title, ISBN);
+CREATE INDEX ix_friends_name ON Friends (FName, LName);
+CREATE INDEX ix_friends_last_name ON Friends (LName, FName);
+CREATE INDEX ix_books_isbn_digits ON Books ((REPLACE(ISBN, '-', '')));
+CREATE INDEX ix_changelog_table_seq ON ChangeLog (TableName, Seq);
+CREATE INDEX ix_loanhistory_friend ON LoanHistory (FriendID, ReturnDate);
+CREATE INDEX ix_loanhistory_isbn ON LoanHistory (ISBN, ReturnDate);
+
 -- === BOOKS & STORAGE ===
 INSERT INTO Books (ISBN, Title, Author, Genre, BookCondition, IsInStock, ShelfLocation, ShelfRow) VALUES
 ('978-0-452-28423-4', '1984', 'George Orwell', 'Dystopian', 'Good', TRUE, 'A1', 1),
@@ -238,4 +322,18 @@ UPDATE Books SET IsInStock = 0 WHERE ISBN IN (
 
 -- Decrement MaxLoans for friends who borrowed books
 UPDATE Friends SET MaxLoans = MaxLoans - 2 WHERE FriendID = 2; -- Bob Brown borrowed 2 books
-UPDATE Friends SET MaxLoans = MaxLoans - 1 WHERE FriendID IN (1, 3, 4, 5, 6); -- Others borrowed 1 book
\ No newline at end of file
+UPDATE Friends SET MaxLoans = MaxLoans - 1 WHERE FriendID IN (1, 3, 4, 5, 6); -- Others borrowed 1 book
+
+-- === LIBRARY STATS ===
+INSERT INTO LibraryStats (StatsID, TotalBooks, BorrowedBooks)
+SELECT 1, (SELECT COUNT(*) FROM Books), (SELECT COUNT(*) FROM Loans);
+
+-- === TABLE VERSIONS ===
+INSERT INTO TableVersions (TableName, Version) VALUES
+('Books', 0), ('Friends', 0), ('Loans', 0), ('Contacts', 0);
+
+-- === CIRCULATION ROLLUPS (the seed loans; see circulation_rollups.py) ===
+INSERT INTO BookDailyStats (Day, ISBN, Checkouts)
+SELECT DATE(BorrowDate), ISBN, COUNT(*) FROM Loans GROUP BY DATE(BorrowDate), ISBN;
+INSERT INTO FriendDailyStats (Day, FriendID, Checkouts)
+SELECT DATE(BorrowDate), FriendID, COUNT(*) FROM Loans GROUP BY DATE(BorrowDate), FriendID;
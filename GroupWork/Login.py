@@ -1,5 +1,6 @@
 import streamlit as st
 import library_connection
+import migrations
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Library Connection", page_icon="📚")
@@ -16,19 +17,32 @@ st.title("Database Connection Manager")
 if st.session_state.db_status == "Connected":
     st.switch_page("pages/02_Home.py")
 
-# --- Login Form ---
-st.info("Please enter your MySQL password to continue.")
-with st.form("db_login_form", clear_on_submit=True):
-    password_input = st.text_input("MySQL Password", type="password")
-    
-    submitted = st.form_submit_button("Connect")
-    if submitted:
-        engine, error = library_connection.connect_to_db(password_input)
+def finish_login(engine, error):
+    if engine:
+        # Bring an older database up to the current schema (no-op once applied)
+        try:
+            migrations.ensure_migrated(engine)
+        except Exception as e:
+            st.warning(f"Could not apply schema migrations: {e}")
+        library_connection.hold_engine(engine)
+        st.session_state.db_status = "Connected"
+        st.switch_page("pages/02_Home.py")
+    else:
+        st.error(error)
 
-        if engine:
-            st.session_state.engine = engine
-            st.session_state.db_status = "Connected"
-            st.switch_page("pages/02_Home.py")
-        else:
-            st.error(error)
-            
\ No newline at end of file
+# --- Login Form ---
+if library_connection.BACKEND == "sqlite":
+    # Embedded database: no server and no password, just the library file. Only
+    # the configured file (LIBRARY_SQLITE_PATH) is opened, never a path from the browser
+    st.info(f"This library uses a local database file: `{library_connection.SQLITE_PATH}`")
+    with st.form("db_open_form"):
+        if st.form_submit_button("Open Library"):
+            finish_login(*library_connection.connect_to_sqlite())
+else:
+    st.info("Please enter your MySQL password to continue.")
+    with st.form("db_login_form", clear_on_submit=True):
+        password_input = st.text_input("MySQL Password", type="password")
+        
+        submitted = st.form_submit_button("Connect")
+        if submitted:
+            finish_login(*library_connection.connect_to_db(password_input))
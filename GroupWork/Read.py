@@ -1,130 +1,372 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
 from sqlalchemy import text
-from datetime import datetime, timedelta
+import re
+from datetime import date
+import catalog_snapshot
+import change_feed
+import circulation_rollups
+import dialects
+import library_cache
+import profiler
+import reminder_queue
+import search_index
+from picker_index import PickerIndex
 
-def list_books():
+# --- Queries shared with the async data layer (async_read.py) ---
+LIBRARY_STATS_QUERY = text("""
+    SELECT S.TotalBooks, S.BorrowedBooks,
+           (SELECT COUNT(*) FROM Loans WHERE DueDate < :today) AS OverdueBooks
+    FROM LibraryStats S
+    WHERE S.StatsID = 1
+""")
+
+def _report_error(message, error):
+    """
+    Shows a failed read on the page, and keeps the empty result the caller
+    returns next out of library_cache. Outside a Streamlit script run
+    (prefetch worker threads, CLI tools, benchmarks) it re-raises instead,
+    so the caller sees the error rather than an empty result.
+    """
+    if get_script_run_ctx(suppress_warning=True) is None:
+        raise error
+    library_cache.skip_store()
+    st.error(f"{message}: {error}")
+
+def library_stats_params():
+    return {"today": date.today()}
+
+def library_stats_from_row(row):
+    """Turns a LIBRARY_STATS_QUERY row (a mapping or None) into the metrics dict."""
+    if row is None:
+        return {"total": 0, "borrowed": 0, "available": 0, "overdue": 0}
+    total, borrowed = int(row["TotalBooks"]), int(row["BorrowedBooks"])
+    return {"total": total, "borrowed": borrowed, "available": total - borrowed, "overdue": int(row["OverdueBooks"])}
+
+# All active loans, patched from the change log after a write instead of read
+# again; the view lives with the reminder queue, which is derived from it
+LOANS_VIEW = reminder_queue.LOANS_VIEW
+
+# The compact catalog form and its labels live with the shared snapshot that uses them
+book_labels = catalog_snapshot.book_labels
+friend_labels = catalog_snapshot.friend_labels
+compact_catalog = catalog_snapshot.compact_catalog
+
+def loan_labels(df):
+    return "Loan #" + df['LoanID'].astype(str) + ": '" + df['Title'] + "' to " + df['FName'] + " " + df['LName']
+
+@profiler.profiled
+def list_books(engine=None):
     """
     Retrieves all books from the database using the shared engine
     from the session state.
     """
     
-    # 1. Check for a connection and get the engine from session state
-    if "engine" not in st.session_state or st.session_state.engine is None:
+    # 1. Check for a connection: an explicit engine, else the one in session state
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Database connection not found. Please log in first.")
         return pd.DataFrame() # Return an empty DataFrame if not connected
 
-    engine = st.session_state.engine
-
-    # 2. Execute the query
-    query = "SELECT * FROM Books"
-    return pd.read_sql(query, engine)
+    # 2. Copy the shared snapshot (cheap: the string buffers are shared, see catalog_snapshot)
+    return catalog_snapshot.current(engine).books.copy()
 
-def list_loans():
+@profiler.profiled
+@library_cache.cached("Loans", "Books", "Friends")
+def list_loans(engine=None):
     """
     Retrieves all active loans from the database using the shared engine
     from the session state.
     """
 
-    # 1. Check for a connection and get the engine from session state
-    if "engine" not in st.session_state or st.session_state.engine is None:
+    # 1. Check for a connection: an explicit engine, else the one in session state
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Database connection not found. Please log in first.")
         return pd.DataFrame() # Return an empty DataFrame if not connected
 
-    engine = st.session_state.engine
+    # 2. The shared view, caught up with the changes logged since the last call
+    return LOANS_VIEW.current(engine)
 
-    # 2. Execute the query
-    query = """
-            SELECT LoanID, FriendID, FName, LName, BorrowDate, DueDate, ReturnReminder, Title, Loans.ISBN
-            FROM Loans
-            JOIN Books USING (ISBN)
-            JOIN Friends USING (FriendID)
-            """
-    return pd.read_sql(query, engine)
-
-def loan_exists(LoanID): # <-- Remove 'engine' from here
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+def get_changes_since(since, tables=None, engine=None):
+    """
+    Keys inserted ('I'), updated ('U') or deleted ('D') after a ChangeLog
+    sequence number, oldest first: Seq, TableName, RowKey, Op, ChangedAt.
+    `since` is one Seq for every table in `tables` (default: all logged
+    tables) or a {table: Seq} dict. Entries can commit out of Seq order, so
+    a poller should move its cursors with change_feed.advance, which only
+    passes entries once they have settled, and skip the Seqs it has applied.
+    Entries older than change_feed.RETENTION_HOURS have been pruned.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
+    cursors = since if isinstance(since, dict) else {table: since for table in tables or change_feed.TABLES}
+    try:
+        with engine.connect() as conn:
+            return dialects.parse_datetimes(change_feed.changes_since(conn, cursors), "ChangedAt")
+    except Exception as e:
+        _report_error("Error fetching changes", e)
+        return pd.DataFrame()
+
+@profiler.profiled
+@library_cache.cached("Loans")
+def loan_exists(LoanID, engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return False # Return False instead of an empty DataFrame
         
-    engine = st.session_state.engine
     query = "SELECT 1 FROM Loans WHERE LoanID = :LoanID LIMIT 1"
     with engine.connect() as conn:
         result = conn.execute(text(query), {"LoanID": LoanID}).fetchone()
         return result is not None
 
-def book_exists(isbn):
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Books")
+def book_exists(isbn, engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
     query = "SELECT 1 FROM Books WHERE ISBN = :isbn LIMIT 1"
     with engine.connect() as conn:
         return conn.execute(text(query), {"isbn": isbn}).fetchone() is not None
 
-def read_all_books():
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+def read_all_books(engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
-    return pd.read_sql("SELECT * FROM Books ORDER BY Title", engine)
+    return catalog_snapshot.current(engine).books.copy()
 
-def read_books():
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Books")
+def read_books(engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
-    return pd.read_sql(
-        "SELECT ISBN, Title, Author, Genre, IsInStock, BookCondition as 'Condition', CONCAT(ShelfLocation, ' ', ShelfRow) as Location FROM Books ORDER BY Title",
+    location = dialects.concat(engine.dialect.name, "ShelfLocation", "' '", "ShelfRow")
+    return compact_catalog(pd.read_sql(
+        f"SELECT ISBN, Title, Author, Genre, IsInStock, BookCondition as 'Condition', {location} as Location FROM Books ORDER BY Title",
         engine
-    )
+    ))
+
+# Above this many matches the grid shows "N+" instead of an exact total
+BOOK_COUNT_CAP = 10000
+
+def _book_filters(genre=None, in_stock=None, title_prefix=None):
+    """Builds the WHERE conditions shared by the paginated grid and its count."""
+    conditions, params = [], {}
+    if genre:
+        conditions.append("Genre = :genre")
+        params["genre"] = genre
+    if in_stock is not None:
+        conditions.append("IsInStock = :in_stock")
+        params["in_stock"] = 1 if in_stock else 0
+    if title_prefix:
+        conditions.append(dialects.like("Title", "title_prefix"))
+        params["title_prefix"] = dialects.like_prefix(title_prefix)
+    return conditions, params
+
+@profiler.profiled
+@library_cache.cached("Books")
+def list_genres(engine=None):
+    """Distinct genres for the filter dropdown."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return []
+    query = text("SELECT DISTINCT Genre FROM Books WHERE Genre IS NOT NULL ORDER BY Genre")
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(query)]
+
+@profiler.profiled
+@library_cache.cached("Books")
+def read_books_page(genre=None, in_stock=None, title_prefix=None, after=None, page_size=25, engine=None):
+    """
+    Returns one page of the catalog as (DataFrame, next_cursor).
+    Filters run in the WHERE clause and paging is keyset-based on (Title, ISBN):
+    pass the returned cursor as `after` to get the next page. next_cursor is
+    None on the last page.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame(), None
+
+    conditions, params = _book_filters(genre, in_stock, title_prefix)
+    if after is not None:
+        conditions.append("(Title > :after_title OR (Title = :after_title AND ISBN > :after_isbn))")
+        params["after_title"], params["after_isbn"] = after
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params["limit"] = page_size + 1  # One extra row tells us whether there is a next page
+    location = dialects.concat(engine.dialect.name, "ShelfLocation", "' '", "ShelfRow")
+
+    query = text(f"""
+        SELECT ISBN, Title, Author, Genre, IsInStock, BookCondition as 'Condition',
+               {location} as Location
+        FROM Books
+        {where}
+        ORDER BY Title, ISBN
+        LIMIT :limit
+    """)
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, params=params)
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (last["Title"], last["ISBN"])
+    return df, next_cursor
+
+@profiler.profiled
+@library_cache.cached("Books")
+def count_books_matching(genre=None, in_stock=None, title_prefix=None, engine=None):
+    """
+    Returns (count, is_exact) for the grid filters.
+    Without filters this is the maintained LibraryStats counter; with filters
+    the count stops at BOOK_COUNT_CAP so it never scans the whole table.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return 0, True
+
+    conditions, params = _book_filters(genre, in_stock, title_prefix)
+    with engine.connect() as conn:
+        if not conditions:
+            total = conn.execute(text("SELECT TotalBooks FROM LibraryStats WHERE StatsID = 1")).scalar()
+            return int(total or 0), True
+        params["cap"] = BOOK_COUNT_CAP + 1
+        query = text(f"""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM Books WHERE {' AND '.join(conditions)} LIMIT :cap
+            ) AS matches
+        """)
+        count = int(conn.execute(query, params).scalar())
+    if count > BOOK_COUNT_CAP:
+        return BOOK_COUNT_CAP, False
+    return count, True
+
+@profiler.profiled
+@library_cache.cached("Books")
+def search_catalog(search_text, limit=20, prefix=True, genre=None, in_stock=None, engine=None):
+    """
+    Relevance-ranked full-text search over Title, Author and Genre.
+    Every word must match; with prefix=True words also match as prefixes.
+    The optional genre/in_stock filters are the same as the catalog grid's.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
+
+    words = re.findall(r"\w+", search_text or "")
+    if not words:
+        return pd.DataFrame()
+    match = search_index.build_match_expression(engine.dialect.name, words, prefix)
+
+    conditions, params = _book_filters(genre, in_stock)
+    params.update({"match": match, "limit": limit})
+    extra = "".join(f" AND B.{condition}" for condition in conditions)
+    location = dialects.concat(engine.dialect.name, "B.ShelfLocation", "' '", "B.ShelfRow")
+
+    if engine.dialect.name == "sqlite":
+        query = text(f"""
+            SELECT B.ISBN, B.Title, B.Author, B.Genre, B.IsInStock, B.BookCondition as 'Condition',
+                   {location} as Location,
+                   -bm25(Books_fts) AS Relevance
+            FROM Books_fts
+            JOIN Books B ON B.rowid = Books_fts.rowid
+            WHERE Books_fts MATCH :match{extra}
+            ORDER BY bm25(Books_fts), B.Title
+            LIMIT :limit
+        """)
+    else:
+        query = text(f"""
+            SELECT B.ISBN, B.Title, B.Author, B.Genre, B.IsInStock, B.BookCondition as 'Condition',
+                   {location} as Location,
+                   MATCH(B.Title, B.Author, B.Genre) AGAINST (:match IN BOOLEAN MODE) AS Relevance
+            FROM Books B
+            WHERE MATCH(B.Title, B.Author, B.Genre) AGAINST (:match IN BOOLEAN MODE){extra}
+            ORDER BY Relevance DESC, B.Title
+            LIMIT :limit
+        """)
+    try:
+        with engine.connect() as connection:
+            return pd.read_sql(query, connection, params=params)
+    except Exception as e:
+        _report_error("Error searching the catalog", e)
+        return pd.DataFrame()
 
-def count_books():
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Books")
+def count_books(engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
     return pd.read_sql("SELECT COUNT(*) AS count FROM Books", engine)["count"][0]
 
-def count_borrowed_books():
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Loans")
+def count_borrowed_books(engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
     return pd.read_sql("SELECT COUNT(*) AS count FROM Loans", engine)["count"][0]
 
-def count_overdue_books():
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Loans", per_day=True)
+def count_overdue_books(engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
-    return pd.read_sql("SELECT COUNT(*) AS count FROM Loans WHERE DueDate < CURRENT_DATE", engine)["count"][0]
+    query = text("SELECT COUNT(*) AS count FROM Loans WHERE DueDate < :today")
+    return pd.read_sql(query, engine, params={"today": date.today()})["count"][0]
 
-def get_borrowed_isbns():
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Books", "Loans", per_day=True)
+def get_library_stats(engine=None):
+    """
+    Returns all Home page overview metrics in one round trip.
+    Totals come from the LibraryStats counters maintained by Write.py,
+    so the cost does not grow with the size of the catalog.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return None
+    with engine.connect() as conn:
+        row = conn.execute(LIBRARY_STATS_QUERY, library_stats_params()).mappings().fetchone()
+    return library_stats_from_row(row)
+
+@profiler.profiled
+@library_cache.cached("Loans")
+def get_borrowed_isbns(engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
     return pd.read_sql("SELECT ISBN FROM Loans", engine)["ISBN"].tolist()
 
-def get_friends():
-    """Fetches all friends from the database for the dropdown."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+def get_friends(engine=None):
+    """All friends with a display label for the dropdown, from the shared snapshot."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
-    
-    # ✅ Add MaxLoans to the SELECT statement
-    query = text("SELECT FriendID, FName, LName, MaxLoans FROM Friends ORDER BY FName, LName")
     
     try:
-        with engine.connect() as connection:
-            df = pd.read_sql(query, connection)
-            # Create a user-friendly display column
-            df['display'] = df['FName'] + ' ' + df['LName'] + ' (ID: ' + df['FriendID'].astype(str) + ')'
-            return df
+        return catalog_snapshot.current(engine).friends.copy()
     except Exception as e:
-        st.error(f"Error fetching friends: {e}")
+        _report_error("Error fetching friends", e)
         return pd.DataFrame()
 
-def get_all_friends():
-    # 1. Check for a connection and get the engine from session state
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Friends")
+def get_all_friends(engine=None):
+    # 1. Check for a connection: an explicit engine, else the one in session state
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Database connection not found. Please log in first.")
         return pd.DataFrame() # Return an empty DataFrame if not connected
 
-    engine = st.session_state.engine
     
     query = """
     SELECT DISTINCT f.FriendID, f.FName, f.LName, f.MaxLoans
@@ -134,50 +376,188 @@ def get_all_friends():
         result = conn.execute(text(query))
         return pd.DataFrame(result.fetchall(), columns=result.keys())
 
-def search_friends(name):
-    # 1. Check for a connection and get the engine from session state
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+@library_cache.cached("Friends", "Contacts")
+def search_friends(name, engine=None):
+    # 1. Check for a connection: an explicit engine, else the one in session state
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Database connection not found. Please log in first.")
         return pd.DataFrame() # Return an empty DataFrame if not connected
 
-    engine = st.session_state.engine
     
-    query = """
+    query = f"""
     SELECT f.FriendID, f.FName, f.LName, f.MaxLoans,
            c.type, c.contact
     FROM Friends f
     LEFT JOIN Contacts c ON f.FriendID = c.FriendID
-    WHERE f.FName LIKE :name OR f.LName LIKE :name;
+    WHERE {dialects.like("f.FName", "name")} OR {dialects.like("f.LName", "name")};
     """
     with engine.connect() as conn:
-        result = conn.execute(text(query), {"name": f"%{name}%"})
+        result = conn.execute(text(query), {"name": dialects.like_contains(name)})
         return pd.DataFrame(result.fetchall(), columns=result.keys())
 
-def get_books():
-    """Fetches available books from the database for the dropdown."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+def get_books(engine=None):
+    """Books in stock with a display label for the dropdown, from the shared snapshot."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
-    # Only show books that are currently in stock
-    query = text("SELECT ISBN, Title FROM Books WHERE IsInStock = 1 ORDER BY Title")
     try:
-        with engine.connect() as connection:
-            df = pd.read_sql(query, connection)
-            # Create a user-friendly display column
-            df['display'] = df['Title'] + ' (ISBN: ' + df['ISBN'] + ')'
-            return df
+        return catalog_snapshot.current(engine).available_books().copy()
     except Exception as e:
-        st.error(f"Error fetching available books: {e}")
+        _report_error("Error fetching available books", e)
+        return pd.DataFrame()
+
+# --- Typeahead lookups: the top matches for a typed prefix, one indexed query per keystroke ---
+TYPEAHEAD_LIMIT = 20
+
+@profiler.profiled
+@library_cache.cached("Friends")
+def lookup_friends(prefix="", limit=TYPEAHEAD_LIMIT, offset=0, engine=None):
+    """
+    Friends whose first or last name starts with the typed text, or with the
+    typed FriendID; "Ann Sm" matches first name Ann* and last name Sm*.
+    Returns `limit` rows from `offset` in friends-list order, with a display label.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
 
-def get_borrowed_books(friend_id):
+    words = (prefix or "").split()
+    params = {"limit": limit, "offset": offset}
+    if not words:
+        condition = "1 = 1"
+    elif len(words) == 1 and words[0].isdigit():
+        condition = "FriendID = :friend_id"
+        params["friend_id"] = int(words[0])
+    elif len(words) == 1:
+        condition = f"({dialects.like('FName', 'first')} OR {dialects.like('LName', 'first')})"
+        params["first"] = dialects.like_prefix(words[0])
+    else:
+        # Prefixes of both columns of ix_friends_name
+        condition = f"{dialects.like('FName', 'first')} AND {dialects.like('LName', 'last')}"
+        params["first"], params["last"] = dialects.like_prefix(words[0]), dialects.like_prefix(" ".join(words[1:]))
+
+    query = text(f"""
+        SELECT FriendID, FName, LName, MaxLoans
+        FROM Friends
+        WHERE {condition}
+        ORDER BY FName, LName, FriendID
+        LIMIT :limit OFFSET :offset
+    """)
+    try:
+        with engine.connect() as conn:
+            df = pd.read_sql(query, conn, params=params)
+    except Exception as e:
+        _report_error("Error looking up friends", e)
+        return pd.DataFrame()
+    df["display"] = friend_labels(df)
+    return df
+
+@profiler.profiled
+@library_cache.cached("Books")
+def lookup_books(prefix="", limit=TYPEAHEAD_LIMIT, offset=0, in_stock=True, engine=None):
+    """
+    Books whose title starts with the typed text, or whose ISBN does when it
+    is typed as one (with or without hyphens). in_stock=True limits it to
+    available books, None searches the whole catalog. Returns `limit` rows
+    from `offset` in catalog order, with a display label.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
+
+    prefix = (prefix or "").strip()
+    if re.fullmatch(r"\d[\d\-Xx]*", prefix):
+        # An ISBN (the ix_books_isbn_digits expression index) or a title like "1984"
+        conditions, params = _book_filters(in_stock=in_stock)
+        isbn_match = dialects.like("REPLACE(ISBN, '-', '')", "digits")
+        conditions.append(f"({isbn_match} OR {dialects.like('Title', 'title_prefix')})")
+        params["digits"] = dialects.like_prefix(re.sub(r"[^0-9X]", "", prefix.upper()))
+        params["title_prefix"] = dialects.like_prefix(prefix)
+    else:
+        conditions, params = _book_filters(in_stock=in_stock, title_prefix=prefix or None)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.update({"limit": limit, "offset": offset})
+
+    query = text(f"""
+        SELECT * FROM Books
+        {where}
+        ORDER BY Title, ISBN
+        LIMIT :limit OFFSET :offset
+    """)
+    try:
+        with engine.connect() as conn:
+            df = pd.read_sql(query, conn, params=params)
+    except Exception as e:
+        _report_error("Error looking up books", e)
+        return pd.DataFrame()
+    df["display"] = book_labels(df)
+    return df
+
+# --- Pickers: labels plus O(1) label -> key lookup, built once per data version ---
+
+@profiler.profiled
+def get_book_picker(engine=None):
+    """PickerIndex of the books in stock, keyed by ISBN."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return PickerIndex.empty("ISBN")
+    try:
+        return catalog_snapshot.current(engine).available_book_picker()
+    except Exception as e:
+        _report_error("Error fetching available books", e)
+        return PickerIndex.empty("ISBN")
+
+@profiler.profiled
+def get_catalog_picker(engine=None):
+    """PickerIndex of every book in the catalog, keyed by ISBN."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return PickerIndex.empty("ISBN")
+    try:
+        return catalog_snapshot.current(engine).book_picker()
+    except Exception as e:
+        _report_error("Error fetching books", e)
+        return PickerIndex.empty("ISBN")
+
+@profiler.profiled
+def get_friend_picker(engine=None):
+    """PickerIndex of all friends, keyed by FriendID."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return PickerIndex.empty("FriendID")
+    try:
+        return catalog_snapshot.current(engine).friend_picker()
+    except Exception as e:
+        _report_error("Error fetching friends", e)
+        return PickerIndex.empty("FriendID")
+
+@profiler.profiled
+@library_cache.cached("Loans", "Books", "Friends")
+def get_loan_picker(engine=None):
+    """PickerIndex of the active loans, keyed by LoanID; rows carry ISBN and FriendID."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return PickerIndex.empty("LoanID")
+    try:
+        loans = LOANS_VIEW.current(engine)
+        return PickerIndex(loans, loan_labels(loans) if len(loans) else [], "LoanID")
+    except Exception as e:
+        _report_error("Error fetching loans", e)
+        return PickerIndex.empty("LoanID")
+
+@profiler.profiled
+@library_cache.cached("Loans", "Books")
+def get_borrowed_books(friend_id, engine=None):
     """Fetches books borrowed by a specific friend."""
     if not friend_id:
         return pd.DataFrame()
 
-    if "engine" not in st.session_state or st.session_state.engine is None:
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
 
     # Only show books which are borrowed by a specific friend
     query = text("""
@@ -193,14 +573,16 @@ def get_borrowed_books(friend_id):
             df['display'] = df['Title'] + ' (ISBN: ' + df['ISBN'] + ')'
             return df
     except Exception as e:
-        st.error(f"Error fetching borrowed books: {e}")
+        _report_error("Error fetching borrowed books", e)
         return pd.DataFrame()
 
-def get_loan_friends():
+@profiler.profiled
+@library_cache.cached("Loans", "Friends")
+def get_loan_friends(engine=None):
     """Fetches unique friends who currently have loans."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
     query = text("SELECT DISTINCT FriendID, FName, LName FROM Loans JOIN Friends USING (FriendID) ORDER BY FName, LName")
     try:
         with engine.connect() as connection:
@@ -209,29 +591,191 @@ def get_loan_friends():
             df['display'] = df['FName'] + ' ' + df['LName'] + ' (ID: ' + df['FriendID'].astype(str) + ')'
             return df
     except Exception as e:
-        st.error(f"Error fetching friends: {e}")
+        _report_error("Error fetching friends", e)
         return pd.DataFrame()
         
-def get_loan_overdues():
-    """Fetches loans which are overdue."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+def get_loan_overdues(engine=None):
+    """Fetches loans which are overdue (from the precomputed reminder_queue)."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
+    return reminder_queue.overdue_loans(engine)
+
+# --- Loan history: returned loans, archived by Write._return_loans ---
+HISTORY_PAGE_SIZE = 100
+
+@profiler.profiled
+@library_cache.cached("LoanHistory", "Books", "Friends")
+def get_loan_history(start=None, end=None, friend_id=None, isbn=None, before=None, page_size=HISTORY_PAGE_SIZE,
+                     engine=None):
+    """
+    Returns one page of returned loans, newest return first, as (DataFrame, next_cursor).
+    start/end bound the return date (end exclusive; dates or datetimes).
+    The bound is a range on LoanHistory's leading key column, so MySQL only
+    reads the yearly partitions it covers. Paging is keyset-based on
+    (ReturnDate, LoanID): pass the returned cursor as `before` to get older
+    returns. next_cursor is None on the last page.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame(), None
+
+    conditions, params = [], {"limit": page_size + 1}  # One extra row tells us whether there is a next page
+    if start is not None:
+        conditions.append("H.ReturnDate >= :start")
+        params["start"] = start
+    if end is not None:
+        conditions.append("H.ReturnDate < :end")
+        params["end"] = end
+    if friend_id is not None:
+        conditions.append("H.FriendID = :friend_id")
+        params["friend_id"] = friend_id
+    if isbn is not None:
+        conditions.append("H.ISBN = :isbn")
+        params["isbn"] = isbn
+    if before is not None:
+        conditions.append("(H.ReturnDate < :before_date OR (H.ReturnDate = :before_date AND H.LoanID < :before_id))")
+        params["before_date"], params["before_id"] = pd.Timestamp(before[0]).to_pydatetime(), int(before[1])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # Books and friends may have been deleted since; their history stays
+    query = text(f"""
+        SELECT H.LoanID, H.FriendID, F.FName, F.LName, H.BorrowDate, H.DueDate, H.ReturnDate, B.Title, H.ISBN
+        FROM LoanHistory H
+        LEFT JOIN Books B ON B.ISBN = H.ISBN
+        LEFT JOIN Friends F ON F.FriendID = H.FriendID
+        {where}
+        ORDER BY H.ReturnDate DESC, H.LoanID DESC
+        LIMIT :limit
+    """)
+    try:
+        with engine.connect() as connection:
+            df = pd.read_sql(query, connection, params=params)
+    except Exception as e:
+        _report_error("Error fetching loan history", e)
+        return pd.DataFrame(), None
+    dialects.parse_datetimes(df, "BorrowDate", "DueDate", "ReturnDate")
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (last["ReturnDate"], int(last["LoanID"]))
+    return df, next_cursor
+
+# --- Circulation analytics: sums over the daily rollups (circulation_rollups), never over the loans ---
+# Every query reads the rollup rows of the days in [start, end), so its cost follows the range shown
+
+def _day_range(start, end):
+    return {"start": circulation_rollups.day_key(start), "end": circulation_rollups.day_key(end)}
+
+@profiler.profiled
+@library_cache.cached("CirculationStats")
+def get_daily_circulation(start, end, engine=None):
+    """Checkouts, returns, loan days and late returns per day, over all books."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
+    query = text("""
+        SELECT Day, SUM(Checkouts) AS Checkouts, SUM(Returned) AS Returned,
+               SUM(LoanDays) AS LoanDays, SUM(LateReturns) AS LateReturns
+        FROM BookDailyStats
+        WHERE Day >= :start AND Day < :end
+        GROUP BY Day
+        ORDER BY Day
+    """)
+    try:
+        with engine.connect() as connection:
+            df = pd.read_sql(query, connection, params=_day_range(start, end))
+    except Exception as e:
+        _report_error("Error fetching circulation", e)
+        return pd.DataFrame()
+    df["Day"] = pd.to_datetime(df["Day"].astype(str))
+    return df
+
+@profiler.profiled
+@library_cache.cached("CirculationStats", "Books")
+def get_top_books(start, end, limit=10, engine=None):
+    """The most-borrowed books of the period."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
+    query = text("""
+        SELECT S.ISBN, B.Title, B.Author, SUM(S.Checkouts) AS Checkouts
+        FROM BookDailyStats S
+        LEFT JOIN Books B ON B.ISBN = S.ISBN
+        WHERE S.Day >= :start AND S.Day < :end
+        GROUP BY S.ISBN, B.Title, B.Author
+        HAVING SUM(S.Checkouts) > 0
+        ORDER BY Checkouts DESC, S.ISBN
+        LIMIT :limit
+    """)
+    try:
+        with engine.connect() as connection:
+            return pd.read_sql(query, connection, params={**_day_range(start, end), "limit": limit})
+    except Exception as e:
+        _report_error("Error fetching the most-borrowed books", e)
+        return pd.DataFrame()
+
+CIRCULATION_GROUPS = ("Genre", "ShelfLocation")
+
+@profiler.profiled
+@library_cache.cached("CirculationStats", "Books")
+def get_circulation_by(column, start, end, engine=None):
+    """Checkouts and returns of the period per Genre or ShelfLocation of the books."""
+    if column not in CIRCULATION_GROUPS:
+        raise ValueError(f"Can't group circulation by {column!r}")
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
+    query = text(f"""
+        SELECT B.{column}, SUM(S.Checkouts) AS Checkouts, SUM(S.Returned) AS Returned
+        FROM BookDailyStats S
+        JOIN Books B ON B.ISBN = S.ISBN
+        WHERE S.Day >= :start AND S.Day < :end
+        GROUP BY B.{column}
+        ORDER BY Checkouts DESC
+    """)
+    try:
+        with engine.connect() as connection:
+            return pd.read_sql(query, connection, params=_day_range(start, end))
+    except Exception as e:
+        _report_error(f"Error fetching circulation by {column}", e)
+        return pd.DataFrame()
+
+@profiler.profiled
+@library_cache.cached("CirculationStats", "Friends")
+def get_friend_overdue_rates(start, end, limit=20, engine=None):
+    """Friends by their share of late returns in the period (LateRate), highest first."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
     query = text("""
-            SELECT DISTINCT LoanID, DueDate, FriendID, FName, LName, Title, Loans.ISBN 
-            FROM Loans
-            JOIN Books USING (ISBN)
-            JOIN Friends USING (FriendID)
-            JOIN Contacts USING (FriendID)
-            WHERE DueDate < Now()
-            """)
-    return pd.read_sql(query, engine)
-
-def get_friend_contact_info(friend_id):
+        SELECT S.FriendID, F.FName, F.LName, SUM(S.Returned) AS Returned, SUM(S.LateReturns) AS LateReturns,
+               SUM(S.LateReturns) * 1.0 / SUM(S.Returned) AS LateRate
+        FROM FriendDailyStats S
+        LEFT JOIN Friends F ON F.FriendID = S.FriendID
+        WHERE S.Day >= :start AND S.Day < :end
+        GROUP BY S.FriendID, F.FName, F.LName
+        HAVING SUM(S.Returned) > 0
+        ORDER BY LateRate DESC, Returned DESC, S.FriendID
+        LIMIT :limit
+    """)
+    try:
+        with engine.connect() as connection:
+            return pd.read_sql(query, connection, params={**_day_range(start, end), "limit": limit})
+    except Exception as e:
+        _report_error("Error fetching overdue rates", e)
+        return pd.DataFrame()
+
+@profiler.profiled
+@library_cache.cached("Contacts")
+def get_friend_contact_info(friend_id, engine=None):
     """Fetches all contact details for a specific friend."""
-    if not friend_id or "engine" not in st.session_state or st.session_state.engine is None:
+    engine = engine or st.session_state.get("engine")
+    if not friend_id or engine is None:
         return pd.DataFrame()
-    engine = st.session_state.engine
     # ✅ Also select the ContactID
     query = text("SELECT ContactID, type, contact FROM Contacts WHERE FriendID = :friend_id")
     try:
@@ -239,14 +783,16 @@ def get_friend_contact_info(friend_id):
             df = pd.read_sql(query, connection, params={"friend_id": friend_id})
             return df
     except Exception as e:
-        st.error(f"Error fetching contact info: {e}")
+        _report_error("Error fetching contact info", e)
         return pd.DataFrame()
 
-def get_friend_max_loans(friend_id):
+@profiler.profiled
+@library_cache.cached("Friends")
+def get_friend_max_loans(friend_id, engine=None):
     """Fetches the MaxLoans value for a single friend."""
-    if not friend_id or "engine" not in st.session_state or st.session_state.engine is None:
+    engine = engine or st.session_state.get("engine")
+    if not friend_id or engine is None:
         return None  # Return None if no friend is selected or not connected
-    engine = st.session_state.engine
     query = text("SELECT MaxLoans FROM Friends WHERE FriendID = :friend_id")
     try:
         with engine.connect() as connection:
@@ -255,27 +801,16 @@ def get_friend_max_loans(friend_id):
                 return result["MaxLoans"].iloc[0]
             return None
     except Exception:
+        library_cache.skip_store()
         return None
 
-def get_daily_reminders():
-    # ... (connection check) ...
-    engine = st.session_state.engine
-    query = text("""
-        SELECT 
-            L.LoanID, -- ✅ Add this line
-            L.DueDate, 
-            F.FriendID, F.FName, F.LName, 
-            B.Title,
-            C.type, C.contact
-        FROM Loans L
-        JOIN Friends F ON L.FriendID = F.FriendID
-        JOIN Books B ON L.ISBN = B.ISBN
-        JOIN Contacts C ON L.FriendID = C.FriendID
-        WHERE DATE(L.ReturnReminder) = CURDATE()
-    """)
+@profiler.profiled
+def get_daily_reminders(engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return pd.DataFrame()
     try:
-        with engine.connect() as connection:
-            return pd.read_sql(query, connection)
+        return reminder_queue.daily_reminders(engine)
     except Exception as e:
-        st.error(f"Error fetching reminders: {e}")
+        _report_error("Error fetching reminders", e)
         return pd.DataFrame()
\ No newline at end of file
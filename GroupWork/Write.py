@@ -1,13 +1,68 @@
+import os
+import random
+import re
+import time
+from datetime import datetime
 import streamlit as st
 import pandas as pd
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError
+import circulation_rollups
+import dialects
+import library_cache
+import profiler
 
-def create_book(isbn, title, author, genre, book_condition, shelf_location, shelf_row, is_in_stock=1):
-    if "engine" not in st.session_state or st.session_state.engine is None:
+# How often a transaction that lost a lock race (deadlock, lock timeout) is run again
+TRANSACTION_RETRIES = int(os.environ.get("LIBRARY_TRANSACTION_RETRIES", 5))
+RETRY_BACKOFF = float(os.environ.get("LIBRARY_RETRY_BACKOFF", 0.01))  # seconds, doubled per retry
+
+# Keeps the LibraryStats counters in step with Books/Loans (see Read.get_library_stats)
+update_stats_query = text("""
+    UPDATE LibraryStats
+    SET TotalBooks = TotalBooks + :books, BorrowedBooks = BorrowedBooks + :borrowed
+    WHERE StatsID = 1
+""")
+
+# One ChangeLog row per changed key; change_feed reads them back to patch cached views
+log_changes_query = text("""
+    INSERT INTO ChangeLog (TableName, RowKey, Op, ChangedAt) VALUES (:table, :key, :op, :changed_at)
+""")
+
+def record_changes(conn, *changes):
+    """
+    Logs every key of the (table, op, keys) changes of the caller's
+    transaction in ChangeLog, op being 'I', 'U' or 'D'. Call it last, just
+    before the commit: change_feed trusts an entry to be committed within
+    SETTLE_SECONDS of being logged. Nothing here is locked until commit, so
+    concurrent writes to the same table don't queue on the log.
+    """
+    changed_at = datetime.now()
+    rows = [{"table": table, "op": op, "key": str(key), "changed_at": changed_at}
+            for table, op, keys in changes for key in dict.fromkeys(keys)]
+    if rows:
+        conn.execute(log_changes_query, rows)
+
+def run_transaction(engine, work):
+    """
+    Runs work(conn) in a transaction and returns its result. A deadlock or
+    lock timeout rolls the whole transaction back, so it is run again from
+    the start, after a short randomized pause, up to TRANSACTION_RETRIES times.
+    """
+    for attempt in range(TRANSACTION_RETRIES + 1):
+        try:
+            with engine.begin() as conn:
+                return work(conn)
+        except OperationalError as e:
+            if attempt == TRANSACTION_RETRIES or not dialects.is_retryable(e):
+                raise
+        time.sleep(RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+@profiler.profiled
+def create_book(isbn, title, author, genre, book_condition, shelf_location, shelf_row, is_in_stock=1, engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Not connected to the database.")
         return False
-        
-    engine = st.session_state.engine
     query = text("""
         INSERT INTO Books (ISBN, Title, Author, Genre, BookCondition, IsInStock, ShelfLocation, ShelfRow)
         VALUES (:isbn, :title, :author, :genre, :book_condition, :is_in_stock, :shelf_location, :shelf_row)
@@ -19,17 +74,20 @@ def create_book(isbn, title, author, genre, book_condition, shelf_location, shel
                 "book_condition": book_condition, "is_in_stock": is_in_stock,
                 "shelf_location": shelf_location, "shelf_row": shelf_row
             })
+            conn.execute(update_stats_query, {"books": 1, "borrowed": 0})
+            record_changes(conn, ("Books", "I", [isbn]))
+        library_cache.invalidate("Books")
         return True  # ✅ Add this line to confirm success
     except Exception as e:
         st.error(f"Failed to create book: {e}")
         return False
 
-def update_book(isbn, title, author, genre, book_condition, shelf_location, shelf_row):
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+def update_book(isbn, title, author, genre, book_condition, shelf_location, shelf_row, engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Not connected to the database.")
         return False
-        
-    engine = st.session_state.engine
     query = """
         UPDATE Books
         SET Title = :title,
@@ -50,114 +108,277 @@ def update_book(isbn, title, author, genre, book_condition, shelf_location, shel
             "shelf_location": shelf_location,
             "shelf_row": shelf_row
         })
+        record_changes(conn, ("Books", "U", [isbn]))
+    library_cache.invalidate("Books")
+    return True
 
-def delete_book(isbn):
-    if "engine" not in st.session_state or st.session_state.engine is None:
+@profiler.profiled
+def delete_book(isbn, engine=None):
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Not connected to the database.")
         return False
-        
-    engine = st.session_state.engine
     delete_query = "DELETE FROM Books WHERE ISBN = :isbn"
     with engine.begin() as conn:
-        conn.execute(text(delete_query), {"isbn": isbn})
+        result = conn.execute(text(delete_query), {"isbn": isbn})
+        conn.execute(update_stats_query, {"books": -result.rowcount, "borrowed": 0})
+        record_changes(conn, ("Books", "D", [isbn]))
+    library_cache.invalidate("Books")
+    return True
 
-def create_loan_entry(borrow_date, due_date, return_reminder, isbn, friend_id):
-    """Inserts a new loan and updates the book's stock status within a transaction."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
-        st.error("Not connected to the database.")
-        return False
-        
-    engine = st.session_state.engine
-    
-    insert_loan_query = text("""
-        INSERT INTO Loans (BorrowDate, DueDate, ReturnReminder, ISBN, FriendID)
-        VALUES (:borrow_date, :due_date, :return_reminder, :isbn, :friend_id)
-    """)
-    update_book_status_query = text("UPDATE Books SET IsInStock = 0 WHERE ISBN = :isbn")
-    update_friend_loans_query = text("UPDATE Friends SET MaxLoans = (MaxLoans - 1) WHERE FriendID = :friend_id")
-    
-    loan_data = {
+# --- Checkouts: every checkout path goes through lend_books ---
+# The guards are the UPDATEs themselves: a friend's quota is only taken while
+# it lasts and a book only while it is in stock, so two desks lending the
+# same book (or a friend's last loan) can't both succeed. The rows they
+# touch stay locked until commit, always Friends before Books, as in
+# _return_loans, so concurrent checkouts and returns queue rather than deadlock.
+take_quota_query = text("""
+    UPDATE Friends SET MaxLoans = MaxLoans - :count
+    WHERE FriendID = :friend_id AND (MaxLoans IS NULL OR MaxLoans >= :count)
+""")
+take_books_query = text("""
+    UPDATE Books SET IsInStock = 0 WHERE ISBN IN :isbns AND IsInStock = 1
+""").bindparams(bindparam("isbns", expanding=True))
+insert_loans_query = text("""
+    INSERT INTO Loans (BorrowDate, DueDate, ReturnReminder, ISBN, FriendID)
+    SELECT :borrow_date, :due_date, :return_reminder, ISBN, :friend_id
+    FROM Books
+    WHERE ISBN IN :isbns
+""").bindparams(bindparam("isbns", expanding=True))
+# A book has at most one active loan, so this finds exactly the loans just inserted
+new_loans_query = text("SELECT LoanID FROM Loans WHERE FriendID = :friend_id AND ISBN IN :isbns").bindparams(
+    bindparam("isbns", expanding=True)
+)
+friend_quota_query = text("SELECT MaxLoans FROM Friends WHERE FriendID = :friend_id")
+lent_books_query = text("SELECT ISBN FROM Loans WHERE ISBN IN :isbns").bindparams(
+    bindparam("isbns", expanding=True)
+)
+
+def lend_books(conn, friend_id, isbns, borrow_date, due_date, return_reminder):
+    """
+    Lends the books to the friend inside the caller's transaction (see
+    run_transaction) and returns the new LoanIDs. Raises ValueError, with
+    the reason, when the friend has too few loans left or a book is not in
+    stock; the caller then rolls back.
+    """
+    params = {
+        "isbns": list(isbns),
+        "count": len(isbns),
+        "friend_id": friend_id,
         "borrow_date": borrow_date,
         "due_date": due_date,
         "return_reminder": return_reminder,
-        "isbn": isbn,
-        "friend_id": friend_id
     }
+    if conn.execute(take_quota_query, params).rowcount != 1:
+        max_loans = conn.execute(friend_quota_query, params).scalar()
+        if max_loans is None:
+            raise ValueError("Friend not found.")
+        if max_loans <= 0:
+            raise ValueError("Max Amount Of Loans Was Reached for this friend.")
+        raise ValueError(f"This friend can borrow {max_loans} more book(s), not {len(isbns)}.")
+    if conn.execute(take_books_query, params).rowcount != len(isbns):
+        lent = {row[0] for row in conn.execute(lent_books_query, params)}
+        missing = [isbn for isbn in isbns if isbn in lent]
+        raise ValueError(f"Not in stock: {', '.join(missing)}." if missing else "Not all of these books are in stock.")
 
-    with engine.connect() as conn:
-        transaction = conn.begin()
-        try:
-            conn.execute(insert_loan_query, loan_data)
-            conn.execute(update_book_status_query, loan_data)
-            conn.execute(update_friend_loans_query, loan_data)
-            # Commit the transaction if both operations succeed
-            transaction.commit()
-            return True
-        except Exception as e:
-            # Roll back the transaction if any error occurs
-            transaction.rollback()
-            st.error(f"Failed to create loan: {e}")
-            return False
-
-def return_book(isbn, friend_id):
-    """ Friend returns book. Update book's stock status & delete the loan."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
+    conn.execute(insert_loans_query, params)
+    conn.execute(update_stats_query, {"books": 0, "borrowed": len(isbns)})
+    circulation_rollups.record_checkouts(conn, friend_id, isbns, borrow_date)
+    loan_ids = [row[0] for row in conn.execute(new_loans_query, params)]
+    record_changes(conn, ("Loans", "I", loan_ids), ("Books", "U", isbns), ("Friends", "U", [friend_id]))
+    return loan_ids
+
+@profiler.profiled
+def create_loan_entry(borrow_date, due_date, return_reminder, isbn, friend_id, engine=None):
+    """Lends one book: the loan, the book's stock and the friend's quota change together or not at all."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Not connected to the database.")
         return False
-        
-    engine = st.session_state.engine
+    try:
+        run_transaction(engine, lambda conn: lend_books(conn, friend_id, [isbn], borrow_date, due_date, return_reminder))
+    except Exception as e:
+        st.error(f"Failed to create loan: {e}")
+        return False
+    library_cache.invalidate("Loans", "Books", "Friends", "CirculationStats")
+    return True
 
-    delete_loan_query = text("""
-        DELETE FROM Loans
-        WHERE ISBN = :isbn AND FriendID = :friend_id
-    """)
+@profiler.profiled
+def checkout_books(friend_id, isbns, borrow_date, due_date, return_reminder, engine=None):
+    """
+    Lends several books to one friend in a single transaction: one
+    conditional UPDATE takes the friend's quota, one takes the books off the
+    shelf and one INSERT ... SELECT adds the loans. Nothing is written if
+    either guard fails.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        st.error("Not connected to the database.")
+        return False
+    isbns = list(dict.fromkeys(isbns))  # Drop duplicates, keep the order
+    if not isbns:
+        st.error("Please select at least one book.")
+        return False
+    try:
+        run_transaction(engine, lambda conn: lend_books(conn, friend_id, isbns, borrow_date, due_date, return_reminder))
+    except Exception as e:
+        st.error(f"Failed to check out books: {e}")
+        return False
+    library_cache.invalidate("Loans", "Books", "Friends", "CirculationStats")
+    return True
 
-    update_book_status_query = text("UPDATE Books SET IsInStock = 1 WHERE ISBN = :isbn")
-    
-    update_loan_status_friend_query = text("UPDATE Friends SET MaxLoans = (MaxLoans + 1)  WHERE FriendID = :friend_id")
+# --- Returns: every return path goes through _return_loans ---
+restore_friend_loans_query = text("""
+    UPDATE Friends
+    SET MaxLoans = MaxLoans + (
+        SELECT COUNT(*) FROM Loans L WHERE L.FriendID = Friends.FriendID AND L.LoanID IN :loan_ids
+    )
+    WHERE FriendID IN (SELECT FriendID FROM Loans WHERE LoanID IN :loan_ids)
+""").bindparams(bindparam("loan_ids", expanding=True))
+restock_books_query = text("""
+    UPDATE Books SET IsInStock = 1
+    WHERE ISBN IN (SELECT ISBN FROM Loans WHERE LoanID IN :loan_ids)
+""").bindparams(bindparam("loan_ids", expanding=True))
+# Returned loans are kept in LoanHistory, stamped with the return date
+archive_loans_query = text("""
+    INSERT INTO LoanHistory (LoanID, BorrowDate, DueDate, ReturnDate, ISBN, FriendID)
+    SELECT LoanID, BorrowDate, DueDate, :returned_at, ISBN, FriendID FROM Loans WHERE LoanID IN :loan_ids
+""").bindparams(bindparam("loan_ids", expanding=True))
+delete_loans_query = text("DELETE FROM Loans WHERE LoanID IN :loan_ids").bindparams(
+    bindparam("loan_ids", expanding=True)
+)
+returned_loans_query = text("SELECT ISBN, FriendID, BorrowDate, DueDate FROM Loans WHERE LoanID IN :loan_ids").bindparams(
+    bindparam("loan_ids", expanding=True)
+)
 
+def _return_loans(conn, loan_ids):
+    """
+    Closes the given loans with set-based statements inside the caller's
+    transaction: they move from Loans to LoanHistory, so Loans only ever
+    holds active loans.
+    """
+    if not loan_ids:
+        return 0
+    params = {"loan_ids": list(loan_ids), "returned_at": datetime.now()}
+    returned = conn.execute(returned_loans_query, params).fetchall()
+    # Friends, Books and the history are written from the loan rows, so they go before the DELETE
+    conn.execute(restore_friend_loans_query, params)
+    conn.execute(restock_books_query, params)
+    conn.execute(archive_loans_query, params)
+    result = conn.execute(delete_loans_query, params)
+    conn.execute(update_stats_query, {"books": 0, "borrowed": -result.rowcount})
+    circulation_rollups.record_returns(conn, returned, params["returned_at"])
+    record_changes(conn, ("Loans", "D", params["loan_ids"]),
+                   ("Books", "U", [row.ISBN for row in returned]),
+                   ("Friends", "U", [row.FriendID for row in returned]))
+    return result.rowcount
+
+@profiler.profiled
+def return_book(isbn, friend_id, engine=None):
+    """ Friend returns book. Update book's stock status & delete the loan."""
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        st.error("Not connected to the database.")
+        return False
+
+    find_loans_query = text("SELECT LoanID FROM Loans WHERE ISBN = :isbn AND FriendID = :friend_id")
     params = {"isbn": isbn, "friend_id": friend_id}
     
-    with engine.connect() as conn:
-        transaction = conn.begin()
-        try:
-            # Delete the selected loan record
-            conn.execute(delete_loan_query, params)
-            # Update the book's stock status to be available
-            conn.execute(update_book_status_query, params)
-            # Commit the transaction if both operations succeed
-            conn.execute(update_loan_status_friend_query, params)
-            # Commit the transaction if both operations succeed
-            transaction.commit()
-            return True
-        except Exception as e:
-            # Roll back the transaction if any error occurs
-            transaction.rollback()
-            st.error(f"Failed to process return: {e}")
-            return False
+    def work(conn):
+        loan_ids = [row[0] for row in conn.execute(find_loans_query, params)]
+        # Delete the loan, restock the book and give the friend their loan back
+        _return_loans(conn, loan_ids)
+
+    try:
+        run_transaction(engine, work)
+    except Exception as e:
+        st.error(f"Failed to process return: {e}")
+        return False
+    library_cache.invalidate("Loans", "Books", "Friends", "LoanHistory", "CirculationStats")
+    return True
+
+@profiler.profiled
+def return_books(scanned_isbns, engine=None):
+    """
+    Processes a batch of scanned returns in one transaction.
+    ISBNs match with or without hyphens. Returns a list of dicts with ISBN,
+    Title, Friend and Status for every scan, in scan order, or None if the
+    batch could not be committed.
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        st.error("Not connected to the database.")
+        return None
+
+    digits = [re.sub(r"[^0-9X]", "", isbn.upper()) for isbn in scanned_isbns]
+    # Matches the ix_books_isbn_digits expression index
+    find_loans_query = text("""
+        SELECT L.LoanID, REPLACE(B.ISBN, '-', '') AS Digits, B.ISBN, B.Title, F.FName, F.LName
+        FROM Books B
+        JOIN Loans L ON L.ISBN = B.ISBN
+        JOIN Friends F ON F.FriendID = L.FriendID
+        WHERE REPLACE(B.ISBN, '-', '') IN :digits
+    """).bindparams(bindparam("digits", expanding=True))
+
+    def work(conn):
+        loans = {}
+        for row in conn.execute(find_loans_query, {"digits": list(set(digits)) or [""]}).mappings():
+            loans.setdefault(row["Digits"], row)
+        _return_loans(conn, [row["LoanID"] for row in loans.values()])
+        return loans
+
+    try:
+        loans = run_transaction(engine, work)
+    except Exception as e:
+        st.error(f"Failed to process returns: {e}")
+        return None
+    library_cache.invalidate("Loans", "Books", "Friends", "LoanHistory", "CirculationStats")
+
+    results, seen = [], set()
+    for scanned, key in zip(scanned_isbns, digits):
+        loan = loans.get(key)
+        if key in seen:
+            status = "Duplicate scan"
+        elif loan is None:
+            status = "No active loan"
+        else:
+            status = "Returned"
+        seen.add(key)
+        results.append({
+            "ISBN": loan["ISBN"] if loan else scanned,
+            "Title": loan["Title"] if loan else None,
+            "Friend": f"{loan['FName']} {loan['LName']}" if loan else None,
+            "Status": status,
+        })
+    return results
             
-def create_friend(fname, lname, max_loans):
+@profiler.profiled
+def create_friend(fname, lname, max_loans, engine=None):
     """Inserts a new friend into the database."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Not connected to the database.")
         return False
-    engine = st.session_state.engine
     query = text("""
         INSERT INTO Friends (FName, LName, MaxLoans)
         VALUES (:fname, :lname, :max_loans)
     """)
     try:
         with engine.begin() as conn:
-            conn.execute(query, {"fname": fname, "lname": lname, "max_loans": max_loans})
+            result = conn.execute(query, {"fname": fname, "lname": lname, "max_loans": max_loans})
+            record_changes(conn, ("Friends", "I", [result.lastrowid]))
+        library_cache.invalidate("Friends")
         return True
     except Exception as e:
         st.error(f"Failed to create friend: {e}")
         return False
 
-def add_friend_with_contacts(fname, lname, max_loans, contacts):
+@profiler.profiled
+def add_friend_with_contacts(fname, lname, max_loans, contacts, engine=None):
     """Creates a friend and their contact info in a single transaction."""
-    if "engine" not in st.session_state or st.session_state.engine is None: return False
-    engine = st.session_state.engine
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return False
     
     insert_friend_query = text("INSERT INTO Friends (FName, LName, MaxLoans) VALUES (:fname, :lname, :max_loans)")
     insert_contact_query = text("INSERT INTO Contacts (FriendID, type, contact) VALUES (:friend_id, :type, :contact)")
@@ -168,86 +389,132 @@ def add_friend_with_contacts(fname, lname, max_loans, contacts):
             friend_id = result.lastrowid
             # Add only contacts that have both a type and info
             valid_contacts = [c for c in contacts if c['type'].strip() and c['contact'].strip()]
+            contact_ids = []
             if valid_contacts:
                 for contact in valid_contacts:
-                    conn.execute(insert_contact_query, {"friend_id": friend_id, "type": contact['type'], "contact": contact['contact']})
+                    result = conn.execute(insert_contact_query, {"friend_id": friend_id, "type": contact['type'], "contact": contact['contact']})
+                    contact_ids.append(result.lastrowid)
+            record_changes(conn, ("Friends", "I", [friend_id]), ("Contacts", "I", contact_ids))
+        library_cache.invalidate("Friends", "Contacts")
         return True
     except Exception as e:
         st.error(f"Failed to add friend: {e}")
         return False
 
 
-def update_friend(friend_id, fname, lname, max_loans):
+@profiler.profiled
+def update_friend(friend_id, fname, lname, max_loans, engine=None):
     """Updates a friend's main details."""
-    if "engine" not in st.session_state or st.session_state.engine is None: return False
-    engine = st.session_state.engine
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return False
     query = text("UPDATE Friends SET FName = :fname, LName = :lname, MaxLoans = :max_loans WHERE FriendID = :friend_id")
     try:
         with engine.begin() as conn:
             conn.execute(query, {"friend_id": friend_id, "fname": fname, "lname": lname, "max_loans": max_loans})
+            record_changes(conn, ("Friends", "U", [friend_id]))
+        library_cache.invalidate("Friends")
         return True
     except Exception as e:
         st.error(f"Failed to update friend: {e}")
         return False
 
-def add_contact_to_friend(friend_id, contact_type, contact_info):
+@profiler.profiled
+def add_contact_to_friend(friend_id, contact_type, contact_info, engine=None):
     """Adds a new contact to an existing friend."""
-    if "engine" not in st.session_state or st.session_state.engine is None: return False
-    engine = st.session_state.engine
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return False
     query = text("INSERT INTO Contacts (FriendID, type, contact) VALUES (:friend_id, :type, :contact)")
     try:
         with engine.begin() as conn:
-            conn.execute(query, {"friend_id": friend_id, "type": contact_type, "contact": contact_info})
+            result = conn.execute(query, {"friend_id": friend_id, "type": contact_type, "contact": contact_info})
+            record_changes(conn, ("Contacts", "I", [result.lastrowid]))
+        library_cache.invalidate("Contacts")
         return True
     except Exception as e:
         st.error(f"Failed to add contact: {e}")
         return False
 
-def delete_contact(contact_id):
+@profiler.profiled
+def delete_contact(contact_id, engine=None):
     """Deletes a single contact entry."""
-    if "engine" not in st.session_state or st.session_state.engine is None: return False
-    engine = st.session_state.engine
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return False
     query = text("DELETE FROM Contacts WHERE ContactID = :contact_id")
     try:
         with engine.begin() as conn:
             conn.execute(query, {"contact_id": contact_id})
+            record_changes(conn, ("Contacts", "D", [contact_id]))
+        library_cache.invalidate("Contacts")
         return True
     except Exception as e:
         st.error(f"Failed to delete contact: {e}")
         return False
 
-def delete_friend(friend_id):
+@profiler.profiled
+def delete_friend(friend_id, engine=None):
     """Deletes a friend and their associated contacts and loans."""
-    if "engine" not in st.session_state or st.session_state.engine is None: return False
-    engine = st.session_state.engine
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
+        return False
     
     # You MUST delete from child tables (Contacts, Loans) before the parent table (Friends)
     # unless you have ON DELETE CASCADE set up in your database.
     delete_contacts_query = text("DELETE FROM Contacts WHERE FriendID = :friend_id")
     delete_loans_query = text("DELETE FROM Loans WHERE FriendID = :friend_id")
     delete_friend_query = text("DELETE FROM Friends WHERE FriendID = :friend_id")
+    # The child rows' keys, read first for the change log
+    contact_ids_query = text("SELECT ContactID FROM Contacts WHERE FriendID = :friend_id")
+    loan_ids_query = text("SELECT LoanID FROM Loans WHERE FriendID = :friend_id")
     
     try:
         with engine.begin() as conn:
+            contact_ids = [row[0] for row in conn.execute(contact_ids_query, {"friend_id": friend_id})]
+            loan_ids = [row[0] for row in conn.execute(loan_ids_query, {"friend_id": friend_id})]
             conn.execute(delete_contacts_query, {"friend_id": friend_id})
-            conn.execute(delete_loans_query, {"friend_id": friend_id})
+            result = conn.execute(delete_loans_query, {"friend_id": friend_id})
+            conn.execute(update_stats_query, {"books": 0, "borrowed": -result.rowcount})
             conn.execute(delete_friend_query, {"friend_id": friend_id})
+            record_changes(conn, ("Contacts", "D", contact_ids), ("Loans", "D", loan_ids), ("Friends", "D", [friend_id]))
+        library_cache.invalidate("Contacts", "Loans", "Friends")
         return True
     except Exception as e:
         st.error(f"Failed to delete friend: {e}.")
         return False
 
-def clear_reminder(loan_id):
+@profiler.profiled
+def clear_reminder(loan_id, engine=None):
     """Sets the ReturnReminder to NULL for a given loan to clear it."""
-    if "engine" not in st.session_state or st.session_state.engine is None:
+    return clear_reminders([loan_id], engine=engine)
+
+# Ids per UPDATE, well below SQLite's limit on bound parameters
+CLEAR_REMINDERS_BATCH = 5000
+
+@profiler.profiled
+def clear_reminders(loan_ids, engine=None):
+    """
+    Clears the reminders of many loans in one transaction, with one
+    set-based UPDATE per CLEAR_REMINDERS_BATCH ids (e.g. after reminder_mailer
+    has delivered a whole day's reminders).
+    """
+    engine = engine or st.session_state.get("engine")
+    if engine is None:
         st.error("Not connected to database.")
         return False
-    engine = st.session_state.engine
-    query = text("UPDATE Loans SET ReturnReminder = NULL WHERE LoanID = :loan_id")
+    loan_ids = list(dict.fromkeys(loan_ids))
+    if not loan_ids:
+        return True
+    query = text("UPDATE Loans SET ReturnReminder = NULL WHERE LoanID IN :loan_ids").bindparams(
+        bindparam("loan_ids", expanding=True))
     try:
         with engine.begin() as conn:
-            conn.execute(query, {"loan_id": loan_id})
+            for start in range(0, len(loan_ids), CLEAR_REMINDERS_BATCH):
+                conn.execute(query, {"loan_ids": loan_ids[start:start + CLEAR_REMINDERS_BATCH]})
+            record_changes(conn, ("Loans", "U", loan_ids))
+        library_cache.invalidate("Loans")
         return True
     except Exception as e:
-        st.error(f"Failed to clear reminder: {e}")
+        st.error(f"Failed to clear reminders: {e}")
         return False
\ No newline at end of file
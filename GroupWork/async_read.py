@@ -0,0 +1,172 @@
+"""
+Asyncio variant of the Read API for the datasets a page loads together.
+
+Queries run on SQLAlchemy's async engine (aiomysql for MySQL, aiosqlite for
+SQLite) in one background event loop shared by the whole process, so a
+page's independent queries are in flight at the same time and the page
+waits for the slowest one instead of the sum of all of them.
+
+Only get_library_stats is an async query of its own. The daily reminders
+and the loan picker already come from memory (reminder_queue, Read's
+change-log catch-up), so their coroutines just run the synchronous call in
+a thread alongside it.
+
+The async drivers are optional: pages check is_available(engine) and fall
+back to the synchronous Read functions when they are not installed.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import threading
+
+from sqlalchemy import event
+
+import library_cache
+import library_connection
+import profiler
+import Read
+import reminder_queue
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:
+    create_async_engine = None
+
+# Sync dialect -> async DBAPI driver
+ASYNC_DRIVERS = {"mysql": "aiomysql", "sqlite": "aiosqlite"}
+
+
+def _installed(module_name):
+    return importlib.util.find_spec(module_name) is not None
+
+
+def is_available(engine):
+    """True when an async driver for this engine's database is installed."""
+    if create_async_engine is None or engine is None or not _installed("greenlet"):
+        return False
+    if engine.dialect.name == "sqlite" and engine.url.database in (None, "", ":memory:"):
+        return False  # A second engine would open a different, empty in-memory database
+    driver = ASYNC_DRIVERS.get(engine.dialect.name)
+    return driver is not None and _installed(driver)
+
+
+# --- One background event loop for the process ---
+# Async engines are bound to the loop their connections were made on, so
+# every query runs on this loop rather than on a fresh loop per rerun.
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-read-loop", daemon=True).start()
+        return _loop
+
+
+# --- Async engines, shared like the sync ones in library_connection ---
+
+_engines_lock = threading.Lock()
+_async_engines = {}
+DISPOSE_TIMEOUT = 30  # seconds to wait for an async pool to close
+
+
+def _async_url(engine):
+    return engine.url.set(drivername=f"{engine.dialect.name}+{ASYNC_DRIVERS[engine.dialect.name]}")
+
+
+def _async_key(url):
+    return hashlib.sha256(url.render_as_string(hide_password=False).encode("utf-8")).hexdigest()
+
+
+def get_async_engine(engine):
+    """Returns the async twin of a sync engine, created once per DSN."""
+    url = _async_url(engine)
+    key = _async_key(url)
+    with _engines_lock:
+        async_engine = _async_engines.get(key)
+        if async_engine is None:
+            options = {"pool_pre_ping": True}
+            if engine.dialect.name == "mysql":
+                options.update(
+                    pool_size=library_connection.POOL_SIZE,
+                    max_overflow=library_connection.MAX_OVERFLOW,
+                    pool_recycle=library_connection.POOL_RECYCLE,
+                    pool_timeout=library_connection.POOL_TIMEOUT,
+                )
+            async_engine = _async_engines[key] = create_async_engine(url, **options)
+            if engine.dialect.name == "sqlite":
+                event.listen(async_engine.sync_engine, "connect", library_connection.set_sqlite_pragmas)
+                event.listen(async_engine.sync_engine, "before_cursor_execute",
+                             library_connection.bind_sqlite_datetimes, retval=True)
+            profiler.instrument(async_engine.sync_engine)
+        return async_engine
+
+
+def release_async_engine(engine):
+    """Disposes the async twin of a sync engine that library_connection is disposing."""
+    if engine.dialect.name not in ASYNC_DRIVERS:
+        return
+    with _engines_lock:
+        async_engine = _async_engines.pop(_async_key(_async_url(engine)), None)
+    if async_engine is not None:
+        # Its connections belong to the background loop, so they are closed there
+        asyncio.run_coroutine_threadsafe(async_engine.dispose(), _get_loop()).result(DISPOSE_TIMEOUT)
+
+
+library_connection.add_release_callback(release_async_engine)
+
+
+# --- Async read functions (engine is keyword-only so the cache can key on it) ---
+
+@profiler.profiled
+@library_cache.cached("Books", "Loans", per_day=True)
+async def get_library_stats(*, engine):
+    async with get_async_engine(engine).connect() as conn:
+        result = await conn.execute(Read.LIBRARY_STATS_QUERY, Read.library_stats_params())
+        return Read.library_stats_from_row(result.mappings().fetchone())
+
+
+@profiler.profiled
+async def get_daily_reminders(*, engine):
+    # Already in memory (reminder_queue); a thread only in case it has to catch up first
+    return await asyncio.to_thread(reminder_queue.daily_reminders, engine)
+
+
+@profiler.profiled
+async def get_loan_picker(*, engine):
+    # Cached per data version by Read; a thread for the change-log catch-up
+    return await asyncio.to_thread(Read.get_loan_picker, engine=engine)
+
+
+# --- Gathering a page ---
+
+async def gather_page(**queries):
+    """
+    Awaits all of a page's queries concurrently (name=awaitable).
+    Returns (results, errors): two dicts keyed by dataset name, so one failed
+    query doesn't cost the page the datasets that did load.
+    """
+    outcomes = await asyncio.gather(*queries.values(), return_exceptions=True)
+    results, errors = {}, {}
+    for name, outcome in zip(queries, outcomes):
+        if isinstance(outcome, Exception):
+            errors[name] = outcome
+        else:
+            results[name] = outcome
+    return results, errors
+
+
+def load_page(**queries):
+    """Runs gather_page from a (synchronous) Streamlit script and waits for it."""
+    run = profiler.current_run()
+
+    async def gather_in_run():
+        # Tasks created by gather inherit this, so the queries count towards the rerun
+        profiler.attach_run(run)
+        return await gather_page(**queries)
+
+    return asyncio.run_coroutine_threadsafe(gather_in_run(), _get_loop()).result()
@@ -0,0 +1,382 @@
+"""
+Times every Read and Write function against generated datasets.
+
+Each scale gets its own database (see datasets.py). Read functions are
+timed cold: the shared cache, the catalog snapshot, the change-feed views
+and the reminder queue are all dropped before every call, so the numbers
+are query plus pandas cost; Write functions work on rows the run creates or
+picks for itself and leave the dataset as they found it.
+
+Usage (from GroupWork/):
+    python benchmarks/bench_data_layer.py --scales 10k,100k
+    python benchmarks/bench_data_layer.py --backend mysql --scales 10k,100k,1m --output results.json
+    python benchmarks/bench_data_layer.py --scales 10k --baseline baseline.json   # exit code 1 on a regression
+
+A Write function that refuses its call (returns False or None; its st.error
+does nothing outside a Streamlit run) would be timed as a fast success, so
+such calls are counted per case and make the exit code 1.
+"""
+import argparse
+import getpass
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import text
+
+import datasets
+import library_cache
+import library_connection
+import Read
+import Write
+
+REPEAT = 5
+REGRESSION_THRESHOLD = 1.25  # current median / baseline median
+MIN_DELTA_MS = 0.5  # ignore slowdowns smaller than this (timer noise on sub-ms calls)
+
+
+# --- Cases ---
+
+class Fixture:
+    """Keys the cases draw from, refreshed from the database before each scale."""
+
+    def __init__(self, engine, seed):
+        self.rng = random.Random(seed)
+        with engine.connect() as conn:
+            self.in_stock = [r[0] for r in conn.execute(text("SELECT ISBN FROM Books WHERE IsInStock = 1"))]
+            self.friend_ids = [r[0] for r in conn.execute(text("SELECT FriendID FROM Friends"))]
+            self.loans = [tuple(r) for r in conn.execute(text("SELECT LoanID, ISBN, FriendID FROM Loans"))]
+        self.rng.shuffle(self.in_stock)
+        self.new_book = 0
+        self.created_books = []
+        self.lent = []        # (isbn, friend_id) from create_loan_entry, returned by return_book
+        self.checked_out = []  # ISBN lists from checkout_books, returned by return_books
+
+    def any_isbn(self):
+        return self.rng.choice(self.in_stock)
+
+    def any_friend(self):
+        return self.rng.choice(self.friend_ids)
+
+    def any_loan(self):
+        return self.rng.choice(self.loans)
+
+    def next_isbn(self):
+        self.new_book += 1
+        return f"979-0-{self.new_book:07d}-0"
+
+
+def _friend_ids_named(engine, lname):
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(text("SELECT FriendID FROM Friends WHERE LName = :lname"), {"lname": lname})]
+
+
+def _contact_ids_of(engine, contact):
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(text("SELECT ContactID FROM Contacts WHERE contact = :c"), {"c": contact})]
+
+
+def read_cases():
+    """(name, prepare(engine, fixture)) for every Read function; prepare returns the call to time."""
+    return [
+        ("Read.list_books", lambda e, f: partial(Read.list_books, engine=e)),
+        ("Read.list_loans", lambda e, f: partial(Read.list_loans, engine=e)),
+        ("Read.loan_exists", lambda e, f: partial(Read.loan_exists, f.any_loan()[0], engine=e)),
+        ("Read.book_exists", lambda e, f: partial(Read.book_exists, f.any_isbn(), engine=e)),
+        ("Read.read_all_books", lambda e, f: partial(Read.read_all_books, engine=e)),
+        ("Read.read_books", lambda e, f: partial(Read.read_books, engine=e)),
+        ("Read.list_genres", lambda e, f: partial(Read.list_genres, engine=e)),
+        ("Read.read_books_page", lambda e, f: partial(Read.read_books_page, engine=e)),
+        ("Read.read_books_page[genre]", lambda e, f: partial(Read.read_books_page, genre="Fiction", in_stock=True, engine=e)),
+        ("Read.count_books_matching", lambda e, f: partial(Read.count_books_matching, genre="Fiction", engine=e)),
+        ("Read.search_catalog", lambda e, f: partial(Read.search_catalog, "river gard", engine=e)),
+        ("Read.count_books", lambda e, f: partial(Read.count_books, engine=e)),
+        ("Read.count_borrowed_books", lambda e, f: partial(Read.count_borrowed_books, engine=e)),
+        ("Read.count_overdue_books", lambda e, f: partial(Read.count_overdue_books, engine=e)),
+        ("Read.get_library_stats", lambda e, f: partial(Read.get_library_stats, engine=e)),
+        ("Read.get_borrowed_isbns", lambda e, f: partial(Read.get_borrowed_isbns, engine=e)),
+        ("Read.get_friends", lambda e, f: partial(Read.get_friends, engine=e)),
+        ("Read.get_all_friends", lambda e, f: partial(Read.get_all_friends, engine=e)),
+        ("Read.search_friends", lambda e, f: partial(Read.search_friends, "Smi", engine=e)),
+        ("Read.get_books", lambda e, f: partial(Read.get_books, engine=e)),
+        ("Read.get_borrowed_books", lambda e, f: partial(Read.get_borrowed_books, f.any_loan()[2], engine=e)),
+        ("Read.get_loan_friends", lambda e, f: partial(Read.get_loan_friends, engine=e)),
+        ("Read.get_loan_overdues", lambda e, f: partial(Read.get_loan_overdues, engine=e)),
+        ("Read.get_friend_contact_info", lambda e, f: partial(Read.get_friend_contact_info, f.any_friend(), engine=e)),
+        ("Read.get_friend_max_loans", lambda e, f: partial(Read.get_friend_max_loans, f.any_friend(), engine=e)),
+        ("Read.get_daily_reminders", lambda e, f: partial(Read.get_daily_reminders, engine=e)),
+    ]
+
+
+def _create_book(e, f):
+    isbn = f.next_isbn()
+    f.created_books.append(isbn)
+    return partial(Write.create_book, isbn, "Benchmark Book", "Bench Author", "Fiction", "Good", "Z1", 1, engine=e)
+
+
+def _create_loan_entry(e, f):
+    # Loans are refused once a friend's MaxLoans runs out, so pick one with loans left
+    with e.connect() as conn:
+        friend_id = conn.execute(text("SELECT MIN(FriendID) FROM Friends WHERE MaxLoans > 0")).scalar()
+    isbn = f.in_stock.pop()
+    f.lent.append((isbn, friend_id))
+    now = datetime.now()
+    return partial(Write.create_loan_entry, now, now + timedelta(days=14), now + timedelta(days=11),
+                   isbn, friend_id, engine=e)
+
+
+def _clear_reminder(e, f):
+    # On a loan this run made, so the seeded reminders stay as they are
+    isbn, _ = f.rng.choice(f.lent)
+    with e.connect() as conn:
+        loan_id = conn.execute(text("SELECT LoanID FROM Loans WHERE ISBN = :isbn"), {"isbn": isbn}).scalar()
+    return partial(Write.clear_reminder, loan_id, engine=e)
+
+
+def _return_book(e, f):
+    isbn, friend_id = f.lent.pop()
+    f.in_stock.append(isbn)
+    return partial(Write.return_book, isbn, friend_id, engine=e)
+
+
+def _checkout_books(e, f):
+    isbns = [f.in_stock.pop() for _ in range(3)]
+    f.checked_out.append(isbns)
+    # A fresh friend each time, so MaxLoans never runs out
+    Write.create_friend("Bench", "Checkout", 3, engine=e)
+    friend_id = max(_friend_ids_named(e, "Checkout"))
+    now = datetime.now()
+    return partial(Write.checkout_books, friend_id, isbns, now, now + timedelta(days=14), now + timedelta(days=11),
+                   engine=e)
+
+
+def _return_books(e, f):
+    isbns = f.checked_out.pop()
+    f.in_stock.extend(isbns)
+    return partial(Write.return_books, [isbn.replace("-", "") for isbn in isbns], engine=e)
+
+
+def _delete_benchmark_friends(e, f):
+    for lname in ("Benchmark", "Checkout"):
+        for friend_id in _friend_ids_named(e, lname):
+            Write.delete_friend(friend_id, engine=e)
+
+
+def write_cases():
+    """
+    (name, prepare(engine, fixture), cleanup(engine, fixture) or None) in an
+    order where later cases undo earlier ones (create_book -> delete_book, ...).
+    """
+    return [
+        ("Write.create_book", _create_book, None),
+        ("Write.update_book", lambda e, f: partial(
+            Write.update_book, f.created_books[-1], "Benchmark Book 2", "Bench Author", "Fiction", "Fair", "Z1", 2,
+            engine=e), None),
+        ("Write.delete_book", lambda e, f: partial(Write.delete_book, f.created_books.pop(), engine=e), None),
+        ("Write.create_loan_entry", _create_loan_entry, None),
+        ("Write.clear_reminder", _clear_reminder, None),
+        ("Write.return_book", _return_book, None),
+        ("Write.checkout_books", _checkout_books, None),
+        ("Write.return_books", _return_books, None),
+        ("Write.create_friend", lambda e, f: partial(Write.create_friend, "Bench", "Benchmark", 3, engine=e), None),
+        ("Write.add_friend_with_contacts", lambda e, f: partial(
+            Write.add_friend_with_contacts, "Bench", "Benchmark", 3,
+            [{"type": "email", "contact": "bench@example.com"}], engine=e), None),
+        ("Write.update_friend", lambda e, f: partial(
+            Write.update_friend, _friend_ids_named(e, "Benchmark")[0], "Bench", "Benchmark", 4, engine=e), None),
+        ("Write.add_contact_to_friend", lambda e, f: partial(
+            Write.add_contact_to_friend, _friend_ids_named(e, "Benchmark")[0], "phone", "bench-phone", engine=e), None),
+        ("Write.delete_contact", lambda e, f: partial(
+            Write.delete_contact, _contact_ids_of(e, "bench-phone")[0], engine=e), None),
+        ("Write.delete_friend", lambda e, f: partial(
+            Write.delete_friend, _friend_ids_named(e, "Benchmark")[0], engine=e), _delete_benchmark_friends),
+    ]
+
+
+# --- Timing ---
+
+def _rows(result):
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    return len(result) if isinstance(result, (pd.DataFrame, list)) else None
+
+
+def _summarize(samples_ms, rows):
+    ordered = sorted(samples_ms)
+    return {
+        "runs": len(ordered),
+        "median_ms": round(statistics.median(ordered), 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "min_ms": round(ordered[0], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        "rows": rows,
+    }
+
+
+def _drop_warm_state(engine):
+    """Forgets every result this process keeps between calls, so the next call reads the database."""
+    library_cache.clear()
+    library_connection.forget_engine_state(engine)
+
+
+def write_failed(result):
+    """Whether a Write function refused its call; return_books reports each scan instead."""
+    if result is None or result is False:
+        return True
+    return isinstance(result, list) and any(row.get("Status") != "Returned" for row in result)
+
+
+def time_case(engine, fixture, prepare, repeat, failed=None):
+    """
+    Warms up once, then times `repeat` cold calls (preparation is not timed).
+    With failed(result), the summary also counts the calls it flags.
+    """
+    _drop_warm_state(engine)
+    results = [prepare(engine, fixture)()]
+    samples = []
+    for _ in range(repeat):
+        call = prepare(engine, fixture)
+        _drop_warm_state(engine)
+        started = time.perf_counter()
+        result = call()
+        samples.append((time.perf_counter() - started) * 1000)
+        results.append(result)
+    summary = _summarize(samples, _rows(result))
+    if failed is not None:
+        summary["failures"] = sum(1 for result in results if failed(result))
+    return summary
+
+
+def run_scale(engine, repeat, seed, only=None, log=print):
+    fixture = Fixture(engine, seed)
+    results = {}
+    for name, prepare in read_cases():
+        if only and only not in name:
+            continue
+        results[name] = time_case(engine, fixture, prepare, repeat)
+        rows = results[name]["rows"]
+        log(f"  {name:<34} {results[name]['median_ms']:>10.2f} ms" + (f"  ({rows} rows)" if rows is not None else ""))
+    for name, prepare, cleanup in write_cases():
+        if only and only not in name:
+            continue
+        # Write cases pair up (create/delete, lend/return), so each runs as often as its partner
+        results[name] = time_case(engine, fixture, prepare, repeat, failed=write_failed)
+        if cleanup:
+            cleanup(engine, fixture)
+        failures = results[name]["failures"]
+        log(f"  {name:<34} {results[name]['median_ms']:>10.2f} ms"
+            + (f"  FAILED {failures} of {repeat + 1} calls" if failures else ""))
+    return results
+
+
+# --- Baseline comparison ---
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, min_delta_ms=MIN_DELTA_MS):
+    """Returns [(scale, case, baseline ms, current ms, ratio)] of the regressions."""
+    regressions = []
+    for scale, cases in results["scales"].items():
+        base_cases = baseline.get("scales", {}).get(scale, {})
+        for name, current in cases.items():
+            base = base_cases.get(name)
+            if not base or not base["median_ms"]:
+                continue
+            ratio = current["median_ms"] / base["median_ms"]
+            if ratio > threshold and current["median_ms"] - base["median_ms"] > min_delta_ms:
+                regressions.append((scale, name, base["median_ms"], current["median_ms"], ratio))
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Read/Write functions at several data scales.")
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--scales", default="10k,100k", help="comma-separated book counts, e.g. 10k,100k,1m")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed calls per function")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="only run functions whose name contains this text")
+    parser.add_argument("--data-dir", help="where the SQLite databases go (default: a temporary directory)")
+    parser.add_argument("--reuse", action="store_true", help="reuse a database already generated for a scale")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="flag functions whose median grew by more than this factor")
+    parser.add_argument("--min-delta", type=float, default=MIN_DELTA_MS,
+                        help="... and by more than this many milliseconds")
+    args = parser.parse_args()
+
+    password = getpass.getpass("MySQL Password: ") if args.backend == "mysql" else None
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="library-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    results = {
+        "meta": {
+            "backend": args.backend, "repeat": args.repeat, "seed": args.seed,
+            "started": datetime.now().isoformat(timespec="seconds"), "git": _git_revision(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__, "pandas": pd.__version__,
+        },
+        "scales": {},
+    }
+
+    for scale in map(datasets.parse_scale, args.scales.split(",")):
+        if args.backend == "sqlite":
+            path = os.path.join(data_dir, f"library_{scale.label}_{args.seed}.db")
+            exists = os.path.exists(path)
+            engine = datasets.sqlite_engine(path)
+        else:
+            engine = datasets.mysql_engine(password, f"lianes_library_bench_{scale.label}")
+            with engine.connect() as conn:
+                exists = conn.execute(text("SHOW TABLES LIKE 'Books'")).fetchone() is not None
+        try:
+            if not (args.reuse and exists):
+                print(f"Generating {scale.label}: {scale.books} books, {scale.friends} friends, {scale.loans} loans ...")
+                started = time.perf_counter()
+                datasets.populate(engine, scale, seed=args.seed)
+                print(f"  generated in {time.perf_counter() - started:.1f} s")
+            print(f"Benchmarking {scale.label} ({args.backend}):")
+            results["scales"][scale.label] = run_scale(engine, args.repeat, args.seed, args.only)
+        finally:
+            engine.dispose()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = [(scale, name, case["failures"]) for scale, cases in results["scales"].items()
+              for name, case in cases.items() if case.get("failures")]
+    for scale, name, failures in failed:
+        print(f"FAILED {scale} {name}: {failures} call(s) refused, so its timing is not a real write")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for scale, name, base_ms, current_ms, ratio in regressions:
+            print(f"REGRESSION {scale} {name}: {base_ms:.2f} ms -> {current_ms:.2f} ms ({ratio:.2f}x)")
+        if not regressions:
+            print(f"No regressions against {args.baseline} (threshold {args.threshold:.2f}x).")
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
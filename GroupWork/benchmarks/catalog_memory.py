@@ -0,0 +1,87 @@
+"""
+Measures what the compact catalog (Read.compact_catalog) saves per session.
+
+Loads the whole Books table of a generated database with text in object
+columns, with this pandas version's default dtypes, and in the compact form
+Read.read_all_books now returns, and reports for each: deep memory, the time of the copy library_cache makes for
+every caller, and the time to build the picker labels.
+
+Usage (from GroupWork/):
+    python benchmarks/catalog_memory.py --scale 500k --data-dir /tmp/library-bench --reuse
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import datasets
+import Read
+
+REPEAT = 5
+
+
+def _best_ms(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def measure(df, repeat=REPEAT):
+    return {
+        "memory_mb": df.memory_usage(deep=True).sum() / 2**20,
+        "copy_ms": _best_ms(df.copy, repeat),
+        "labels_ms": _best_ms(lambda: Read.book_labels(df), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the plain and the compact catalog frame.")
+    parser.add_argument("--scale", default="500k", help="book count, e.g. 100k, 500k, 1m")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="where the SQLite database goes (default: a temporary directory)")
+    parser.add_argument("--reuse", action="store_true", help="reuse a database already generated for the scale")
+    args = parser.parse_args()
+
+    scale = datasets.parse_scale(args.scale)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="library-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    # Same file name as bench_data_layer.py, so both can share a generated database
+    path = os.path.join(data_dir, f"library_{scale.label}_{args.seed}.db")
+    engine = datasets.sqlite_engine(path)
+    try:
+        if not (args.reuse and os.path.exists(path)):
+            print(f"Generating {scale.label}: {scale.books} books ...")
+            datasets.populate(engine, scale, seed=args.seed)
+        loaded = pd.read_sql("SELECT * FROM Books ORDER BY Title", engine)
+        compact = Read.compact_catalog(loaded.copy())
+        # Text as object columns, which is what pandas < 3 returns
+        text_columns = [c for c in loaded.columns if not pd.api.types.is_numeric_dtype(loaded[c])]
+        plain = loaded.astype({c: object for c in text_columns})
+    finally:
+        engine.dispose()
+
+    rows = {
+        "object": measure(plain, args.repeat),
+        "read_sql": measure(loaded, args.repeat),  # This pandas version's default dtypes
+        "compact": measure(compact, args.repeat),
+    }
+    print(f"{len(plain)} books")
+    print(f"  {'':<8} {'memory':>10} {'copy':>10} {'labels':>10}")
+    for name, row in rows.items():
+        print(f"  {name:<8} {row['memory_mb']:>7.1f} MB {row['copy_ms']:>7.1f} ms {row['labels_ms']:>7.1f} ms")
+    before, after = rows["object"], rows["compact"]
+    print(f"  saved    {1 - after['memory_mb'] / before['memory_mb']:>9.0%} {1 - after['copy_ms'] / before['copy_ms']:>9.0%}"
+          f" {1 - after['labels_ms'] / before['labels_ms']:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
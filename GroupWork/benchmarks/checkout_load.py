@@ -0,0 +1,232 @@
+"""
+Load test for concurrent checkouts: many desks lending from the same shelf.
+
+Worker threads share one engine and keep checking out random books to random
+friends through Write.lend_books / Write.run_transaction, the path behind
+create_loan_entry and checkout_books. The books are drawn from a small hot
+set and the friends have a handful of loans left each, so most attempts race
+for the same rows and many must be refused. Each worker also hands back
+some of its own loans through Write.return_book, so stock and quotas keep
+circulating. Afterwards the database is checked for the damage a lost
+update would leave:
+
+  - a book with more than one active loan, or in stock while lent out
+  - a friend whose MaxLoans went negative, or whose MaxLoans plus active
+    loans is no longer what it was before the run
+  - LibraryStats.BorrowedBooks out of step with the Loans table
+  - a change in the number of loans other than books lent minus returned
+
+--unguarded runs the old check-then-write flow instead (quota and stock read
+in one transaction, written unconditionally in another) to show what the
+checks catch. The exit code is 1 when any invariant is broken.
+
+Usage (from GroupWork/):
+    python benchmarks/checkout_load.py --threads 16 --attempts 5000
+    python benchmarks/checkout_load.py --backend mysql --threads 32 --attempts 20000
+    python benchmarks/checkout_load.py --unguarded
+"""
+import argparse
+import collections
+import getpass
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+import datasets
+import Write
+
+HOT_BOOKS = 300
+MAX_BATCH = 3
+RETURN_RATE = 0.5  # chance that a worker returns one of its loans before its next checkout
+
+
+# --- The two checkout flows ---
+
+def guarded_checkout(engine, friend_id, isbns, dates):
+    Write.run_transaction(engine, lambda conn: Write.lend_books(conn, friend_id, isbns, *dates))
+
+
+unguarded_check_query = text("""
+    SELECT F.MaxLoans, (SELECT COUNT(*) FROM Books WHERE ISBN IN :isbns AND IsInStock = 1)
+    FROM Friends F WHERE F.FriendID = :friend_id
+""").bindparams(bindparam("isbns", expanding=True))
+unguarded_books_query = text("UPDATE Books SET IsInStock = 0 WHERE ISBN IN :isbns").bindparams(
+    bindparam("isbns", expanding=True)
+)
+unguarded_friend_query = text("UPDATE Friends SET MaxLoans = MaxLoans - :count WHERE FriendID = :friend_id")
+
+
+def unguarded_checkout(engine, friend_id, isbns, dates):
+    """The flow before lend_books: check in one transaction, write unconditionally in the next."""
+    params = dict(zip(("borrow_date", "due_date", "return_reminder"), dates),
+                  friend_id=friend_id, isbns=isbns, count=len(isbns))
+    with engine.connect() as conn:
+        max_loans, available = conn.execute(unguarded_check_query, params).fetchone()
+    if max_loans < len(isbns):
+        raise ValueError("Max Amount Of Loans Was Reached for this friend.")
+    if available < len(isbns):
+        raise ValueError("Not all of these books are in stock.")
+    with engine.begin() as conn:
+        conn.execute(Write.insert_loans_query, params)
+        conn.execute(unguarded_books_query, params)
+        conn.execute(unguarded_friend_query, params)
+        conn.execute(Write.update_stats_query, {"books": 0, "borrowed": len(isbns)})
+
+
+# --- Running the load ---
+
+def _reason(error):
+    message = str(error)
+    if "Max Amount" in message or "can borrow" in message:
+        return "quota"
+    return "stock"
+
+
+def run_load(engine, checkout, hot_books, friend_ids, attempts, threads, seed, return_rate=RETURN_RATE):
+    """Runs `attempts` checkouts (and the returns in between) over `threads` workers; returns the counts and the wall time."""
+    counts = collections.Counter()
+    counts_lock = threading.Lock()
+    now = datetime.now()
+    dates = (now, now + timedelta(days=14), now + timedelta(days=11))
+
+    def worker(index, share):
+        rng = random.Random(seed * 1000 + index)
+        local = collections.Counter()
+        lent = []  # (isbn, friend_id) of this worker's loans
+        for _ in range(share):
+            if lent and rng.random() < return_rate:
+                isbn, friend_id = lent.pop(rng.randrange(len(lent)))
+                local["books_returned" if Write.return_book(isbn, friend_id, engine=engine) else "errors"] += 1
+            isbns = rng.sample(hot_books, rng.randint(1, MAX_BATCH))
+            friend_id = rng.choice(friend_ids)
+            try:
+                checkout(engine, friend_id, isbns, dates)
+                local["succeeded"] += 1
+                local["books_lent"] += len(isbns)
+                lent.extend((isbn, friend_id) for isbn in isbns)
+            except ValueError as e:
+                local[f"refused_{_reason(e)}"] += 1
+            except Exception as e:
+                local["errors"] += 1
+                local[f"error: {type(e).__name__}: {str(e).splitlines()[0][:80]}"] += 1
+        with counts_lock:
+            counts.update(local)
+
+    shares = [attempts // threads + (1 if i < attempts % threads else 0) for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(i, share)) for i, share in enumerate(shares)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return counts, time.perf_counter() - started
+
+
+# --- Invariants ---
+
+def snapshot(engine):
+    """What the invariants compare: each friend's MaxLoans + active loans, and the loan count."""
+    with engine.connect() as conn:
+        friends = pd.read_sql(text("""
+            SELECT F.FriendID, F.MaxLoans, (SELECT COUNT(*) FROM Loans L WHERE L.FriendID = F.FriendID) AS Active
+            FROM Friends F
+        """), conn)
+        loans = conn.execute(text("SELECT COUNT(*) FROM Loans")).scalar()
+    friends["Quota"] = friends["MaxLoans"] + friends["Active"]
+    return friends.set_index("FriendID"), loans
+
+
+def check_invariants(engine, before, before_loans, books_lent, books_returned):
+    """{invariant: number of violations}; all zero when no update was lost."""
+    after, after_loans = snapshot(engine)
+    with engine.connect() as conn:
+        double_lent = conn.execute(text("""
+            SELECT COUNT(*) FROM (SELECT ISBN FROM Loans GROUP BY ISBN HAVING COUNT(*) > 1) D
+        """)).scalar()
+        lent_in_stock = conn.execute(text("""
+            SELECT COUNT(*) FROM Books B WHERE B.IsInStock = 1 AND EXISTS (SELECT 1 FROM Loans L WHERE L.ISBN = B.ISBN)
+        """)).scalar()
+        borrowed = conn.execute(text("SELECT BorrowedBooks FROM LibraryStats WHERE StatsID = 1")).scalar()
+    was_non_negative = before["MaxLoans"] >= 0
+    return {
+        "books lent more than once": double_lent,
+        "books in stock while lent": lent_in_stock,
+        "friends with negative MaxLoans": int((after["MaxLoans"] < 0)[was_non_negative].sum()),
+        "friends whose quota changed": int((after["Quota"] != before["Quota"]).sum()),
+        "LibraryStats.BorrowedBooks off by": abs(borrowed - after_loans),
+        "loans not accounted for": abs(after_loans - before_loans - (books_lent - books_returned)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent checkouts against one database, then an invariant check.")
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--scale", default="10k", help="generated dataset, e.g. 10k, 100k")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--attempts", type=int, default=5000, help="checkouts tried, over all threads")
+    parser.add_argument("--hot-books", type=int, default=HOT_BOOKS, help="in-stock books the attempts draw from")
+    parser.add_argument("--return-rate", type=float, default=RETURN_RATE,
+                        help="chance of returning a loan before each checkout")
+    parser.add_argument("--unguarded", action="store_true", help="use the old check-then-write flow")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="where the SQLite database goes (default: a temporary directory)")
+    args = parser.parse_args()
+
+    # st.error outside a Streamlit run only logs; keep the output to the report
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    scale = datasets.parse_scale(args.scale)
+    if args.backend == "sqlite":
+        data_dir = args.data_dir or tempfile.mkdtemp(prefix="library-load-")
+        os.makedirs(data_dir, exist_ok=True)
+        engine = datasets.sqlite_engine(os.path.join(data_dir, f"checkout_load_{scale.label}_{args.seed}.db"))
+    else:
+        engine = datasets.mysql_engine(getpass.getpass("MySQL Password: "), f"lianes_library_load_{scale.label}")
+
+    try:
+        # The run lends books out, so it always starts from a fresh dataset
+        print(f"Generating {scale.label}: {scale.books} books, {scale.friends} friends, {scale.loans} loans ...")
+        datasets.populate(engine, scale, seed=args.seed)
+        rng = random.Random(args.seed)
+        with engine.connect() as conn:
+            in_stock = [row[0] for row in conn.execute(text("SELECT ISBN FROM Books WHERE IsInStock = 1"))]
+            friend_ids = [row[0] for row in conn.execute(text("SELECT FriendID FROM Friends WHERE MaxLoans > 0"))]
+        hot_books = rng.sample(in_stock, min(args.hot_books, len(in_stock)))
+        before, before_loans = snapshot(engine)
+
+        flow = "unguarded (check, then write)" if args.unguarded else "guarded (Write.lend_books)"
+        print(f"{args.attempts} checkouts of 1-{MAX_BATCH} of {len(hot_books)} books by {len(friend_ids)} friends, "
+              f"{args.threads} threads, {flow}, {args.backend}")
+        checkout = unguarded_checkout if args.unguarded else guarded_checkout
+        counts, elapsed = run_load(engine, checkout, hot_books, friend_ids, args.attempts, args.threads, args.seed,
+                                   args.return_rate)
+
+        print(f"  {args.attempts / elapsed:,.0f} attempts/s, {counts['succeeded'] / elapsed:,.0f} checkouts/s "
+              f"({elapsed:.2f} s)")
+        for name in ("succeeded", "books_lent", "books_returned", "refused_quota", "refused_stock", "errors"):
+            print(f"  {name:<16} {counts[name]:>8}")
+        for name, count in counts.items():
+            if name.startswith("error: "):
+                print(f"    {count:>6} x {name[7:]}")
+
+        violations = check_invariants(engine, before, before_loans, counts["books_lent"], counts["books_returned"])
+        print("Invariants:")
+        for name, count in violations.items():
+            print(f"  {'FAIL' if count else 'ok  '} {name}: {count}")
+    finally:
+        engine.dispose()
+    if any(violations.values()) or counts["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Streaming bulk import of books from CSV, JSON or JSON Lines.
+
+The file is read record by record, validated, and written in chunks: one
+set-based query per chunk finds the ISBNs that already exist, and the new
+rows go in with a single executemany INSERT inside a bounded transaction.
+A bad row never aborts the import; it is reported with its row number, and
+so is every row of a chunk the database refused.
+
+Usage:
+    python bulk_import.py donated_books.csv [--chunk-size 1000]
+"""
+import argparse
+import csv
+import getpass
+import io
+import json
+import re
+from dataclasses import dataclass, field
+
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+import library_cache
+import library_connection
+import Write
+
+CHUNK_SIZE = 1000
+CONDITIONS = ("Excellent", "Good", "Fair")
+ISBN_PATTERN = re.compile(r"^(\d{9}[\dX]|\d{13})$")
+
+# Column limits from Lianes_Library.sql
+MAX_LENGTHS = {"Title": 45, "Author": 45, "Genre": 45, "BookCondition": 15, "ShelfLocation": 45}
+
+existing_isbns_query = text("SELECT ISBN FROM Books WHERE ISBN IN :isbns").bindparams(
+    bindparam("isbns", expanding=True)
+)
+insert_books_query = text("""
+    INSERT INTO Books (ISBN, Title, Author, Genre, BookCondition, IsInStock, ShelfLocation, ShelfRow)
+    VALUES (:ISBN, :Title, :Author, :Genre, :BookCondition, :IsInStock, :ShelfLocation, :ShelfRow)
+""")
+
+
+@dataclass
+class ImportReport:
+    rows_read: int = 0
+    inserted: int = 0
+    skipped_existing: int = 0
+    errors: list = field(default_factory=list)  # (row number, ISBN, message)
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+
+# --- Reading ---
+
+def detect_format(filename):
+    name = filename.lower()
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if name.endswith(".json"):
+        return "json"
+    return "csv"
+
+
+def _iter_json_array(stream, read_size=65536):
+    """Yields the objects of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = stream.read(read_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("A .json import file must contain an array of book objects.")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = stream.read(read_size)
+            eof = not more
+            buffer += more
+            continue
+        yield obj
+        buffer = buffer[end:]
+
+
+def iter_records(stream, fmt):
+    """
+    Yields (row number, record dict) from a text stream. A JSON Lines line
+    that is not valid JSON is yielded as its JSONDecodeError, so the lines
+    after it are still imported.
+    """
+    if fmt == "csv":
+        yield from enumerate(csv.DictReader(stream), start=1)
+    elif fmt == "jsonl":
+        row_number = 0
+        for line in stream:
+            if line.strip():
+                row_number += 1
+                try:
+                    yield row_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield row_number, e
+    elif fmt == "json":
+        yield from enumerate(_iter_json_array(stream), start=1)
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+# --- Validation ---
+
+def _clean(record, *names):
+    for name in names:
+        value = record.get(name)
+        if value is not None and str(value).strip() != "":
+            return str(value).strip()
+    return None
+
+
+def validate_record(record):
+    """
+    Returns (row, None) with a dict ready for insert_books_query, or
+    (None, error message). Accepts the column names of the Books table as
+    well as the 'Condition' label the catalog grid uses.
+    """
+    if not isinstance(record, dict):
+        return None, "Record is not an object."
+    row = {
+        "ISBN": _clean(record, "ISBN", "isbn"),
+        "Title": _clean(record, "Title", "title"),
+        "Author": _clean(record, "Author", "author"),
+        "Genre": _clean(record, "Genre", "genre"),
+        "BookCondition": _clean(record, "BookCondition", "Condition", "condition") or "Good",
+        "ShelfLocation": _clean(record, "ShelfLocation", "shelf_location"),
+        "ShelfRow": _clean(record, "ShelfRow", "shelf_row"),
+        "IsInStock": 1,
+    }
+    missing = [name for name in ("ISBN", "Title", "Author", "Genre") if not row[name]]
+    if missing:
+        return None, f"Missing required field(s): {', '.join(missing)}."
+    if len(row["ISBN"]) > 17 or not ISBN_PATTERN.match(row["ISBN"].replace("-", "")):
+        return None, "ISBN must have 10 or 13 digits (hyphens allowed)."
+    if row["BookCondition"] not in CONDITIONS:
+        return None, f"Condition must be one of {', '.join(CONDITIONS)}."
+    for name, limit in MAX_LENGTHS.items():
+        if row[name] and len(row[name]) > limit:
+            return None, f"{name} is longer than {limit} characters."
+    if row["ShelfRow"] is not None:
+        try:
+            row["ShelfRow"] = int(row["ShelfRow"])
+        except ValueError:
+            return None, "ShelfRow must be a whole number."
+    return row, None
+
+
+# --- Writing ---
+
+def _insert_chunk(conn, chunk):
+    """Inserts the chunk's rows whose ISBN is new; returns how many went in."""
+    isbns = [row["ISBN"] for _, row in chunk]
+    existing = {r[0] for r in conn.execute(existing_isbns_query, {"isbns": isbns})}
+    new_rows = [row for _, row in chunk if row["ISBN"] not in existing]
+    if new_rows:
+        conn.execute(insert_books_query, new_rows)
+        conn.execute(Write.update_stats_query, {"books": len(new_rows), "borrowed": 0})
+        Write.record_changes(conn, ("Books", "I", [row["ISBN"] for row in new_rows]))
+    return len(new_rows)
+
+
+def _write_chunk(engine, chunk, report):
+    """
+    Inserts one chunk of validated rows in a single transaction, retried on
+    deadlocks and lock timeouts. If the database still refuses it, every row
+    of the chunk is reported as failed. Returns False when the import should
+    stop: a constraint violation only spoils this chunk, but a connection
+    or lock error would most likely spoil the next one too.
+    """
+    try:
+        inserted = Write.run_transaction(engine, lambda conn: _insert_chunk(conn, chunk))
+    except SQLAlchemyError as e:
+        message = str(getattr(e, "orig", None) or e).splitlines()[0]
+        report.errors.extend((row_number, row["ISBN"], f"Not imported, the database refused its chunk: {message}")
+                             for row_number, row in chunk)
+        return isinstance(e, IntegrityError)
+    report.inserted += inserted
+    report.skipped_existing += len(chunk) - inserted
+    return True
+
+
+def import_books(engine, stream, fmt="csv", chunk_size=CHUNK_SIZE, on_progress=None):
+    """
+    Imports books from a text stream and returns an ImportReport.
+    on_progress(report) is called after every committed chunk. ISBNs that
+    already exist are skipped; duplicates inside the file are reported.
+    """
+    report = ImportReport()
+    seen = set()
+    chunk = []
+    try:
+        for row_number, record in iter_records(stream, fmt):
+            report.rows_read += 1
+            if isinstance(record, json.JSONDecodeError):
+                report.errors.append((row_number, None, f"Not valid JSON: {record}"))
+                continue
+            row, error = validate_record(record)
+            if error is None and row["ISBN"] in seen:
+                error = "Duplicate ISBN earlier in the file."
+            if error:
+                isbn = record.get("ISBN") if isinstance(record, dict) else None
+                report.errors.append((row_number, isbn, error))
+                continue
+            seen.add(row["ISBN"])
+            chunk.append((row_number, row))
+            if len(chunk) >= chunk_size:
+                written = _write_chunk(engine, chunk, report)
+                chunk = []
+                if not written:
+                    report.errors.append((report.rows_read + 1, None, "Import stopped after a database error."))
+                    break
+                if on_progress:
+                    on_progress(report)
+        if chunk:
+            _write_chunk(engine, chunk, report)
+    except (ValueError, csv.Error) as e:
+        # Unreadable file: keep what was committed and report where it stopped
+        report.errors.append((report.rows_read + 1, None, f"Could not read the file: {e}"))
+    finally:
+        if report.inserted:
+            library_cache.invalidate("Books")
+    if on_progress:
+        on_progress(report)
+    return report
+
+
+def import_uploaded_file(engine, uploaded_file, chunk_size=CHUNK_SIZE, on_progress=None):
+    """Imports a Streamlit UploadedFile (binary) without decoding it all at once."""
+    stream = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", newline="")
+    return import_books(engine, stream, detect_format(uploaded_file.name), chunk_size, on_progress)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import books into Lianes_Library.")
+    parser.add_argument("path", help="CSV, JSON (array) or JSON Lines file")
+    parser.add_argument("--format", choices=["csv", "json", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    password = getpass.getpass("MySQL Password: ")
+    engine = create_engine(library_connection.mysql_connection_string(password))
+
+    def print_progress(report):
+        print(f"\r{report.rows_read} rows read, {report.inserted} inserted, "
+              f"{report.skipped_existing} already present, {report.failed} errors", end="", flush=True)
+
+    try:
+        with open(args.path, encoding="utf-8-sig", newline="") as stream:
+            result = import_books(engine, stream, args.format or detect_format(args.path),
+                                  args.chunk_size, print_progress)
+    finally:
+        engine.dispose()
+    print()
+    for row_number, isbn, message in result.errors:
+        print(f"Row {row_number} ({isbn or 'no ISBN'}): {message}")
@@ -0,0 +1,210 @@
+"""
+One read-only copy of the reference tables (Books, Friends) per process.
+
+Every session used to read and hold its own copy of the catalog and the
+friends list. Now all sessions share a Snapshot: the tables as they were at
+one position of the ChangeLog that Write.py appends to with every change.
+Reading from the snapshot costs at most one index probe per table of that
+log every CHECK_SECONDS. When entries have been logged since, the next
+snapshot is the previous one patched with their keys (see change_feed), so
+a checkout re-reads one book rather than the whole catalog. The
+TableVersions counters only change when the tables are rewritten without
+logging their keys (datagen.py); the snapshot is then read again in full.
+
+Snapshot frames are shared and must not be modified. Read.py hands out
+copies, which are cheap because the frames are compact (Arrow strings
+share their buffers, categoricals copy only their codes), so memory stays
+flat as sessions are added.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+import change_feed
+import library_cache
+from picker_index import PickerIndex
+
+# How stale a snapshot may be with respect to changes made by other
+# processes; changes made through this process are seen at once
+CHECK_SECONDS = float(os.environ.get("LIBRARY_SNAPSHOT_CHECK_SECONDS", 2))
+
+TABLES = ("Books", "Friends")
+
+VERSIONS_QUERY = text("SELECT TableName, Version FROM TableVersions WHERE TableName IN :tables").bindparams(
+    bindparam("tables", expanding=True))
+BOOKS_QUERY = "SELECT * FROM Books {where} ORDER BY Title, ISBN"
+FRIENDS_QUERY = "SELECT FriendID, FName, LName, MaxLoans FROM Friends {where} ORDER BY FName, LName"
+
+# Catalog columns with only a handful of distinct values, stored as categoricals
+CATALOG_CATEGORIES = ("Genre", "BookCondition", "Condition", "ShelfLocation", "Location")
+CATALOG_STRINGS = ("ISBN", "Title", "Author")
+
+
+def compact_catalog(df):
+    """
+    Converts a Books frame to a compact columnar form: Arrow-backed strings,
+    categoricals for the low-cardinality columns, a bool IsInStock and an
+    int8 ShelfRow. Besides the memory, the cache's per-caller copies get
+    cheaper: Arrow buffers are shared and categoricals only copy their codes.
+    """
+    for column in CATALOG_STRINGS:
+        if column in df.columns:
+            df[column] = df[column].astype("string[pyarrow]")
+    for column in CATALOG_CATEGORIES:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    if "IsInStock" in df.columns:
+        df["IsInStock"] = df["IsInStock"].astype(bool)
+    if "ShelfRow" in df.columns:
+        df["ShelfRow"] = pd.to_numeric(df["ShelfRow"], downcast="integer")
+    return df
+
+
+def book_labels(df):
+    """'Title (ISBN: ...)' picker labels, built on demand instead of stored with the catalog."""
+    return df['Title'] + ' (ISBN: ' + df['ISBN'] + ')'
+
+
+def friend_labels(df):
+    return df['FName'] + ' ' + df['LName'] + ' (ID: ' + df['FriendID'].astype(str) + ')'
+
+
+def _prepare_friends(friends):
+    for column in ("FName", "LName"):
+        friends[column] = friends[column].astype("string[pyarrow]")
+    friends["display"] = friend_labels(friends).astype("string[pyarrow]")
+    return friends
+
+
+BOOKS_VIEW = change_feed.LiveView(BOOKS_QUERY, key="ISBN", links={"Books": ("ISBN", "ISBN")},
+                                  order_by=["Title", "ISBN"], prepare=compact_catalog)
+FRIENDS_VIEW = change_feed.LiveView(FRIENDS_QUERY, key="FriendID", links={"Friends": ("FriendID", "FriendID")},
+                                    order_by=["FName", "LName"], prepare=_prepare_friends)
+
+
+class Snapshot:
+    """Books and Friends at one ChangeLog position. Treat every frame as read-only."""
+
+    def __init__(self, versions, cursors, applied, books, friends):
+        self.versions = versions  # TableVersions counters
+        self.cursors = cursors  # ChangeLog position of the frames, {table: Seq}
+        self.applied = applied  # Entries after the cursors already in the frames
+        self.books = books
+        self.friends = friends
+        self._isbn_index = pd.Index(books["ISBN"])
+        self._friend_index = pd.Index(friends["FriendID"])
+        self._lock = threading.RLock()
+        self._derived = {}  # Built on first use, once per snapshot
+
+    def book(self, isbn):
+        """One book as a Series, or None: a hash lookup, no query."""
+        try:
+            return self.books.iloc[self._isbn_index.get_loc(isbn)]
+        except KeyError:
+            return None
+
+    def friend(self, friend_id):
+        try:
+            return self.friends.iloc[self._friend_index.get_loc(friend_id)]
+        except KeyError:
+            return None
+
+    def _once(self, name, build):
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = build()
+            return self._derived[name]
+
+    def available_books(self):
+        """ISBN, Title and display label of the books in stock, built once per snapshot."""
+        def build():
+            available = self.books.loc[self.books["IsInStock"], ["ISBN", "Title"]].reset_index(drop=True)
+            available["display"] = book_labels(available)
+            return available
+        return self._once("available_books", build)
+
+    def book_picker(self):
+        """Every book, picked by 'Title (ISBN: ...)'."""
+        return self._once("book_picker", lambda: PickerIndex(self.books, book_labels(self.books), "ISBN"))
+
+    def available_book_picker(self):
+        def build():
+            available = self.available_books()
+            return PickerIndex(available, available["display"], "ISBN")
+        return self._once("available_book_picker", build)
+
+    def friend_picker(self):
+        return self._once("friend_picker", lambda: PickerIndex(self.friends, self.friends["display"], "FriendID"))
+
+
+def _read_versions(conn):
+    versions = dict(conn.execute(VERSIONS_QUERY, {"tables": list(TABLES)}).fetchall())
+    return tuple(versions.get(table, 0) for table in TABLES)
+
+
+def _build(conn, versions):
+    books, cursors, applied = BOOKS_VIEW.load(conn)
+    friends, friend_cursors, friend_applied = FRIENDS_VIEW.load(conn)
+    return Snapshot(versions, {**cursors, **friend_cursors}, applied | friend_applied, books, friends)
+
+
+def _update(conn, snapshot):
+    """The snapshot patched with the changes logged since it was taken."""
+    books, cursors, applied = BOOKS_VIEW.refresh(conn, snapshot.books, snapshot.cursors, snapshot.applied)
+    friends, cursors, applied = FRIENDS_VIEW.refresh(conn, snapshot.friends, cursors, applied)
+    if books is snapshot.books and friends is snapshot.friends:
+        # Only entries settled: the same frames, so keep what was built from them
+        snapshot.cursors, snapshot.applied = cursors, applied
+        return snapshot
+    return Snapshot(snapshot.versions, cursors, applied, books, friends)
+
+
+_lock = threading.Lock()
+_snapshots = {}   # engine -> Snapshot
+_checked = {}     # engine -> (time.monotonic(), _writes) of the last check of the log
+_writes = 0       # Writes made through this process; one since a check makes it void
+
+
+def _recently_checked(engine):
+    checked_at, writes = _checked.get(engine, (0, None))
+    return writes == _writes and time.monotonic() - checked_at < CHECK_SECONDS
+
+
+def current(engine):
+    """The engine's snapshot; checks the change log at most every CHECK_SECONDS."""
+    snapshot = _snapshots.get(engine)
+    if snapshot is not None and _recently_checked(engine):
+        return snapshot
+    with _lock:
+        snapshot = _snapshots.get(engine)
+        if snapshot is not None and _recently_checked(engine):
+            return snapshot  # Another session checked while we waited
+        writes = _writes
+        with engine.connect() as conn:
+            versions = _read_versions(conn)
+            if snapshot is None or snapshot.versions != versions:
+                snapshot = _snapshots[engine] = _build(conn, versions)
+            elif change_feed.behind(snapshot.cursors, change_feed.latest_seqs(conn, TABLES)):
+                snapshot = _snapshots[engine] = _update(conn, snapshot)
+        _checked[engine] = (time.monotonic(), writes)
+        return snapshot
+
+
+def forget(engine):
+    """Drops an engine's snapshot, e.g. when its pool is disposed."""
+    with _lock:
+        _snapshots.pop(engine, None)
+        _checked.pop(engine, None)
+
+
+def _check_soon(tables):
+    # A write made through this process: check the log on the next read
+    global _writes
+    if tables is None or any(t in TABLES for t in tables):
+        _writes += 1
+
+
+library_cache.add_listener(_check_soon)
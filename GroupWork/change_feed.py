@@ -0,0 +1,329 @@
+"""
+Reads the ChangeLog that Write.record_changes fills, and keeps query results
+current by patching them with it instead of running them again.
+
+Every write logs the keys it inserted, updated or deleted, numbered by an
+auto-increment Seq. The number is taken when the entry is written, not when
+its transaction commits, so on MySQL an entry can become visible after
+entries numbered above it. A reader therefore keeps one cursor per table
+that only moves past entries older than SETTLE_SECONDS, by which time every
+entry numbered below them has committed (or never will), and remembers
+which entries after its cursor it has already applied (see advance).
+
+The log only keeps RETENTION_HOURS of entries: a background thread prunes
+it for every engine a view has been read from (see prune). A reader whose
+cursor is older than the oldest entry left reads its data again in full.
+
+A LiveView is a query whose rows hang off logged tables through key columns:
+a loan row off its LoanID, ISBN and FriendID. To catch up it drops the rows
+whose keys changed since its cursors and reads just those keys again. When
+only the values of some rows changed (a book's IsInStock, a friend's
+MaxLoans) they are overwritten in place; otherwise the rows are merged and
+re-sorted. Frames are never modified once handed out, so callers may share
+them.
+"""
+import os
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+import dialects
+
+# Past this many changed keys a view reads itself again rather than patching
+MAX_DELTA_KEYS = int(os.environ.get("LIBRARY_DELTA_MAX_KEYS", 1000))
+
+# How long a write may take from logging its keys to committing; Write.py
+# logs them as the last statement of the transaction
+SETTLE_SECONDS = float(os.environ.get("LIBRARY_CHANGE_SETTLE_SECONDS", 30))
+
+# How long entries are kept, and how often they are pruned
+RETENTION_HOURS = float(os.environ.get("LIBRARY_CHANGE_RETENTION_HOURS", 24))
+PRUNE_SECONDS = int(os.environ.get("LIBRARY_CHANGE_PRUNE_SECONDS", 3600))
+PRUNE_BATCH = 10000  # entries deleted per transaction
+
+# The tables Write.py logs
+TABLES = ("Books", "Friends", "Loans", "Contacts")
+
+# The oldest entry left, and the newest entry logged before the settle
+# horizon: a backward scan of the primary key that stops at the first
+# entry old enough
+POSITION_QUERY = text("""
+    SELECT (SELECT MIN(Seq) FROM ChangeLog),
+           (SELECT Seq FROM ChangeLog WHERE ChangedAt <= :horizon ORDER BY Seq DESC LIMIT 1)
+""")
+# The first entry to keep; the last one is always kept, so the log never
+# empties and its MIN(Seq) shows how far it was pruned
+FIRST_KEPT_QUERY = text("""
+    SELECT COALESCE((SELECT Seq FROM ChangeLog WHERE ChangedAt >= :cutoff ORDER BY Seq LIMIT 1),
+                    (SELECT MAX(Seq) FROM ChangeLog))
+""")
+PRUNE_QUERY = text("DELETE FROM ChangeLog WHERE Seq >= :low AND Seq < :high")
+
+
+def latest_seqs(conn, tables=TABLES):
+    """{table: last Seq logged}, 0 for a table with no entries."""
+    # One MAX per table, so each is a single probe of ix_changelog_table_seq
+    # (a GROUP BY over the tables would scan the index on SQLite)
+    selects = [f"SELECT :table_{i}, (SELECT MAX(Seq) FROM ChangeLog WHERE TableName = :table_{i})"
+               for i in range(len(tables))]
+    params = {f"table_{i}": table for i, table in enumerate(tables)}
+    latest = dict(conn.execute(text(" UNION ALL ".join(selects)), params).fetchall())
+    return {table: latest.get(table) or 0 for table in tables}
+
+
+def behind(cursors, latest):
+    """Whether the log has entries after the cursors: new ones, or ones that have not settled yet."""
+    return any(seq > cursors.get(table, 0) for table, seq in latest.items())
+
+
+def _horizon(now=None):
+    return (now or datetime.now()) - timedelta(seconds=SETTLE_SECONDS)
+
+
+def position(conn):
+    """(first, settled): the oldest Seq left in the log and the newest one that has settled, 0 if none."""
+    first, settled = conn.execute(POSITION_QUERY, {"horizon": _horizon()}).fetchone()
+    return first or 0, settled or 0
+
+
+def pruned_past(cursors, first):
+    """Whether entries after the cursors may have been pruned already."""
+    return any(seq < first - 1 for seq in cursors.values())
+
+
+def start(conn, tables):
+    """
+    A new reader's (cursors, applied), taken before it reads its data: the
+    cursors at the last settled entry, and the entries after it, which the
+    data read next already reflects.
+    """
+    _, settled = position(conn)
+    cursors = {table: settled for table in tables}
+    return advance(cursors, changes_since(conn, cursors))
+
+
+def changes_since(conn, cursors):
+    """
+    The entries logged after each table's cursor ({table: Seq}), oldest first,
+    as a DataFrame of Seq, TableName, RowKey, Op and ChangedAt.
+    """
+    clauses, params = [], {}
+    for i, (table, seq) in enumerate(cursors.items()):
+        clauses.append(f"(TableName = :table_{i} AND Seq > :seq_{i})")
+        params[f"table_{i}"], params[f"seq_{i}"] = table, seq
+    query = text(f"""
+        SELECT Seq, TableName, RowKey, Op, ChangedAt FROM ChangeLog
+        WHERE {" OR ".join(clauses)}
+        ORDER BY Seq
+    """)
+    return pd.read_sql(query, conn, params=params)
+
+
+def advance(cursors, changes, applied=frozenset(), settled=0, now=None):
+    """
+    Takes in the entries changes_since returned for the cursors; returns
+    (cursors, applied). Every cursor moves up to the newest entry that has
+    settled, or to `settled` (from position, read before the entries): all
+    entries numbered below it are visible by now, so none can be missed.
+    `applied` holds the Seqs of the entries after the cursors, which
+    changes_since returns again until they settle too; the applied Seqs
+    passed in are kept unless they were among the entries (they may belong
+    to other tables).
+    """
+    if changes.empty:
+        return {table: max(seq, settled) for table, seq in cursors.items()}, frozenset(applied)
+    changed_at = dialects.parse_datetimes(changes[["ChangedAt"]].copy(), "ChangedAt")["ChangedAt"]
+    settled_now = changes["Seq"][changed_at <= _horizon(now)]
+    bound = max(int(settled_now.max()) if len(settled_now) else 0, settled)
+    cursors = {table: max(seq, bound) for table, seq in cursors.items()}
+    seqs = changes["Seq"].astype(int)
+    pending = seqs[seqs > changes["TableName"].map(cursors)]
+    return cursors, (frozenset(applied) - set(seqs)) | set(pending)
+
+
+def unapplied(changes, applied):
+    """The entries not applied yet."""
+    return changes[~changes["Seq"].isin(applied)] if applied else changes
+
+
+def _typed_keys(keys, column):
+    # RowKey is text; compare in the column's own type
+    if pd.api.types.is_integer_dtype(column):
+        return [int(key) for key in keys]
+    return list(keys)
+
+
+def _align_categories(df, fresh):
+    """Gives the categorical columns of both frames the same categories, so they can be combined."""
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            new = pd.Index(fresh[column].dropna().unique()).difference(df[column].cat.categories)
+            if len(new):
+                df[column] = df[column].cat.add_categories(new)
+            fresh[column] = fresh[column].astype(df[column].dtype)
+
+
+def _merge(df, changed, fresh, key, order_by):
+    """df with the `changed` rows replaced by `fresh`, in order_by order. df itself is left alone."""
+    positions = np.flatnonzero(changed)
+    fresh = fresh[list(df.columns)].copy()
+    result = df.copy()
+    _align_categories(result, fresh)
+    old_keys = df[key].iloc[positions]
+    if len(fresh) == len(positions) and set(fresh[key]) == set(old_keys):
+        fresh = fresh.set_index(key, drop=False).loc[old_keys.to_numpy()].reset_index(drop=True)
+        old = df.iloc[positions].reset_index(drop=True)
+        if all(old[column].equals(fresh[column]) for column in order_by):
+            # The same rows in the same places: overwrite the columns that changed
+            for column in df.columns:
+                if not old[column].equals(fresh[column]):
+                    values = result[column].copy()
+                    values.iloc[positions] = fresh[column].to_numpy()
+                    result[column] = values
+            return result
+    kept = result[~changed]
+    if fresh.empty:  # Only deletions; concatenating an empty frame could change the dtypes
+        return kept.reset_index(drop=True)
+    merged = pd.concat([kept, fresh], ignore_index=True) if len(kept) else fresh
+    return merged.sort_values(order_by, kind="stable").reset_index(drop=True)
+
+
+class LiveView:
+    """
+    A query result kept current from the change log.
+
+    query    SQL with a {where} placeholder, where the filter on changed keys goes
+    key      the column that identifies a row of the result
+    links    {table: (column, SQL expression)}: which rows a changed key of
+             each logged table touches, in the frame and in the query
+    order_by the columns the query sorts by
+    prepare  turns a freshly read frame into the kept form (dtypes, labels)
+    """
+
+    def __init__(self, query, key, links, order_by, prepare=None):
+        self.query = query
+        self.key = key
+        self.links = links
+        self.order_by = list(order_by)
+        self.prepare = prepare or (lambda df: df)
+        self._lock = threading.Lock()
+        self._states = {}  # engine -> (frame, cursors, applied)
+        _views.add(self)
+
+    def _read(self, conn, where="", params=None):
+        query = text(self.query.format(where=where))
+        if params:
+            query = query.bindparams(*[bindparam(name, expanding=True) for name in params])
+        return self.prepare(pd.read_sql(query, conn, params=params))
+
+    def load(self, conn):
+        """Reads the whole result; returns (frame, cursors, applied)."""
+        watch(conn.engine)
+        # Log position first: a change committed in between is then applied again, never missed
+        cursors, applied = start(conn, tuple(self.links))
+        return self._read(conn), cursors, applied
+
+    def refresh(self, conn, df, cursors, applied=frozenset()):
+        """
+        Catches a frame up with the log; returns (frame, cursors, applied)
+        (see advance). The frame is the same object when nothing it shows
+        has changed.
+        """
+        own = {table: cursors.get(table, 0) for table in self.links}
+        first, settled = position(conn)
+        # Idle for longer than the log is kept: what it missed may be gone
+        stale = pruned_past(own, first)
+        logged = changes_since(conn, own)
+        own, now_applied = advance(own, logged, applied, settled)
+        changes = unapplied(logged, applied)
+        if changes.empty and not stale:
+            return df, {**cursors, **own}, now_applied
+        keys = {table: group["RowKey"].unique() for table, group in changes.groupby("TableName")}
+        if stale or sum(len(table_keys) for table_keys in keys.values()) > MAX_DELTA_KEYS:
+            df, own, own_applied = self.load(conn)
+            return df, {**cursors, **own}, (now_applied - set(logged["Seq"])) | own_applied
+
+        masks, clauses, params = [], [], {}
+        for i, (table, table_keys) in enumerate(keys.items()):
+            column, expression = self.links[table]
+            table_keys = _typed_keys(table_keys, df[column])
+            masks.append(df[column].isin(table_keys).to_numpy())
+            clauses.append(f"{expression} IN :keys_{i}")
+            params[f"keys_{i}"] = table_keys
+        fresh = self._read(conn, "WHERE " + " OR ".join(clauses), params)
+        merged = _merge(df, np.logical_or.reduce(masks), fresh, self.key, self.order_by)
+        return merged, {**cursors, **own}, now_applied
+
+    def current(self, engine):
+        """The engine's frame, loaded or caught up first. Shared: copy it before modifying."""
+        with self._lock:
+            state = self._states.get(engine)
+            with engine.connect() as conn:
+                if state is None:
+                    state = self.load(conn)
+                else:
+                    state = self.refresh(conn, *state)
+            self._states[engine] = state
+            return state[0]
+
+    def forget(self, engine):
+        with self._lock:
+            self._states.pop(engine, None)
+
+
+_views = weakref.WeakSet()
+
+
+def forget(engine):
+    """Drops every view's frame for an engine, e.g. when its pool is disposed."""
+    _watched.discard(engine)
+    for view in list(_views):
+        view.forget(engine)
+
+
+# --- Pruning ---
+
+def prune(engine, now=None):
+    """
+    Deletes the entries older than RETENTION_HOURS, PRUNE_BATCH at a time in
+    short transactions, and returns how many went. The newest entry stays.
+    """
+    cutoff = (now or datetime.now()) - timedelta(hours=RETENTION_HOURS)
+    with engine.connect() as conn:
+        first, _ = position(conn)
+        keep = conn.execute(FIRST_KEPT_QUERY, {"cutoff": cutoff}).scalar() or 0
+    deleted = 0
+    for low in range(first, keep, PRUNE_BATCH):
+        with engine.begin() as conn:
+            deleted += conn.execute(PRUNE_QUERY, {"low": low, "high": min(low + PRUNE_BATCH, keep)}).rowcount
+    return deleted
+
+
+_watched = weakref.WeakSet()  # Engines whose log is pruned
+_pruner_lock = threading.Lock()
+_pruner = None
+
+
+def watch(engine):
+    """Prunes the engine's log every PRUNE_SECONDS from now on, in a background thread."""
+    global _pruner
+    _watched.add(engine)
+    with _pruner_lock:
+        if _pruner is None:
+            _pruner = threading.Thread(target=_run_pruner, name="change-log-pruner", daemon=True)
+            _pruner.start()
+
+
+def _run_pruner():
+    while True:
+        for engine in list(_watched):
+            try:
+                prune(engine)
+            except Exception:
+                pass  # Locked or unreachable: the next round tries again
+        time.sleep(PRUNE_SECONDS)
@@ -0,0 +1,106 @@
+"""
+Daily circulation rollups behind the Analytics page.
+
+BookDailyStats and FriendDailyStats hold, per day and book (or friend), how
+many loans started, how many were returned, how many days those returned
+loans lasted in total and how many came back late. Write.py adds to them in
+the same transaction as the checkout or return, so the Analytics page sums
+a few rows per day it shows instead of grouping every loan ever made.
+
+rebuild() recomputes both tables from Loans and LoanHistory: after a bulk
+load, for a database that had loans before the rollups existed, or to
+repair them.
+
+Usage:
+    python circulation_rollups.py       # rebuilds the rollups; prompts for the MySQL password
+"""
+import getpass
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import dialects
+import library_connection
+
+COUNTERS = ("Checkouts", "Returned", "LoanDays", "LateReturns")
+# Rollup table -> the column it is kept per, next to Day
+ROLLUPS = {"BookDailyStats": "ISBN", "FriendDailyStats": "FriendID"}
+
+
+def day_key(value):
+    """
+    A Day value as 'YYYY-MM-DD' text. SQLite keeps DATE columns as that
+    text, which a bound date (midnight, see library_connection) would not
+    equal; MySQL reads it as the date it is.
+    """
+    return pd.Timestamp(value).date().isoformat()
+
+
+def _add(conn, events):
+    """Adds the events' counters to both rollups, summed per row first so each row is written once."""
+    for table, key in ROLLUPS.items():
+        totals = {}
+        for event in events:
+            counters = totals.setdefault((event["Day"], event[key]), dict.fromkeys(COUNTERS, 0))
+            for name in COUNTERS:
+                counters[name] += event.get(name, 0)
+        # In key order, so concurrent transactions lock shared rows in the same order
+        rows = [{"Day": day, key: value, **counters} for (day, value), counters in sorted(totals.items())]
+        if rows:
+            conn.execute(text(dialects.upsert_add(conn.dialect.name, table, ("Day", key), COUNTERS)), rows)
+
+
+def record_checkouts(conn, friend_id, isbns, borrow_date):
+    """Counts new loans of the books to the friend, on the day they were borrowed."""
+    day = day_key(borrow_date)
+    _add(conn, [{"Day": day, "ISBN": isbn, "FriendID": friend_id, "Checkouts": 1} for isbn in isbns])
+
+
+def record_returns(conn, loans, returned_at):
+    """
+    Counts returns of (ISBN, FriendID, BorrowDate, DueDate) loans on the day
+    they came back. A loan is late when it comes back after its due day,
+    the same way a loan is overdue once its DueDate is before today.
+    """
+    day = pd.Timestamp(returned_at).date()
+    _add(conn, [{
+        "Day": day.isoformat(), "ISBN": isbn, "FriendID": friend_id, "Returned": 1,
+        "LoanDays": (day - pd.Timestamp(borrow_date).date()).days,
+        "LateReturns": int(day > pd.Timestamp(due_date).date()),
+    } for isbn, friend_id, borrow_date, due_date in loans])
+
+
+REBUILD_QUERY = """
+    INSERT INTO {table} (Day, {key}, Checkouts, Returned, LoanDays, LateReturns)
+    SELECT Day, {key}, SUM(Checkouts), SUM(Returned), SUM(LoanDays), SUM(LateReturns)
+    FROM (
+        SELECT DATE(BorrowDate) AS Day, {key}, 1 AS Checkouts, 0 AS Returned, 0 AS LoanDays, 0 AS LateReturns
+        FROM Loans
+        UNION ALL
+        SELECT DATE(BorrowDate), {key}, 1, 0, 0, 0 FROM LoanHistory
+        UNION ALL
+        SELECT DATE(ReturnDate), {key}, 0, 1, {loan_days}, CASE WHEN DATE(ReturnDate) > DATE(DueDate) THEN 1 ELSE 0 END
+        FROM LoanHistory
+    ) Events
+    WHERE {key} IS NOT NULL
+    GROUP BY Day, {key}
+"""
+
+
+def rebuild(conn):
+    """Recomputes both rollups from Loans and LoanHistory inside the caller's transaction."""
+    loan_days = dialects.days_between(conn.dialect.name, "BorrowDate", "ReturnDate")
+    for table, key in ROLLUPS.items():
+        conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(text(REBUILD_QUERY.format(table=table, key=key, loan_days=loan_days)))
+
+
+if __name__ == "__main__":
+    password = getpass.getpass("MySQL Password: ")
+    engine = create_engine(library_connection.mysql_connection_string(password))
+    try:
+        with engine.begin() as conn:
+            rebuild(conn)
+        print("Circulation rollups rebuilt.")
+    finally:
+        engine.dispose()
@@ -0,0 +1,407 @@
+"""
+Synthetic Lianes_Library data for load tests and benchmarks.
+
+Rows are produced a column at a time with NumPy from one seed, so the same
+arguments always give the same database: hyphenated ISBN-13s with valid
+check digits, skewed genre and shelf distributions, 1-4 contacts per
+friend, and loans spread over overdue, reminder-today and active states
+like the seed script, plus a few years of returned loans in LoanHistory
+and the circulation rollups computed from both.
+Books.IsInStock, Friends.MaxLoans and LibraryStats
+are derived while generating, so no fix-up UPDATE scans the loaded tables.
+
+The loader drops and recreates the tables without their secondary indexes,
+streams the rows in chunks (LOAD DATA LOCAL INFILE on MySQL, falling back
+to multi-row INSERTs; executemany on SQLite) and builds the indexes once
+the data is in.
+
+Usage:
+    python datagen.py --books 1000000 --sqlite library_1m.db
+    python datagen.py --books 1000000 --mysql-schema lianes_library_bench   # prompts for the password
+"""
+import argparse
+import csv
+import getpass
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import circulation_rollups
+import dialects
+import library_connection
+import migrations
+import search_index
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Lianes_Library.sql")
+CHUNK_SIZE = 100_000
+TABLES = ("Contacts", "Loans", "LoanHistory", "BookDailyStats", "FriendDailyStats", "Friends", "LibraryStats", "TableVersions", "ChangeLog", "Books")
+
+GENRES = np.array(["Fiction", "Fantasy", "Sci-Fi", "Dystopian", "History", "Memoir", "Psychology",
+                   "Programming", "Business", "Self-help", "Productivity", "Poetry"])
+CONDITIONS = np.array(["Excellent", "Good", "Fair"])
+CONDITION_WEIGHTS = [0.3, 0.5, 0.2]
+SHELVES = np.array([f"{letter}{number}" for letter in "ABCDEFGH" for number in (1, 2, 3)])
+FIRST_NAMES = np.array(["Alice", "Bob", "Clara", "David", "Eva", "Frank", "Grace", "Henry", "Ivy", "Jack",
+                        "Kara", "Liam", "Mia", "Noah", "Olivia", "Paul", "Quinn", "Rosa", "Sam", "Tina",
+                        "Uma", "Vince", "Wendy", "Xander", "Yara", "Zane"])
+LAST_NAMES = np.array(["Smith", "Brown", "Jones", "Lee", "Kim", "Wong", "Moore", "White", "Clark", "Hall",
+                       "Young", "Scott", "Adams", "Evans", "Turner", "Collins", "Parker", "Bell", "Reed",
+                       "Foster", "Gray", "Morgan", "Cook", "Hughes"])
+CITIES = np.array(["Berlin", "Hamburg", "Munich", "Cologne", "Frankfurt", "Leipzig"])
+WORDS = np.array(["Shadow", "River", "Garden", "Winter", "Silent", "Empire", "Code", "Habit", "Ocean", "Night",
+                  "Glass", "Stone", "Little", "Last", "Hidden", "Golden", "Road", "House", "Storm", "Letters",
+                  "Atomic", "Deep", "Brave", "Lean", "Power", "Dune", "Martian", "World", "Work", "Mind"])
+CONTACT_TYPES = np.array(["email", "phone", "street", "city"])
+
+# Share of loans per state (overdue, reminder today, active)
+LOAN_STATES = [0.10, 0.05, 0.85]
+LOAN_DAYS = 14
+REMINDER_DAYS = 11
+# Returned loans go back this far (LoanHistory)
+HISTORY_DAYS = 3 * 365
+
+
+def _zipf_weights(n, s=1.1):
+    """A few popular values and a long tail, like real genres and shelves."""
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+# --- Generators (one DataFrame per chunk) ---
+
+def isbn13(numbers):
+    """Hyphenated ISBN-13s (17 characters) with valid check digits for an array of book numbers."""
+    numbers = np.asarray(numbers, dtype=np.int64)
+    digits = np.stack([(numbers // 10 ** (8 - j)) % 10 for j in range(9)], axis=1)
+    # 9-7-8 contributes 9*1 + 7*3 + 8*1 = 38; the next digits are weighted 3, 1, 3, ...
+    check = (10 - (38 + digits @ np.array([3, 1, 3, 1, 3, 1, 3, 1, 3])) % 10) % 10
+    # Assemble "978-d-dddd-dddd-c" as ASCII bytes, then decode the whole column at once
+    chars = np.empty((len(numbers), 17), dtype=np.uint8)
+    chars[:, :3] = np.frombuffer(b"978", dtype=np.uint8)
+    chars[:, [3, 5, 10, 15]] = ord("-")
+    chars[:, [4, 6, 7, 8, 9, 11, 12, 13, 14]] = digits + ord("0")
+    chars[:, 16] = check + ord("0")
+    return chars.view("S17").ravel().astype("U17")
+
+
+def generate_books(rng, start, stop, on_loan):
+    """Books start..stop-1; on_loan is the boolean loan mask of the whole catalog."""
+    size = stop - start
+    numbers = np.arange(start, stop)
+    titles = pd.Series(WORDS[rng.integers(0, len(WORDS), size)]) + " " + WORDS[rng.integers(0, len(WORDS), size)]
+    authors = pd.Series(FIRST_NAMES[rng.integers(0, len(FIRST_NAMES), size)]) + " " + \
+        LAST_NAMES[rng.integers(0, len(LAST_NAMES), size)]
+    return pd.DataFrame({
+        "ISBN": isbn13(numbers),
+        "Title": (titles + " " + pd.Series(numbers).astype(str)).to_numpy(),
+        "Author": authors.to_numpy(),
+        "Genre": rng.choice(GENRES, size, p=_zipf_weights(len(GENRES))),
+        "BookCondition": rng.choice(CONDITIONS, size, p=CONDITION_WEIGHTS),
+        "IsInStock": (~on_loan[start:stop]).astype(np.int8),
+        "ShelfLocation": rng.choice(SHELVES, size, p=_zipf_weights(len(SHELVES), 0.8)),
+        "ShelfRow": rng.integers(1, 6, size),
+    })
+
+
+def generate_friends(rng, count, loans_per_friend):
+    """FriendIDs are 1..count in insert order; MaxLoans is what is left of a 3-7 quota."""
+    quota = np.maximum(rng.integers(3, 8, count), loans_per_friend)
+    return pd.DataFrame({
+        "FriendID": np.arange(1, count + 1),
+        "FName": rng.choice(FIRST_NAMES, count),
+        "LName": rng.choice(LAST_NAMES, count),
+        "MaxLoans": quota - loans_per_friend,
+    })
+
+
+def generate_contacts(rng, friends):
+    """1-4 contacts per friend, always starting with an email address."""
+    per_friend = rng.integers(1, 5, len(friends))
+    friend_index = np.repeat(np.arange(len(friends)), per_friend)
+    # Position of each contact within its friend's group: 0 = email, 1 = phone, ...
+    position = np.arange(len(friend_index)) - np.repeat(np.cumsum(per_friend) - per_friend, per_friend)
+    ids = friends["FriendID"].to_numpy()[friend_index]
+    id_text = pd.Series(ids).astype(str)
+    email = (pd.Series(friends["FName"].to_numpy()[friend_index]).str.lower() + "." +
+             pd.Series(friends["LName"].to_numpy()[friend_index]).str.lower() + id_text + "@example.com")
+    phone = pd.Series(rng.integers(1_000_000_000, 10_000_000_000, len(ids))).astype(str)
+    street = "Main St " + id_text
+    city = pd.Series(rng.choice(CITIES, len(ids)))
+    contact = np.select([position == 0, position == 1, position == 2], [email, phone, street], city)
+    return pd.DataFrame({"FriendID": ids, "type": CONTACT_TYPES[position], "contact": contact})
+
+
+def generate_loans(rng, book_numbers, friend_ids, now):
+    """One loan per book number, in overdue / reminder-today / active states."""
+    size = len(book_numbers)
+    state = rng.choice(3, size, p=LOAN_STATES)
+    days_ago = np.select(
+        [state == 0, state == 1],
+        [rng.integers(LOAN_DAYS + 1, 60, size), np.full(size, REMINDER_DAYS)],
+        rng.integers(0, REMINDER_DAYS, size),
+    )
+    borrowed = np.datetime64(now.replace(microsecond=0), "s") - days_ago.astype("timedelta64[D]")
+    return pd.DataFrame({
+        "BorrowDate": borrowed,
+        "DueDate": borrowed + np.timedelta64(LOAN_DAYS, "D"),
+        "ReturnReminder": borrowed + np.timedelta64(REMINDER_DAYS, "D"),
+        "ISBN": isbn13(book_numbers),
+        "FriendID": friend_ids,
+    })
+
+
+def generate_history(rng, ids, total, books, friends, now):
+    """
+    Returned loans `ids` of 1..total: borrowed in LoanID order, evenly over
+    the last HISTORY_DAYS, and returned up to four weeks later (never after now).
+    """
+    now = np.datetime64(now.replace(microsecond=0), "s")
+    span = np.timedelta64(HISTORY_DAYS * 86_400, "s")
+    borrowed = now - span + ((ids - 1) * (HISTORY_DAYS * 86_400 // total)).astype("timedelta64[s]")
+    returned = borrowed + rng.integers(3_600, 2 * LOAN_DAYS * 86_400, len(ids)).astype("timedelta64[s]")
+    return pd.DataFrame({
+        "LoanID": ids,
+        "BorrowDate": borrowed,
+        "DueDate": borrowed + np.timedelta64(LOAN_DAYS, "D"),
+        "ReturnDate": np.minimum(returned, now - np.timedelta64(60, "s")),
+        "ISBN": isbn13(rng.integers(0, books, len(ids))),
+        "FriendID": rng.integers(1, friends + 1, len(ids)),
+    })
+
+
+# --- Schema with deferred indexes ---
+
+def schema_statements():
+    """(CREATE TABLE statements without FULLTEXT, CREATE INDEX statements) of Lianes_Library.sql."""
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        ddl = f.read().split("-- === BOOKS & STORAGE ===")[0]
+    ddl = re.sub(r"^(DROP SCHEMA|CREATE SCHEMA|USE)[^\n]*$", "", ddl, flags=re.M)
+    ddl = re.sub(r"^\s*--[^\n]*$", "", ddl, flags=re.M)
+    ddl = re.sub(r",\s*FULLTEXT INDEX[^\n]*", "", ddl)  # Built after the load by search_index
+    statements = [s.strip() for s in ddl.split(";") if s.strip()]
+    tables = [s for s in statements if s.upper().startswith("CREATE TABLE")]
+    indexes = [s for s in statements if s.upper().startswith("CREATE INDEX")]
+    return tables, indexes
+
+
+def _create_tables(engine, tables):
+    with engine.begin() as conn:
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            conn.execute(text("DROP TABLE IF EXISTS Books_fts"))
+        else:
+            conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+        for table in TABLES + ("SchemaMigrations",):
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        for statement in tables:
+            if sqlite:
+                statement = dialects.sqlite_script(statement)
+            conn.execute(text(statement))
+        if not sqlite:
+            conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+
+
+def _create_indexes(engine, indexes):
+    with engine.begin() as conn:
+        for statement in indexes:
+            conn.execute(text(statement))
+        search_index.ensure_search_index(conn)
+
+
+def _record_migrations(engine):
+    """The generated schema is current, so mark every migration as applied."""
+    migrations.applied_versions(engine)  # Creates SchemaMigrations
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO SchemaMigrations (Version, Name, AppliedAt) VALUES (:version, :name, :applied_at)"),
+            [{"version": v, "name": n, "applied_at": datetime.now()} for v, n, _ in migrations.MIGRATIONS],
+        )
+
+
+# --- Bulk loading ---
+
+def _dbapi_rows(frame):
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return list(zip(*(frame[column].tolist() for column in frame.columns)))
+
+
+class _Loader:
+    """Writes DataFrames over one raw DBAPI connection, a transaction per chunk."""
+
+    def __init__(self, engine):
+        self.dialect = engine.dialect.name
+        self.connection = engine.raw_connection()
+        self.cursor = self.connection.cursor()
+        self.use_infile = self.dialect == "mysql"
+        if self.dialect == "sqlite":
+            self.cursor.execute("PRAGMA synchronous")
+            self.synchronous = self.cursor.fetchone()[0]
+            self.cursor.execute("PRAGMA synchronous = OFF")
+        else:
+            # Keys are generated consistent; skip the per-row checks while loading
+            self.cursor.execute("SET FOREIGN_KEY_CHECKS = 0, UNIQUE_CHECKS = 0")
+
+    def write(self, table, frame):
+        if self.use_infile:
+            try:
+                self._load_data_infile(table, frame)
+                return
+            except Exception:
+                # local_infile disabled on the client or the server: use multi-row INSERTs
+                self.connection.rollback()
+                self.use_infile = False
+        placeholder = "?" if self.dialect == "sqlite" else "%s"
+        columns = ", ".join(f"`{c}`" if self.dialect == "mysql" else c for c in frame.columns)
+        values = ", ".join([placeholder] * len(frame.columns))
+        # pymysql turns executemany of an INSERT ... VALUES into multi-row statements
+        self.cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({values})", _dbapi_rows(frame))
+        self.connection.commit()
+
+    def _load_data_infile(self, table, frame):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="", encoding="utf-8") as f:
+            path = f.name
+            frame.to_csv(f, index=False, header=False, quoting=csv.QUOTE_MINIMAL, lineterminator="\n",
+                         date_format="%Y-%m-%d %H:%M:%S")
+        try:
+            columns = ", ".join(f"`{c}`" for c in frame.columns)
+            self.cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 "
+                f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' ({columns})",
+                (path,),
+            )
+            self.connection.commit()
+        finally:
+            os.remove(path)
+
+    def close(self):
+        if self.dialect == "sqlite":
+            self.cursor.execute(f"PRAGMA synchronous = {self.synchronous}")
+        else:
+            self.cursor.execute("SET FOREIGN_KEY_CHECKS = 1, UNIQUE_CHECKS = 1")
+        self.cursor.close()
+        self.connection.close()
+
+
+def load(engine, books, friends=None, loans=None, seed=0, chunk_size=CHUNK_SIZE, log=print, history=None):
+    """
+    Replaces the library tables with generated data and returns the row
+    counts per table. friends defaults to books / 10, loans to books / 5,
+    history (returned loans) to the number of loans.
+    """
+    friends = max(books // 10, 1) if friends is None else friends
+    loans = min(books // 5 if loans is None else loans, books)
+    history = loans if history is None else history
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+
+    tables, indexes = schema_statements()
+    _create_tables(engine, tables)
+
+    # Which books are on loan, and who has them, is decided up front
+    loaned_books = np.sort(rng.choice(books, loans, replace=False)) if loans else np.array([], dtype=np.int64)
+    borrowers = rng.integers(1, friends + 1, loans)
+    on_loan = np.zeros(books, dtype=bool)
+    on_loan[loaned_books] = True
+    loans_per_friend = np.bincount(borrowers, minlength=friends + 1)[1:]
+
+    counts = {}
+    loader = _Loader(engine)
+    try:
+        started = time.perf_counter()
+        for start in range(0, books, chunk_size):
+            loader.write("Books", generate_books(rng, start, min(start + chunk_size, books), on_loan))
+        counts["Books"] = books
+        log(f"Books: {books} rows in {time.perf_counter() - started:.1f} s")
+
+        started = time.perf_counter()
+        friend_frame = generate_friends(rng, friends, loans_per_friend)
+        contact_total = 0
+        for start in range(0, friends, chunk_size):
+            chunk = friend_frame.iloc[start:start + chunk_size]
+            loader.write("Friends", chunk)
+            contacts = generate_contacts(rng, chunk)
+            loader.write("Contacts", contacts)
+            contact_total += len(contacts)
+        counts["Friends"], counts["Contacts"] = friends, contact_total
+        log(f"Friends/Contacts: {friends}/{contact_total} rows in {time.perf_counter() - started:.1f} s")
+
+        started = time.perf_counter()
+        order = rng.permutation(loans)  # Loans are not made in ISBN order
+        for start in range(0, loans, chunk_size):
+            picked = order[start:start + chunk_size]
+            frame = generate_loans(rng, loaned_books[picked], borrowers[picked], now)
+            # Active loans were made after the returned ones, so their LoanIDs come after the history's
+            frame.insert(0, "LoanID", history + 1 + np.arange(start, start + len(picked)))
+            loader.write("Loans", frame)
+        counts["Loans"] = loans
+        log(f"Loans: {loans} rows in {time.perf_counter() - started:.1f} s")
+
+        started = time.perf_counter()
+        for start in range(0, history, chunk_size):
+            ids = np.arange(start + 1, min(start + chunk_size, history) + 1)
+            loader.write("LoanHistory", generate_history(rng, ids, history, books, friends, now))
+        counts["LoanHistory"] = history
+        log(f"LoanHistory: {history} rows in {time.perf_counter() - started:.1f} s")
+
+        loader.write("LibraryStats", pd.DataFrame({"StatsID": [1], "TotalBooks": [books], "BorrowedBooks": [loans]}))
+        # Start the counters at the load time, so a catalog snapshot taken of an
+        # earlier load in the same process is read again rather than patched
+        # from a ChangeLog that started over
+        loader.write("TableVersions", pd.DataFrame({"TableName": list(migrations.VERSIONED_TABLES),
+                                                    "Version": int(time.time())}))
+    finally:
+        loader.close()
+
+    started = time.perf_counter()
+    _create_indexes(engine, indexes)
+    _record_migrations(engine)
+    log(f"Indexes: {len(indexes)} + full-text in {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        circulation_rollups.rebuild(conn)
+    log(f"Circulation rollups in {time.perf_counter() - started:.1f} s")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill a database with generated Lianes_Library data.")
+    parser.add_argument("--books", type=int, required=True)
+    parser.add_argument("--friends", type=int, help="default: books / 10")
+    parser.add_argument("--loans", type=int, help="default: books / 5")
+    parser.add_argument("--history", type=int, help="returned loans; default: as many as loans")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--sqlite", metavar="PATH", help="SQLite database file (created if missing)")
+    target.add_argument("--mysql-schema", metavar="NAME",
+                        help="MySQL schema to (re)create the tables in; never the live Lianes_Library")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        engine = library_connection.create_sqlite_engine(args.sqlite)
+    else:
+        if args.mysql_schema.lower() == "lianes_library":
+            parser.error("refusing to replace the tables of the live Lianes_Library schema")
+        password = getpass.getpass("MySQL Password: ")
+        server_url = library_connection.mysql_connection_string(password).rsplit("/", 1)[0]
+        server = create_engine(server_url)
+        with server.begin() as conn:
+            conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {args.mysql_schema}"))
+        server.dispose()
+        engine = create_engine(f"{server_url}/{args.mysql_schema}", connect_args={"local_infile": True})
+
+    try:
+        started = time.perf_counter()
+        counts = load(engine, args.books, args.friends, args.loans, args.seed, args.chunk_size, history=args.history)
+        print(f"Loaded {sum(counts.values())} rows in {time.perf_counter() - started:.1f} s.")
+    finally:
+        engine.dispose()
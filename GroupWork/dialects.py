@@ -0,0 +1,102 @@
+"""
+The few SQL fragments that differ between MySQL and the embedded SQLite backend.
+
+Queries stay where they are (Read.py, Write.py, ...); when a query needs
+something dialect-specific it takes the fragment from here, keyed by
+engine.dialect.name, so the rest of the SQL is shared by both backends.
+"""
+import re
+
+import pandas as pd
+
+# A LIKE escape character that means the same in MySQL and SQLite string
+# literals (a backslash would have to be written differently in each)
+LIKE_ESCAPE = "!"
+
+
+def concat(dialect_name, *parts):
+    """CONCAT(a, b, ...) on MySQL, a || b || ... on SQLite (CONCAT needs SQLite 3.44+)."""
+    if dialect_name == "sqlite":
+        return " || ".join(parts)
+    return f"CONCAT({', '.join(parts)})"
+
+
+def like(column, param):
+    """`column LIKE :param` with the shared escape character."""
+    return f"{column} LIKE :{param} ESCAPE '{LIKE_ESCAPE}'"
+
+
+def escape_like(value):
+    """Makes %, _ and the escape character in user input match literally."""
+    return re.sub(r"([%_!])", r"!\1", value)
+
+
+def like_prefix(value):
+    return escape_like(value) + "%"
+
+
+def like_contains(value):
+    return "%" + escape_like(value) + "%"
+
+
+def days_between(dialect_name, start, end):
+    """Whole calendar days from the date of `start` to the date of `end`."""
+    if dialect_name == "sqlite":
+        return f"CAST(julianday(DATE({end})) - julianday(DATE({start})) AS INTEGER)"
+    return f"DATEDIFF({end}, {start})"
+
+
+def upsert_add(dialect_name, table, keys, counters):
+    """
+    An INSERT of one row that, when a row with the same keys exists, adds
+    its counters to that row instead: ON DUPLICATE KEY UPDATE on MySQL,
+    ON CONFLICT ... DO UPDATE on SQLite. Parameters are named after the columns.
+    """
+    columns = [*keys, *counters]
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})"
+    if dialect_name == "sqlite":
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in counters)
+        return f"{insert} ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    updates = ", ".join(f"{c} = {c} + VALUES({c})" for c in counters)
+    return f"{insert} ON DUPLICATE KEY UPDATE {updates}"
+
+
+def parse_datetimes(df, *columns):
+    """SQLite hands DATETIME columns back as text; make them Timestamps like MySQL's."""
+    for column in columns:
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], format="ISO8601")
+    return df
+
+
+# --- Errors worth retrying ---
+
+# InnoDB: lock wait timeout, deadlock (the transaction was rolled back)
+MYSQL_RETRYABLE_ERRORS = {1205, 1213}
+SQLITE_RETRYABLE_ERRORS = {"SQLITE_BUSY", "SQLITE_LOCKED"}
+
+
+def is_retryable(error):
+    """
+    True when a failed transaction only lost a lock race (a deadlock, a lock
+    timeout, a busy SQLite file) and running it again may well succeed.
+    """
+    orig = getattr(error, "orig", error)  # SQLAlchemy wraps the driver's exception
+    if getattr(orig, "sqlite_errorname", None) in SQLITE_RETRYABLE_ERRORS:
+        return True
+    return bool(getattr(orig, "args", None)) and orig.args[0] in MYSQL_RETRYABLE_ERRORS
+
+
+# --- Lianes_Library.sql on SQLite ---
+
+def sqlite_script(script):
+    """
+    Translates the MySQL schema/seed script for SQLite: no schema
+    statements, AUTOINCREMENT keys, no inline FULLTEXT index (the FTS5
+    table from search_index takes its place) and no partitioning (a range
+    on the leading primary key column reads just as little).
+    """
+    script = re.sub(r"^(DROP SCHEMA|CREATE SCHEMA|USE)[^\n]*$", "", script, flags=re.M | re.I)
+    script = re.sub(r"\bINT auto_increment PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT", script, flags=re.I)
+    script = re.sub(r"\s*PARTITION BY RANGE[^;]*", "", script, flags=re.I)
+    return re.sub(r",\s*FULLTEXT INDEX[^\n]*", "", script)
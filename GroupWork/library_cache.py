@@ -0,0 +1,202 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+# --- Process-wide read-through cache shared by every session ---
+# Each entry is tagged with the tables its query reads. Write.py evicts
+# only the tags a mutation touched, so a widget click that changes no data
+# is served without a single DB round trip.
+
+# Least recently used entries are dropped beyond this many, so lookups keyed
+# by what a user types (Read.lookup_*) or by paging cursors can't pile up.
+MAX_ENTRIES = int(os.environ.get("LIBRARY_CACHE_MAX_ENTRIES", 2000))
+
+_lock = threading.RLock()
+_entries = OrderedDict()  # key -> (expires_at, value, tables), least recently used first
+_tag_keys = {}      # table -> set of keys tagged with it
+_tag_generation = {}  # table -> number of times it has been invalidated
+_listeners = []     # callables told which tables were invalidated
+# Set by a cached call while it runs; skip_store() marks it as failed
+_failed = contextvars.ContextVar("library_cache_failed", default=None)
+
+
+def _copy(value):
+    """Pages mutate the frames they get back (e.g. add a 'display' column)."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, tuple):
+        # e.g. (page_df, next_cursor) from the keyset-paged reads
+        return tuple(_copy(v) for v in value)
+    return value
+
+
+def _make_key(engine, func, args, kwargs, per_day):
+    kwargs = {name: value for name, value in kwargs.items() if name != "engine"}
+    key = (repr(engine.url), func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+    if per_day:
+        key += (date.today(),)
+    hash(key)  # Raises TypeError for unhashable arguments
+    return key
+
+
+def _resolve_engine(kwargs):
+    """An explicit engine= argument wins over the session's engine (worker threads have no session)."""
+    return kwargs.get("engine") or st.session_state.get("engine")
+
+
+def _lookup(key, tables):
+    """Returns (hit, value, generations); generations are checked again by _store."""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+            _entries.move_to_end(key)
+            return True, _copy(entry[1]), None
+        return False, None, {t: _tag_generation.get(t, 0) for t in tables}
+
+
+def _store(key, value, generations, ttl):
+    with _lock:
+        # Don't store a result that a concurrent write has already made stale
+        if all(_tag_generation.get(t, 0) == g for t, g in generations.items()):
+            expires_at = time.monotonic() + ttl if ttl else None
+            _entries[key] = (expires_at, value, tuple(generations))
+            _entries.move_to_end(key)
+            for table in generations:
+                _tag_keys.setdefault(table, set()).add(key)
+            while len(_entries) > MAX_ENTRIES:
+                _evict(next(iter(_entries)))
+
+
+def skip_store():
+    """
+    Keeps the result of the cached call in progress out of the cache, e.g.
+    the empty frame a Read function returns after showing a failed query.
+    The cached calls around it are not stored either.
+    """
+    failed = _failed.get()
+    if failed is not None:
+        failed.append(True)
+
+
+def _begin_call():
+    return _failed.set([])
+
+
+def _end_call(token):
+    """Whether the call may be stored; a failure also counts for the enclosing cached call."""
+    failed = _failed.get()
+    _failed.reset(token)
+    if failed:
+        skip_store()
+    return not failed
+
+
+def _evict(key):
+    """Drops one entry and its tag references; call with _lock held."""
+    _, _, tables = _entries.pop(key)
+    for table in tables:
+        keys = _tag_keys.get(table)
+        if keys is not None:
+            keys.discard(key)
+
+
+def cached(*tables, ttl=None, per_day=False):
+    """
+    Caches the result of a Read function, tagged with the tables it reads.
+    ttl: optional lifetime in seconds for queries that depend on the clock.
+    per_day: adds today's date to the key for queries filtered on today's date.
+    Works for plain and async functions.
+    """
+    def decorator(func):
+        def prepare(args, kwargs):
+            engine = _resolve_engine(kwargs)
+            if engine is None:
+                return None
+            try:
+                return _make_key(engine, func, args, kwargs, per_day)
+            except TypeError:
+                return None
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = prepare(args, kwargs)
+                if key is None:
+                    return await func(*args, **kwargs)
+                hit, value, generations = _lookup(key, tables)
+                if hit:
+                    return value
+                token = _begin_call()
+                try:
+                    value = await func(*args, **kwargs)
+                finally:
+                    storable = _end_call(token)
+                if not storable:
+                    return value
+                _store(key, value, generations, ttl)
+                return _copy(value)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = prepare(args, kwargs)
+                if key is None:
+                    return func(*args, **kwargs)
+                hit, value, generations = _lookup(key, tables)
+                if hit:
+                    return value
+                token = _begin_call()
+                try:
+                    value = func(*args, **kwargs)
+                finally:
+                    storable = _end_call(token)
+                if not storable:
+                    return value
+                _store(key, value, generations, ttl)
+                return _copy(value)
+
+        wrapper.tables = tables
+        return wrapper
+    return decorator
+
+
+def add_listener(callback):
+    """
+    Calls callback(tables) after every invalidate(), so state kept outside
+    the cache (e.g. reminder_queue) goes stale with it. clear() passes None.
+    """
+    _listeners.append(callback)
+
+
+def _notify(tables):
+    for callback in _listeners:
+        callback(tables)
+
+
+def invalidate(*tables):
+    """Evicts every cached result that reads any of the given tables."""
+    with _lock:
+        for table in tables:
+            _tag_generation[table] = _tag_generation.get(table, 0) + 1
+            for key in _tag_keys.pop(table, set()):
+                _entries.pop(key, None)
+    _notify(tables)
+
+
+def clear():
+    """Evicts everything, e.g. after the schema was reloaded."""
+    with _lock:
+        for table in list(_tag_keys):
+            _tag_generation[table] = _tag_generation.get(table, 0) + 1
+        _entries.clear()
+        _tag_keys.clear()
+    _notify(None)
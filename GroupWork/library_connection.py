@@ -1,36 +1,283 @@
-from sqlalchemy import create_engine
+import hashlib
+import os
+import threading
+import weakref
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import StaticPool
 import streamlit as st
 
-def connect_to_db(password):
+import catalog_snapshot
+import change_feed
+import dialects
+import profiler
+import reminder_queue
+import search_index
+
+# --- Shared pool settings (override with environment variables) ---
+POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.environ.get("LIBRARY_DB_MAX_OVERFLOW", 10))
+POOL_RECYCLE = int(os.environ.get("LIBRARY_DB_POOL_RECYCLE", 1800))  # seconds
+POOL_TIMEOUT = int(os.environ.get("LIBRARY_DB_POOL_TIMEOUT", 30))  # seconds
+
+# --- Backend: "mysql" (server) or "sqlite" (embedded file, e.g. a single-desk kiosk or CI) ---
+BACKEND = os.environ.get("LIBRARY_DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("LIBRARY_SQLITE_PATH", "lianes_library.db")  # ":memory:" for a throwaway database
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Lianes_Library.sql")
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",      # Readers don't block the writer (file databases only)
+    "synchronous": "NORMAL",    # Safe with WAL, far fewer fsyncs than FULL
+    "foreign_keys": "ON",       # Enforce the REFERENCES clauses like InnoDB does
+    "busy_timeout": "5000",     # ms to wait for a lock instead of failing at once
+    "cache_size": "-65536",     # 64 MiB page cache
+    "temp_store": "MEMORY",
+    "mmap_size": "268435456",   # 256 MiB memory-mapped I/O
+}
+
+# --- Process-wide engine registry ---
+# One engine (and so one bounded pool) per DSN, shared by every browser
+# session that logged in with the same credentials.
+_registry_lock = threading.Lock()
+_engines = {}  # registry key -> {"engine": Engine, "sessions": int}
+_release_callbacks = []  # callables told which engine was disposed
+
+
+def _registry_key(connection_string):
+    # Never keep the plain-text password around as a dict key
+    return hashlib.sha256(connection_string.encode("utf-8")).hexdigest()
+
+
+def _sqlite_datetime(value):
+    # Loan dates live in DATETIME columns, which SQLite compares as text. Bind
+    # a date as midnight of that day, not 'YYYY-MM-DD' (which sorts before it)
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, date):
+        return f"{value.isoformat()} 00:00:00"
+    return value
+
+
+def _sqlite_row(parameters):
+    if isinstance(parameters, dict):
+        return {name: _sqlite_datetime(value) for name, value in parameters.items()}
+    return tuple(_sqlite_datetime(value) for value in parameters)
+
+
+def bind_sqlite_datetimes(conn, cursor, statement, parameters, context, executemany):
     """
-    Attempts to connect to the DB with the MySQL password.
-    Returns (engine, None) on success.
-    Returns (None, error_message) on failure.
+    before_cursor_execute hook (retval=True) of the app's SQLite engines:
+    dates and datetimes go in as full DATETIME text. Done per engine rather
+    than with sqlite3.register_adapter, which would change every sqlite3
+    connection in the process.
     """
+    if executemany:
+        return statement, [_sqlite_row(row) for row in parameters]
+    return statement, _sqlite_row(parameters)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def _create_engine(connection_string):
+    if connection_string.startswith("sqlite"):
+        in_memory = connection_string in ("sqlite://", "sqlite:///:memory:")
+        engine = create_engine(
+            connection_string,
+            # One shared connection keeps an in-memory database alive; files get a normal pool
+            poolclass=StaticPool if in_memory else None,
+            connect_args={"check_same_thread": False, "timeout": 5},
+        )
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        event.listen(engine, "before_cursor_execute", bind_sqlite_datetimes, retval=True)
+        return profiler.instrument(engine)
+
+    return profiler.instrument(create_engine(
+        connection_string,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_recycle=POOL_RECYCLE,
+        pool_timeout=POOL_TIMEOUT,
+        pool_pre_ping=True,
+        connect_args={'connect_timeout': 5},
+    ))
+
+
+def shares_one_connection(engine):
+    """True for an in-memory SQLite engine: every caller uses its one StaticPool connection."""
+    return isinstance(engine.pool, StaticPool)
+
+
+def acquire_engine(connection_string):
+    """
+    Returns the shared engine for a DSN and counts one more session using it.
+    A new engine is verified with a single connection, which then stays in
+    the pool; later logins with the same credentials skip that round trip.
+    """
+    key = _registry_key(connection_string)
+    with _registry_lock:
+        entry = _engines.get(key)
+        if entry is not None:
+            entry["sessions"] += 1
+            return entry["engine"]
+
+    # Connect outside the lock so a slow or failing login doesn't block others
+    engine = _create_engine(connection_string)
+    try:
+        with engine.connect():
+            pass
+    except SQLAlchemyError:
+        engine.dispose()
+        raise
+
+    with _registry_lock:
+        entry = _engines.get(key)
+        if entry is None:
+            entry = _engines[key] = {"engine": engine, "sessions": 0}
+        else:
+            engine.dispose()  # Another session registered it meanwhile
+        entry["sessions"] += 1
+        return entry["engine"]
+
+
+def release_engine(engine):
+    """Counts one session less; the pool is disposed when nobody uses it."""
+    with _registry_lock:
+        for key, entry in _engines.items():
+            if entry["engine"] is engine:
+                entry["sessions"] -= 1
+                if entry["sessions"] > 0:
+                    return
+                del _engines[key]
+                break
+        else:
+            return
+    # Outside the lock: the callbacks may wait for other threads
+    forget_engine_state(engine)
+    for callback in _release_callbacks:
+        callback(engine)
+    engine.dispose()
+
+
+def add_release_callback(callback):
+    """
+    Calls callback(engine) when release_engine disposes an engine, so
+    resources made for it elsewhere (e.g. async_read's async twin) go too.
+    """
+    _release_callbacks.append(callback)
+
+
+def forget_engine_state(engine):
+    """Drops the engine's in-memory reminder queue, catalog snapshot and change-feed views."""
+    reminder_queue.forget(engine)
+    catalog_snapshot.forget(engine)
+    change_feed.forget(engine)
+
+
+def mysql_connection_string(password):
+    """Builds the DSN of the local Lianes_Library schema."""
     schema = "Lianes_Library"
     host = "127.0.0.1"
     user = "root"
     port = 3306
+    return f'mysql+pymysql://{user}:{password}@{host}:{port}/{schema}'
+
+
+def sqlite_connection_string(path):
+    """DSN of an embedded database file (or ":memory:")."""
+    return "sqlite://" if path in ("", ":memory:") else f"sqlite:///{path}"
+
 
+def create_sqlite_engine(path):
+    """A standalone SQLite engine with the app's pragmas (scripts, benchmarks)."""
+    return _create_engine(sqlite_connection_string(path))
+
+
+def initialize_sqlite(engine):
+    """
+    Creates the schema and the demo data of Lianes_Library.sql in an empty
+    SQLite database, plus the full-text index. Does nothing if Books exists.
+    """
+    with engine.connect() as conn:
+        if inspect(conn).has_table("Books"):
+            return False
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        script = dialects.sqlite_script(f.read())
+    raw = engine.raw_connection()
+    try:
+        raw.driver_connection.executescript(script)
+        raw.commit()
+    finally:
+        raw.close()
+    with engine.begin() as conn:
+        search_index.ensure_search_index(conn)
+    return True
+
+
+def connect_to_db(password):
+    """
+    Attempts to connect to the DB with the MySQL password.
+    Returns (engine, None) on success.
+    Returns (None, error_message) on failure.
+    """
     try:
-        connection_string = f'mysql+pymysql://{user}:{password}@{host}:{port}/{schema}'
-        engine = create_engine(connection_string, pool_pre_ping=True, connect_args={'connect_timeout': 5})
-        
-        # Test connection
-        connection = engine.connect()
-        connection.close()
-        
+        connection_string = mysql_connection_string(password)
+        engine = acquire_engine(connection_string)
         return engine, None  # Return the engine and no error (tuple unpacking)
 
     except SQLAlchemyError as e:
         error_message = "Connection failed: The password you entered is incorrect or the database is unavailable."
         return None, error_message # Return no engine and the error message (tuple unpacking)
 
+def connect_to_sqlite(path=SQLITE_PATH):
+    """
+    Opens (and on first use creates) the embedded database file.
+    Returns (engine, None) on success, (None, error_message) on failure.
+    """
+    try:
+        engine = acquire_engine(sqlite_connection_string(path))
+        initialize_sqlite(engine)
+        return engine, None
+    except (SQLAlchemyError, OSError) as e:
+        return None, f"Could not open the library database '{path}': {e}"
+
+class _Lease:
+    """
+    A browser session's hold on a shared engine. It is released once: on
+    Disconnect, when the session logs in again, or when Streamlit drops the
+    session's state after the browser tab went away.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._release = weakref.finalize(self, release_engine, engine)
+        self._release.atexit = False  # The process is going away anyway
+
+    def release(self):
+        self._release()
+
+
+def hold_engine(engine):
+    """Makes an engine from connect_to_db/connect_to_sqlite this session's engine."""
+    previous = st.session_state.get("engine_lease")
+    st.session_state.engine_lease = _Lease(engine)
+    st.session_state.engine = engine
+    if previous is not None:
+        previous.release()
+
+
 def disconnect_db():
-    """Disconnects the engine and resets the state."""
-    if st.session_state.get("engine"):
-        st.session_state.engine.dispose()
+    """Releases this session's hold on the shared engine and resets the state."""
+    lease = st.session_state.pop("engine_lease", None)
+    if lease is not None:
+        lease.release()
     st.session_state.engine = None
     st.session_state.db_status = "Disconnected"
-    st.switch_page("Login.py")
\ No newline at end of file
+    st.switch_page("Login.py")
@@ -0,0 +1,272 @@
+"""
+Versioned schema migrations for an existing Lianes_Library database.
+
+Each migration has a number, a name and a function that brings the schema
+forward. Migrations are idempotent (they check before they create), and the
+ones already applied are recorded in the SchemaMigrations table, so running
+the runner again only applies what is new.
+
+Usage:
+    python migrations.py            # prompts for the MySQL password
+"""
+import getpass
+import threading
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+
+import circulation_rollups
+import dialects
+import library_cache
+import library_connection
+import search_index
+
+
+# --- Helpers ---
+
+def _index_names(conn, table):
+    # Queried directly because the inspector skips expression-based indexes
+    if conn.dialect.name == "sqlite":
+        query = text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table")
+    else:
+        query = text("""
+            SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+        """)
+    return {row[0] for row in conn.execute(query, {"table": table})}
+
+
+def _create_index(conn, table, name, columns):
+    """CREATE INDEX unless an index with that name already exists."""
+    if name not in _index_names(conn, table):
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+def _has_table(conn, table):
+    return inspect(conn).has_table(table)
+
+
+# --- Migrations ---
+
+def _loan_date_indexes(conn):
+    """Overdue counts/lists filter on DueDate, daily reminders on ReturnReminder."""
+    _create_index(conn, "Loans", "ix_loans_due_date", ["DueDate"])
+    _create_index(conn, "Loans", "ix_loans_return_reminder", ["ReturnReminder"])
+
+
+def _books_browse_indexes(conn):
+    """Read.get_books, the keyset-paged catalog grid and its genre filter."""
+    _create_index(conn, "Books", "ix_books_stock_title", ["IsInStock", "Title"])
+    _create_index(conn, "Books", "ix_books_title_isbn", ["Title", "ISBN"])
+    _create_index(conn, "Books", "ix_books_genre_title", ["Genre", "Title", "ISBN"])
+    _create_index(conn, "Friends", "ix_friends_name", ["FName", "LName"])
+
+
+def _library_stats(conn):
+    """The counters table behind Read.get_library_stats."""
+    if not _has_table(conn, "LibraryStats"):
+        conn.execute(text("""
+            CREATE TABLE LibraryStats (
+                StatsID TINYINT PRIMARY KEY,
+                TotalBooks INT NOT NULL DEFAULT 0,
+                BorrowedBooks INT NOT NULL DEFAULT 0
+            )
+        """))
+    exists = conn.execute(text("SELECT 1 FROM LibraryStats WHERE StatsID = 1")).fetchone()
+    if not exists:
+        conn.execute(text("""
+            INSERT INTO LibraryStats (StatsID, TotalBooks, BorrowedBooks)
+            SELECT 1, (SELECT COUNT(*) FROM Books), (SELECT COUNT(*) FROM Loans)
+        """))
+
+
+def _books_search_index(conn):
+    """The full-text index behind Read.search_catalog."""
+    search_index.ensure_search_index(conn)
+
+
+def _books_isbn_digits_index(conn):
+    """Lets the return station match scanned ISBNs that have no hyphens."""
+    _create_index(conn, "Books", "ix_books_isbn_digits", ["(REPLACE(ISBN, '-', ''))"])
+
+
+# Tables whose changes Write.py logs (see Write.record_changes)
+VERSIONED_TABLES = ("Books", "Friends", "Loans", "Contacts")
+
+
+def _table_versions(conn):
+    """Counters that bulk loads bump, telling catalog_snapshot to read the tables again in full."""
+    if not _has_table(conn, "TableVersions"):
+        conn.execute(text("""
+            CREATE TABLE TableVersions (
+                TableName VARCHAR(45) PRIMARY KEY,
+                Version BIGINT NOT NULL DEFAULT 0
+            )
+        """))
+    existing = {row[0] for row in conn.execute(text("SELECT TableName FROM TableVersions"))}
+    for table in VERSIONED_TABLES:
+        if table not in existing:
+            conn.execute(text("INSERT INTO TableVersions (TableName, Version) VALUES (:table, 0)"), {"table": table})
+
+
+def _change_log(conn):
+    """The per-key change log behind change_feed."""
+    if not _has_table(conn, "ChangeLog"):
+        statement = """
+            CREATE TABLE ChangeLog (
+                Seq INT auto_increment PRIMARY KEY,
+                TableName VARCHAR(45) NOT NULL,
+                RowKey VARCHAR(45) NOT NULL,
+                Op CHAR(1) NOT NULL,
+                ChangedAt DATETIME NOT NULL
+            )
+        """
+        if conn.dialect.name == "sqlite":
+            statement = dialects.sqlite_script(statement)
+        conn.execute(text(statement))
+    _create_index(conn, "ChangeLog", "ix_changelog_table_seq", ["TableName", "Seq"])
+
+
+def _friends_last_name_index(conn):
+    """Read.lookup_friends matches a typed prefix against last names too."""
+    _create_index(conn, "Friends", "ix_friends_last_name", ["LName", "FName"])
+
+
+def _loan_history(conn):
+    """The archive of returned loans behind Read.get_loan_history, partitioned by return year on MySQL."""
+    if not _has_table(conn, "LoanHistory"):
+        statement = """
+            CREATE TABLE LoanHistory (
+                LoanID INT NOT NULL,
+                BorrowDate DATETIME NOT NULL,
+                DueDate DATETIME NOT NULL,
+                ReturnDate DATETIME NOT NULL,
+                ISBN CHAR(17),
+                FriendID INT,
+                PRIMARY KEY (ReturnDate, LoanID)
+            ) PARTITION BY RANGE (YEAR(ReturnDate)) (
+                PARTITION p_old VALUES LESS THAN (2022),
+                PARTITION p2022 VALUES LESS THAN (2023),
+                PARTITION p2023 VALUES LESS THAN (2024),
+                PARTITION p2024 VALUES LESS THAN (2025),
+                PARTITION p2025 VALUES LESS THAN (2026),
+                PARTITION p2026 VALUES LESS THAN (2027),
+                PARTITION p2027 VALUES LESS THAN (2028),
+                PARTITION p2028 VALUES LESS THAN (2029),
+                PARTITION p2029 VALUES LESS THAN (2030),
+                PARTITION p2030 VALUES LESS THAN (2031),
+                PARTITION pmax VALUES LESS THAN MAXVALUE
+            )
+        """
+        if conn.dialect.name == "sqlite":
+            statement = dialects.sqlite_script(statement)
+        conn.execute(text(statement))
+    _create_index(conn, "LoanHistory", "ix_loanhistory_friend", ["FriendID", "ReturnDate"])
+    _create_index(conn, "LoanHistory", "ix_loanhistory_isbn", ["ISBN", "ReturnDate"])
+
+
+def _circulation_rollups(conn):
+    """The daily rollups behind the Analytics page, filled from the loans so far."""
+    for table, key, key_type in (("BookDailyStats", "ISBN", "CHAR(17)"), ("FriendDailyStats", "FriendID", "INT")):
+        if not _has_table(conn, table):
+            conn.execute(text(f"""
+                CREATE TABLE {table} (
+                    Day DATE NOT NULL,
+                    {key} {key_type} NOT NULL,
+                    Checkouts INT NOT NULL DEFAULT 0,
+                    Returned INT NOT NULL DEFAULT 0,
+                    LoanDays INT NOT NULL DEFAULT 0,
+                    LateReturns INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (Day, {key})
+                )
+            """))
+    circulation_rollups.rebuild(conn)
+
+
+def _late_returns_by_day(conn):
+    """Recounts the rollups: LateReturns used to count a loan returned on its due day, after the due time, as late."""
+    circulation_rollups.rebuild(conn)
+
+
+MIGRATIONS = [
+    (1, "loan_date_indexes", _loan_date_indexes),
+    (2, "books_browse_indexes", _books_browse_indexes),
+    (3, "library_stats", _library_stats),
+    (4, "books_search_index", _books_search_index),
+    (5, "books_isbn_digits_index", _books_isbn_digits_index),
+    (6, "table_versions", _table_versions),
+    (7, "change_log", _change_log),
+    (8, "friends_last_name_index", _friends_last_name_index),
+    (9, "loan_history", _loan_history),
+    (10, "circulation_rollups", _circulation_rollups),
+    (11, "late_returns_by_day", _late_returns_by_day),
+]
+
+
+# --- Runner ---
+
+def _ensure_migrations_table(conn):
+    if not _has_table(conn, "SchemaMigrations"):
+        conn.execute(text("""
+            CREATE TABLE SchemaMigrations (
+                Version INT PRIMARY KEY,
+                Name VARCHAR(100) NOT NULL,
+                AppliedAt DATETIME NOT NULL
+            )
+        """))
+
+
+def applied_versions(engine):
+    """Returns the set of migration numbers already recorded."""
+    with engine.begin() as conn:
+        _ensure_migrations_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT Version FROM SchemaMigrations"))}
+
+
+def apply_migrations(engine, log=print):
+    """
+    Applies every migration that isn't recorded yet, in order.
+    Each one runs and is recorded in its own transaction. (MySQL commits DDL
+    implicitly, which is why every migration must be safe to re-run.)
+    Returns the list of migration names that were applied.
+    """
+    done = applied_versions(engine)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        log(f"Applying migration {version:03d}_{name} ...")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO SchemaMigrations (Version, Name, AppliedAt) VALUES (:version, :name, :applied_at)"),
+                {"version": version, "name": name, "applied_at": datetime.now()},
+            )
+        applied.append(name)
+    if applied:
+        library_cache.clear()
+    return applied
+
+
+_migrated_lock = threading.Lock()
+_migrated_engines = set()
+
+
+def ensure_migrated(engine):
+    """Applies pending migrations once per engine for the lifetime of the process."""
+    with _migrated_lock:
+        if id(engine) in _migrated_engines:
+            return []
+        applied = apply_migrations(engine, log=lambda message: None)
+        _migrated_engines.add(id(engine))
+        return applied
+
+
+if __name__ == "__main__":
+    password = getpass.getpass("MySQL Password: ")
+    engine = create_engine(library_connection.mysql_connection_string(password))
+    try:
+        names = apply_migrations(engine)
+        print(f"Applied {len(names)} migration(s)." if names else "Database is up to date.")
+    finally:
+        engine.dispose()
@@ -5,6 +5,9 @@ from datetime import datetime, timedelta
 import Read
 import Write
 import library_connection
+import profiler
+import typeahead
+from picker_index import PickerIndex
 
 # --- Page Setup (MUST BE FIRST) ---
 st.set_page_config(layout="wide", page_title="Loans")
@@ -16,183 +19,249 @@ if st.session_state.get("db_status") != "Connected":
 
 # --- Sidebar ---
 st.sidebar.button("Disconnect", on_click=library_connection.disconnect_db)
+# --- Page body, timed as one rerun (sidebar profiler panel when LIBRARY_PROFILER_PANEL=1) ---
+with profiler.page_run("Loans"):
+    # --- Flash Message Display Logic (COMES NEXT) ---
+    if "success_message" in st.session_state:
+        st.success(st.session_state.success_message)
+        del st.session_state.success_message
 
-# --- Flash Message Display Logic (COMES NEXT) ---
-if "success_message" in st.session_state:
-    st.success(st.session_state.success_message)
-    del st.session_state.success_message
-
-# --- Main Page UI ---
-st.title("Loans Overview")
-
-# Use st.radio for stateful tab navigation that works on all Streamlit versions
-tab_selection = st.radio(
-    "Navigation",
-    ["📖 See Loans", "➕ Create Loan", "↪️ Return Book", "⁉️ See Overdues"],
-    key="main_tabs_radio",
-    horizontal=True,
-    label_visibility="collapsed"
-)
-
-# --- TAB 1: SEE LOANS ---
-if tab_selection == "📖 See Loans":
-    st.subheader("Active Loans")
-    try:
-        loans_df = Read.list_loans()
-        if not loans_df.empty:
-            st.dataframe(loans_df, use_container_width=True)
-        else:
-            st.info("No active loans found in the library.")
-    except Exception as e:
-        st.error(f"Error loading loans: {e}")
-
-# --- TAB 2: CREATE LOAN ---
-elif tab_selection == "➕ Create Loan":
-    st.subheader("Create a new Loan")
-    
-    # Connection Check
-    if st.session_state.get("db_status") != "Connected":
-        st.error("You must be connected to the database to view this page.")
-        st.stop()
-
-    with st.form("create_loan_form", clear_on_submit=True):
-        # Friend Selection
-        friends_df = Read.get_friends()
-        if not friends_df.empty:
-            friend_display_list = friends_df['display'].tolist()
-            selected_friend_display_create = st.selectbox(
-                "Search for a friend",
-                options=friend_display_list, index=None, placeholder="Type to search..."
-            )
-            selected_friend_id = friends_df[friends_df['display'] == selected_friend_display_create]['FriendID'].iloc[0] if selected_friend_display_create else None
-        else:
-            st.warning("No friends found.")
-            selected_friend_id = None
-
-        # Book Selection
-        books_df = Read.get_books()
-        if not books_df.empty:
-            book_display_list = books_df['display'].tolist()
-            selected_book_display_create = st.selectbox(
-                "Search for an available book",
-                options=book_display_list, index=None, placeholder="Type to search..."
-            )
-            selected_isbn = books_df[books_df['display'] == selected_book_display_create]['ISBN'].iloc[0] if selected_book_display_create else None
-        else:
-            st.warning("No available books found.")
-            selected_isbn = None
+    # --- Main Page UI ---
+    st.title("Loans Overview")
 
-        # Loan Details
-        st.subheader("Loan Details")
-        today = datetime.now().date()
-        borrow_date = st.date_input("Borrow Date", value=today)
-        due_date = st.date_input("Due Date", value=today + timedelta(days=14))
-        reminder_date = st.date_input("Return Reminder Date", value=due_date - timedelta(days=3))
-
-        # ✅ The button is no longer disabled
-        submitted = st.form_submit_button("Create Loan")
-        if submitted:
-            # 1. First, validate that selections were made
-            if not (selected_friend_id and selected_isbn):
-                st.error("Please select both a friend and a book.")
+    # Use st.radio for stateful tab navigation that works on all Streamlit versions
+    tab_selection = st.radio(
+        "Navigation",
+        ["📖 See Loans", "➕ Create Loan", "🛒 Batch Checkout", "↪️ Return Book", "📠 Return Station", "⁉️ See Overdues",
+         "🗂️ History"],
+        key="main_tabs_radio",
+        horizontal=True,
+        label_visibility="collapsed"
+    )
+
+    # --- TAB 1: SEE LOANS ---
+    if tab_selection == "📖 See Loans":
+        st.subheader("Active Loans")
+        try:
+            loans_df = Read.list_loans()
+            if not loans_df.empty:
+                st.dataframe(loans_df, use_container_width=True)
             else:
-                # 2. Now, check the friend's loan limit
-                max_loans = Read.get_friend_max_loans(friend_id=selected_friend_id)
-                if max_loans is not None and max_loans <= 0:
-                    st.error("Max Amount Of Loans Was Reached for this friend. Loan not created.")
+                st.info("No active loans found in the library.")
+        except Exception as e:
+            st.error(f"Error loading loans: {e}")
+
+    # --- TAB 2: CREATE LOAN ---
+    elif tab_selection == "➕ Create Loan":
+        st.subheader("Create a new Loan")
+
+        # Connection Check
+        if st.session_state.get("db_status") != "Connected":
+            st.error("You must be connected to the database to view this page.")
+            st.stop()
+
+        # Friend and Book Selection, looked up as the user searches (typeahead.py), so outside the form
+        friend = typeahead.select_one("Search for a friend", Read.lookup_friends, "FriendID", key="loans_create_friend")
+        selected_friend_id = int(friend["FriendID"]) if friend is not None else None
+        book = typeahead.select_one("Search for an available book", Read.lookup_books, "ISBN", key="loans_create_book")
+        selected_isbn = book["ISBN"] if book is not None else None
+
+        with st.form("create_loan_form", clear_on_submit=True):
+            # Loan Details
+            st.subheader("Loan Details")
+            today = datetime.now().date()
+            borrow_date = st.date_input("Borrow Date", value=today)
+            due_date = st.date_input("Due Date", value=today + timedelta(days=14))
+            reminder_date = st.date_input("Return Reminder Date", value=due_date - timedelta(days=3))
+
+            # ✅ The button is no longer disabled
+            submitted = st.form_submit_button("Create Loan")
+            if submitted:
+                # 1. First, validate that selections were made
+                if not (selected_friend_id and selected_isbn):
+                    st.error("Please select both a friend and a book.")
                 else:
-                    # 3. If all checks pass, create the loan
+                    # 2. The friend's loan limit and the book's stock are checked in the same transaction
                     if Write.create_loan_entry(borrow_date, due_date, reminder_date, selected_isbn, selected_friend_id):
-                        st.session_state.success_message = f"Loan created successfully for {selected_friend_display_create}!"
-                        st.cache_data.clear()
+                        st.session_state.success_message = f"Loan created successfully for {friend['display']}!"
                         st.rerun()
 
 
-# --- TAB 3: RETURN BOOK ---
-elif tab_selection == "↪️ Return Book":
-    st.subheader("Return a Book")
-
-    # Connection Check
-    if st.session_state.get("db_status") != "Connected":
-        st.error("You must be connected to the database to view this page.")
-        st.stop()
-
-    # Get a DataFrame of all active loans
-    loans_df = Read.list_loans()
-
-    if not loans_df.empty:
-        # Create a user-friendly display column for the dropdown
-        loans_df['display'] = "Loan #" + loans_df['LoanID'].astype(str) + ": '" + loans_df['Title'] + \
-                              "' to " + loans_df['FName'] + " " + loans_df['LName']
-        
-        loan_display_list = loans_df['display'].tolist()
-
-        # Create a single dropdown to select the loan
-        selected_loan_display = st.selectbox(
-            "Select the loan to return",
-            options=loan_display_list,
-            index=None,
-            placeholder="Select a loan..."
-        )
-
-        # Form for the final action button
-        with st.form("return_book_form"):
-            submitted = st.form_submit_button("Confirm Return")
-            if submitted:
-                if selected_loan_display:
-                    # Get the ISBN and FriendID from the selected loan
-                    selected_loan = loans_df[loans_df['display'] == selected_loan_display].iloc[0]
-                    selected_isbn = selected_loan['ISBN']
-                    selected_friend_id = selected_loan['FriendID']
-
-                    if Write.return_book(isbn=selected_isbn, friend_id=selected_friend_id):
-                        st.session_state.success_message = "Book return processed successfully!"
-                        st.rerun()
+    # --- TAB: BATCH CHECKOUT ---
+    elif tab_selection == "🛒 Batch Checkout":
+        st.subheader("Check Out Several Books at Once")
+
+        friend = typeahead.select_one("Search for a friend", Read.lookup_friends, "FriendID", key="batch_friend")
+        cart = typeahead.select_many("Add available books to the cart", Read.lookup_books, "ISBN", key="batch_books")
+
+        with st.form("batch_checkout_form", clear_on_submit=True):
+            st.subheader("Loan Details")
+            today = datetime.now().date()
+            borrow_date = st.date_input("Borrow Date", value=today)
+            due_date = st.date_input("Due Date", value=today + timedelta(days=14))
+            reminder_date = st.date_input("Return Reminder Date", value=due_date - timedelta(days=3))
+
+            if st.form_submit_button("Check Out"):
+                if friend is None or not cart:
+                    st.error("Please select a friend and at least one book.")
                 else:
-                    st.error("Please select a loan to return.")
-    else:
-        st.info("There are no active loans to return.")
-        
-# --- TAB 4: SEE OVERDUES ---
-if tab_selection == "⁉️ See Overdues":
-    st.subheader("Overdue Loans")
-    try:
-        overdues_df = Read.get_loan_overdues()
-        if not overdues_df.empty:
-            st.dataframe(overdues_df, use_container_width=True, hide_index=True)
-            
-            st.markdown("---") # Add a visual separator
-            st.subheader("Get Contact Information")
-
-            # Create a unique list of friends from the overdues table
-            friends_with_overdues = overdues_df[['FriendID', 'FName', 'LName']].drop_duplicates()
-            friends_with_overdues['display'] = friends_with_overdues['FName'] + ' ' + friends_with_overdues['LName'] + ' (ID: ' + friends_with_overdues['FriendID'].astype(str) + ')'
-            
-            # Create the dropdown
-            selected_friend_display = st.selectbox(
-                "Select a friend to view their contact details",
-                options=friends_with_overdues['display'].tolist(),
+                    isbns = [book["ISBN"] for book in cart]
+                    if Write.checkout_books(int(friend["FriendID"]), isbns, borrow_date, due_date, reminder_date):
+                        st.session_state.success_message = f"{len(isbns)} book(s) checked out to {friend['display']}!"
+                        typeahead.clear("batch_books")
+                        st.rerun()
+
+    # --- TAB 3: RETURN BOOK ---
+    elif tab_selection == "↪️ Return Book":
+        st.subheader("Return a Book")
+
+        # Connection Check
+        if st.session_state.get("db_status") != "Connected":
+            st.error("You must be connected to the database to view this page.")
+            st.stop()
+
+        # All active loans with their dropdown labels
+        loan_picker = Read.get_loan_picker()
+
+        if len(loan_picker):
+            # Create a single dropdown to select the loan
+            selected_loan_display = st.selectbox(
+                "Select the loan to return",
+                options=loan_picker.labels,
                 index=None,
-                placeholder="Select a friend..."
+                placeholder="Select a loan..."
             )
 
-            # If a friend is selected, fetch and display their contact info
-            if selected_friend_display:
-                # Find the ID of the selected friend
-                selected_friend_id = friends_with_overdues[friends_with_overdues['display'] == selected_friend_display]['FriendID'].iloc[0]
-                
-                contact_df = Read.get_friend_contact_info(friend_id=selected_friend_id)
-                if not contact_df.empty:
-                    st.write("**Contact Details:**")
-                    # Display each contact detail in its own column
-                    cols = st.columns(len(contact_df))
-                    for idx, col in enumerate(cols):
-                        contact_type = contact_df.iloc[idx]['type']
-                        contact_value = contact_df.iloc[idx]['contact']
-                        col.metric(label=contact_type.capitalize(), value=contact_value)
-                else:
-                    st.warning("No contact information found for this friend.")
+            # Form for the final action button
+            with st.form("return_book_form"):
+                submitted = st.form_submit_button("Confirm Return")
+                if submitted:
+                    if selected_loan_display:
+                        # Get the ISBN and FriendID from the selected loan
+                        selected_loan = loan_picker.row(selected_loan_display)
+                        selected_isbn = selected_loan['ISBN']
+                        selected_friend_id = selected_loan['FriendID']
+
+                        if Write.return_book(isbn=selected_isbn, friend_id=selected_friend_id):
+                            st.session_state.success_message = "Book return processed successfully!"
+                            st.rerun()
+                    else:
+                        st.error("Please select a loan to return.")
+        else:
+            st.info("There are no active loans to return.")
+
+    # --- TAB: RETURN STATION ---
+    elif tab_selection == "📠 Return Station":
+        st.subheader("Return Station")
+        RETURN_BATCH_SIZE = 20
+        st.caption(f"Scan or type ISBNs and press Enter. Returns are committed every {RETURN_BATCH_SIZE} scans, or when you press Commit.")
+
+        if "return_queue" not in st.session_state:
+            st.session_state.return_queue = []
+        if "return_results" not in st.session_state:
+            st.session_state.return_results = []
+
+        def commit_returns():
+            if st.session_state.return_queue:
+                results = Write.return_books(st.session_state.return_queue)
+                if results is not None:
+                    # Newest first; keep the log of this station bounded
+                    st.session_state.return_results = (results[::-1] + st.session_state.return_results)[:500]
+                    st.session_state.return_queue = []
+
+        def enqueue_scan():
+            isbn = st.session_state.scan_input.strip()
+            st.session_state.scan_input = ""
+            if isbn:
+                st.session_state.return_queue.append(isbn)
+                if len(st.session_state.return_queue) >= RETURN_BATCH_SIZE:
+                    commit_returns()
+
+        def clear_queue():
+            st.session_state.return_queue = []
+
+        st.text_input("Scan ISBN", key="scan_input", on_change=enqueue_scan, placeholder="Scan a barcode or type an ISBN...")
+
+        queue = st.session_state.return_queue
+        col1, col2 = st.columns(2)
+        col1.button(f"✅ Commit {len(queue)} Return(s)", on_click=commit_returns, disabled=not queue, use_container_width=True)
+        col2.button("🗑️ Clear Queue", on_click=clear_queue, disabled=not queue, use_container_width=True)
+
+        if queue:
+            st.write("**Waiting to be committed:**")
+            st.dataframe(pd.DataFrame({"Scanned ISBN": queue}), use_container_width=True, hide_index=True)
+
+        if st.session_state.return_results:
+            st.write("**Processed Returns:**")
+            st.dataframe(pd.DataFrame(st.session_state.return_results), use_container_width=True, hide_index=True)
+
+    # --- TAB 4: SEE OVERDUES ---
+    if tab_selection == "⁉️ See Overdues":
+        st.subheader("Overdue Loans")
+        try:
+            overdues_df = Read.get_loan_overdues()
+            if not overdues_df.empty:
+                st.dataframe(overdues_df, use_container_width=True, hide_index=True)
+
+                st.markdown("---") # Add a visual separator
+                st.subheader("Get Contact Information")
+
+                # Create a unique list of friends from the overdues table
+                friends_with_overdues = overdues_df[['FriendID', 'FName', 'LName']].drop_duplicates()
+                overdue_picker = PickerIndex(friends_with_overdues, Read.friend_labels(friends_with_overdues), "FriendID")
+
+                # Create the dropdown
+                selected_friend_display = st.selectbox(
+                    "Select a friend to view their contact details",
+                    options=overdue_picker.labels,
+                    index=None,
+                    placeholder="Select a friend..."
+                )
+
+                # If a friend is selected, fetch and display their contact info
+                if selected_friend_display:
+                    # Find the ID of the selected friend
+                    selected_friend_id = overdue_picker.key_of(selected_friend_display)
+
+                    contact_df = Read.get_friend_contact_info(friend_id=selected_friend_id)
+                    if not contact_df.empty:
+                        st.write("**Contact Details:**")
+                        # Display each contact detail in its own column
+                        cols = st.columns(len(contact_df))
+                        for idx, col in enumerate(cols):
+                            contact_type = contact_df.iloc[idx]['type']
+                            contact_value = contact_df.iloc[idx]['contact']
+                            col.metric(label=contact_type.capitalize(), value=contact_value)
+                    else:
+                        st.warning("No contact information found for this friend.")
+            else:
+                st.info("🎉 No overdue loans found!")
+        except Exception as e:
+            st.error(f"Error loading overdues: {e}")
+
+    # --- TAB: HISTORY ---
+    if tab_selection == "🗂️ History":
+        st.subheader("Returned Loans")
+        today = datetime.now().date()
+
+        def restart_history():
+            st.session_state.history_cursors = [None]
+
+        col1, col2 = st.columns(2)
+        start_date = col1.date_input("Returned from", value=today - timedelta(days=30), key="history_start", on_change=restart_history)
+        end_date = col2.date_input("Returned until", value=today, key="history_end", on_change=restart_history)
+
+        # Keyset paging: the cursor of every page shown so far, so "Newer" can go back
+        if "history_cursors" not in st.session_state:
+            restart_history()
+        cursors = st.session_state.history_cursors
+        history_df, next_cursor = Read.get_loan_history(start=start_date, end=end_date + timedelta(days=1), before=cursors[-1])
+
+        if not history_df.empty:
+            st.dataframe(history_df, use_container_width=True, hide_index=True)
+            col1, col2 = st.columns(2)
+            col1.button("◀ Newer", on_click=cursors.pop, disabled=len(cursors) == 1, use_container_width=True)
+            col2.button("Older ▶", on_click=cursors.append, args=(next_cursor,), disabled=next_cursor is None,
+                        use_container_width=True)
         else:
-            st.info("🎉 No overdue loans found!")
-    except Exception as e:
-        st.error(f"Error loading overdues: {e}")
+            st.info("No loans were returned in this period.")
@@ -0,0 +1,94 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime, timedelta
+import Read
+import library_connection
+import prefetch
+import profiler
+
+# --- Page Setup (MUST BE FIRST) ---
+st.set_page_config(layout="wide", page_title="Analytics")
+
+# --- Check Connection Status ---
+if st.session_state.get("db_status") != "Connected":
+    st.info("You have been disconnected. Redirecting to login page...")
+    st.switch_page("Login.py")
+
+# --- Sidebar ---
+st.sidebar.button("Disconnect", on_click=library_connection.disconnect_db)
+# --- Page body, timed as one rerun (sidebar profiler panel when LIBRARY_PROFILER_PANEL=1) ---
+with profiler.page_run("Analytics"):
+    # --- Main Page UI ---
+    st.title("Circulation Analytics")
+    st.caption("Everything here is summed from the daily rollups (circulation_rollups.py), so a longer period only costs more days.")
+
+    # --- Period ---
+    today = datetime.now().date()
+    col1, col2 = st.columns(2)
+    start_date = col1.date_input("From", value=today - timedelta(days=365), key="analytics_start")
+    end_date = col2.date_input("Until", value=today, key="analytics_end")
+    if start_date > end_date:
+        st.error("The start of the period must not be after its end.")
+        st.stop()
+    period = {"start": start_date, "end": end_date + timedelta(days=1)}
+
+    # --- Load the page's datasets concurrently ---
+    page_data, page_errors = prefetch.fetch_parallel(
+        st.session_state.engine,
+        daily=(Read.get_daily_circulation, period),
+        top_books=(Read.get_top_books, period),
+        genres=(Read.get_circulation_by, {"column": "Genre", **period}),
+        shelves=(Read.get_circulation_by, {"column": "ShelfLocation", **period}),
+        overdue_rates=(Read.get_friend_overdue_rates, period),
+    )
+    for name, error in page_errors.items():
+        st.error(f"Error loading {name.replace('_', ' ')}: {error}")
+
+    # --- METRICS ---
+    daily = page_data.get("daily", pd.DataFrame())
+    if daily.empty:
+        st.info("No loans or returns in this period.")
+        st.stop()
+
+    checkouts, returned = int(daily["Checkouts"].sum()), int(daily["Returned"].sum())
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Checkouts", checkouts)
+    col2.metric("Returns", returned)
+    col3.metric("Average Loan (days)", f"{daily['LoanDays'].sum() / returned:.1f}" if returned else "–")
+    col4.metric("Returned Late", f"{daily['LateReturns'].sum() / returned:.0%}" if returned else "–")
+
+    # --- MONTHLY TRENDS ---
+    st.subheader("Monthly Trends")
+    monthly = daily.groupby(daily["Day"].dt.to_period("M"))[["Checkouts", "Returned"]].sum()
+    monthly.index = monthly.index.to_timestamp()
+    st.line_chart(monthly)
+
+    # --- BOOKS ---
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Most Borrowed Books")
+        top_books = page_data.get("top_books", pd.DataFrame())
+        if not top_books.empty:
+            st.dataframe(top_books, use_container_width=True, hide_index=True)
+    with col2:
+        st.subheader("Circulation per Genre")
+        genres = page_data.get("genres", pd.DataFrame())
+        if not genres.empty:
+            st.bar_chart(genres.set_index("Genre")["Checkouts"])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Circulation per Shelf")
+        shelves = page_data.get("shelves", pd.DataFrame())
+        if not shelves.empty:
+            st.bar_chart(shelves.set_index("ShelfLocation")["Checkouts"])
+    with col2:
+        st.subheader("Overdue Rate per Friend")
+        overdue_rates = page_data.get("overdue_rates", pd.DataFrame())
+        if not overdue_rates.empty:
+            st.dataframe(
+                overdue_rates, use_container_width=True, hide_index=True,
+                column_config={"LateRate": st.column_config.ProgressColumn("Late", format="percent", min_value=0, max_value=1)},
+            )
+        else:
+            st.info("No returns in this period.")
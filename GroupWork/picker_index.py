@@ -0,0 +1,51 @@
+"""
+Selectbox pickers that resolve a choice without scanning a frame.
+
+A picker used to rebuild its label column on every rerun and find the chosen
+row with a full comparison such as df[df['display'] == selected]. A
+PickerIndex holds the labels once, with a label -> row position dict, so a
+choice resolves to its key (ISBN, FriendID, LoanID) or row with one lookup.
+
+Indexes are built once per data version: the catalog ones with each catalog
+snapshot, the loans one per library_cache entry. They are shared by every
+session, so treat them as read-only.
+"""
+import pandas as pd
+
+
+class PickerIndex:
+    """Option labels for the rows of `frame`, each label leading back to its row and `key` value."""
+
+    def __init__(self, frame, labels, key):
+        self.frame = frame
+        self.key = key
+        self.labels = list(labels)  # The selectbox options, in the frame's order
+        self._positions = dict(zip(self.labels, range(len(self.labels))))
+        self._keys = frame[key].tolist() if len(frame) else []
+
+    @classmethod
+    def empty(cls, key):
+        return cls(pd.DataFrame(columns=[key]), [], key)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self._positions
+
+    def key_of(self, label):
+        """The key of the labelled row, or None for no (or an unknown) label."""
+        position = self._positions.get(label)
+        return None if position is None else self._keys[position]
+
+    def keys_of(self, labels):
+        return [self._keys[self._positions[label]] for label in labels if label in self._positions]
+
+    def row(self, label):
+        """The labelled row as a Series, or None."""
+        position = self._positions.get(label)
+        return None if position is None else self.frame.iloc[position]
+
+    def rows(self, labels):
+        """The labelled rows as a new frame, in the order given."""
+        return self.frame.iloc[[self._positions[label] for label in labels if label in self._positions]]
@@ -0,0 +1,50 @@
+"""
+Parallel prefetch of a page's datasets for synchronous callers.
+
+The Read functions of a page are submitted to one bounded thread pool shared
+by the process and run over the shared engine, so the page waits for its
+slowest query instead of the sum of all of them. Worker threads have no
+Streamlit session, so the engine is passed to every function explicitly.
+An in-memory SQLite engine has a single connection, which two threads must
+not use at once; its datasets are read one after the other instead.
+"""
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import library_connection
+
+# Stay below the engine's pool size so prefetching never starves other sessions
+MAX_WORKERS = int(os.environ.get("LIBRARY_PREFETCH_WORKERS", max(library_connection.POOL_SIZE - 1, 1)))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="prefetch")
+
+
+def fetch_parallel(engine, **datasets):
+    """
+    Runs Read functions concurrently and waits for all of them.
+    Each dataset is either a function or a (function, kwargs) pair, e.g.
+        fetch_parallel(engine, stats=Read.get_library_stats,
+                       borrowed=(Read.get_borrowed_books, {"friend_id": 3}))
+    Returns (results, errors): dicts keyed by dataset name. A failed query
+    only costs its own dataset; its exception is in errors.
+    """
+    calls = {name: dataset if isinstance(dataset, tuple) else (dataset, {}) for name, dataset in datasets.items()}
+    results, errors = {}, {}
+    if library_connection.shares_one_connection(engine):
+        for name, (function, kwargs) in calls.items():
+            try:
+                results[name] = function(engine=engine, **kwargs)
+            except Exception as e:
+                errors[name] = e
+        return results, errors
+
+    # Run in a copy of this context so the profiler counts the work towards this rerun
+    futures = {name: _executor.submit(contextvars.copy_context().run, function, engine=engine, **kwargs)
+               for name, (function, kwargs) in calls.items()}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+    return results, errors
@@ -0,0 +1,347 @@
+"""
+Per-query timing for the data layer, and an optional in-app profiler panel.
+
+Two sources of measurements feed the same process-wide statistics:
+- SQLAlchemy cursor events on every engine (instrument(engine)) time each
+  SQL statement and count the rows it returned;
+- the @profiled decorator on the Read/Write functions times each call,
+  including the ones the cache answers without a query.
+
+Pages run their body inside `with profiler.page_run(name):`; every function
+call and statement in it (prefetch threads and the async loop included)
+becomes a step of that rerun's waterfall. Statements slower than
+SLOW_QUERY_MS go to a slow-query log together with their EXPLAIN plan.
+
+Set LIBRARY_PROFILER_PANEL=1 to show the panel in the sidebar.
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import altair as alt
+import pandas as pd
+import streamlit as st
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.environ.get("LIBRARY_SLOW_QUERY_MS", 200))
+PANEL_ENABLED = os.environ.get("LIBRARY_PROFILER_PANEL") == "1"
+SLOW_LOG_SIZE = 100
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+@dataclass
+class _Stats:
+    calls: int = 0
+    errors: int = 0
+    rows: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    histogram: list = field(default_factory=lambda: [0] * (len(BUCKETS_MS) + 1))
+
+    def add(self, elapsed_ms, rows=None, failed=False):
+        self.calls += 1
+        self.errors += failed
+        self.rows += rows or 0
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.histogram[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls."""
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (self.max_ms,), self.histogram):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+@dataclass
+class _Run:
+    """One Streamlit rerun of a page: its start time and the steps it made."""
+    page: str
+    started: float = field(default_factory=time.perf_counter)
+    steps: list = field(default_factory=list)  # dicts, see _add_step
+
+    def elapsed_ms(self, at=None):
+        return ((at or time.perf_counter()) - self.started) * 1000
+
+
+_lock = threading.Lock()
+_function_stats = {}   # "Read.get_books" -> _Stats
+_statement_stats = {}  # normalized SQL -> _Stats
+_run_stats = {}        # page -> _Stats of whole reruns
+_slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+
+_current_run = contextvars.ContextVar("profiler_run", default=None)
+_current_function = contextvars.ContextVar("profiler_function", default=None)
+
+
+def _record(stats, key, elapsed_ms, rows=None, failed=False):
+    with _lock:
+        entry = stats.get(key)
+        if entry is None:
+            entry = stats[key] = _Stats()
+        entry.add(elapsed_ms, rows, failed)
+
+
+def _add_step(kind, name, started, finished, rows=None):
+    run = _current_run.get()
+    if run is not None:
+        run.steps.append({
+            "Kind": kind, "Step": name, "Start (ms)": run.elapsed_ms(started),
+            "End (ms)": run.elapsed_ms(finished), "Rows": rows,
+        })
+
+
+# --- Statements (SQLAlchemy cursor events) ---
+
+_whitespace = re.compile(r"\s+")
+_placeholder_list = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)")
+
+
+def normalize_statement(statement):
+    """One key per query shape: whitespace collapsed, expanded IN lists folded."""
+    return _placeholder_list.sub("(...)", _whitespace.sub(" ", statement).strip())
+
+
+def _explain(conn, statement, parameters):
+    """The plan of a slow SELECT, run on the same DBAPI connection (no events fire)."""
+    if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        explain_cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            explain_cursor.execute(prefix + statement, parameters)
+            columns = [column[0] for column in explain_cursor.description]
+            return pd.DataFrame(explain_cursor.fetchall(), columns=columns)
+        finally:
+            explain_cursor.close()
+    except Exception:
+        return None  # A plan is a nice-to-have; never fail the query over it
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    finished = time.perf_counter()
+    started = conn.info["profiler_started"].pop()
+    elapsed_ms = (finished - started) * 1000
+    rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+    key = normalize_statement(statement)
+    _record(_statement_stats, key, elapsed_ms, rows)
+    _add_step("SQL", key, started, finished, rows)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        plan = None if executemany else _explain(conn, statement, parameters)
+        with _lock:
+            _slow_queries.append({
+                "at": datetime.now(), "ms": elapsed_ms, "function": _current_function.get(),
+                "statement": key, "plan": plan,
+            })
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get("profiler_started") if exception_context.connection else None
+    if started:
+        elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+        _record(_statement_stats, normalize_statement(exception_context.statement or ""), elapsed_ms, failed=True)
+
+
+def instrument(engine):
+    """Times every statement the engine runs (idempotent)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    return engine
+
+
+# --- Data-layer functions (decorator) ---
+
+def _row_count(result):
+    if isinstance(result, tuple) and result:
+        result = result[0]  # (frame, next cursor) from the paged reads
+    if isinstance(result, (pd.DataFrame, list)):
+        return len(result)
+    return None
+
+
+def profiled(func):
+    """
+    Times every call of a Read/Write function, cache hits included.
+    Put it above @library_cache.cached so hits are counted too.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    def finish(started, result, failed):
+        finished = time.perf_counter()
+        rows = None if failed else _row_count(result)
+        _record(_function_stats, name, (finished - started) * 1000, rows, failed)
+        _add_step("Function", name, started, finished, rows)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = _current_function.set(name)
+            started, result, failed = time.perf_counter(), None, True
+            try:
+                result = await func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _current_function.reset(token)
+                finish(started, result, failed)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_function.set(name)
+            started, result, failed = time.perf_counter(), None, True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _current_function.reset(token)
+                finish(started, result, failed)
+    return wrapper
+
+
+# --- Reruns ---
+
+def begin_run(page):
+    """Starts timing a rerun of a page; call it at the top of the script."""
+    _current_run.set(_Run(page))
+
+
+def current_run():
+    return _current_run.get()
+
+
+def attach_run(run):
+    """Makes another thread's or task's steps count towards a rerun (see prefetch, async_read)."""
+    _current_run.set(run)
+
+
+def end_run(panel=True):
+    """Records the rerun's total time and shows the panel when it is enabled."""
+    run = _current_run.get()
+    if run is None:
+        return
+    _record(_run_stats, run.page, run.elapsed_ms())
+    _current_run.set(None)
+    if panel and PANEL_ENABLED:
+        render_panel(run)
+
+
+@contextlib.contextmanager
+def page_run(page):
+    """
+    Times the page body in the with block as one rerun. st.rerun, st.stop
+    and st.switch_page leave it by raising, so those reruns (and failed
+    ones) count too; the panel only shows after a rerun that ran to the end.
+    """
+    begin_run(page)
+    try:
+        yield
+    except BaseException:
+        # Streamlit drops whatever a stopping script draws, so no panel here
+        end_run(panel=False)
+        raise
+    end_run()
+
+
+# --- Reports ---
+
+def _summary(stats, label):
+    with _lock:
+        rows = [
+            {
+                label: key, "Calls": s.calls, "Errors": s.errors, "Rows": s.rows,
+                "Total (ms)": round(s.total_ms, 1), "Mean (ms)": round(s.total_ms / s.calls, 2),
+                "p50 (ms)": round(s.percentile(0.5), 1), "p95 (ms)": round(s.percentile(0.95), 1), "Max (ms)": round(s.max_ms, 1),
+            }
+            for key, s in stats.items()
+        ]
+    columns = [label, "Calls", "Errors", "Rows", "Total (ms)", "Mean (ms)", "p50 (ms)", "p95 (ms)", "Max (ms)"]
+    return pd.DataFrame(rows, columns=columns).sort_values("Total (ms)", ascending=False, ignore_index=True)
+
+
+def function_summary():
+    return _summary(_function_stats, "Function")
+
+
+def statement_summary():
+    return _summary(_statement_stats, "Statement")
+
+
+def run_summary():
+    return _summary(_run_stats, "Page")
+
+
+def histogram(name):
+    """Latency histogram of one function (or statement) as a bucket -> calls frame."""
+    with _lock:
+        stats = _function_stats.get(name) or _statement_stats.get(name)
+        counts = list(stats.histogram) if stats else [0] * (len(BUCKETS_MS) + 1)
+    labels = [f"≤ {bound} ms" for bound in BUCKETS_MS] + [f"> {BUCKETS_MS[-1]} ms"]
+    return pd.DataFrame({"Latency": labels, "Calls": counts})
+
+
+def slow_queries():
+    with _lock:
+        return list(_slow_queries)
+
+
+def reset():
+    with _lock:
+        _function_stats.clear()
+        _statement_stats.clear()
+        _run_stats.clear()
+        _slow_queries.clear()
+
+
+def render_panel(run):
+    """Sidebar panel: this rerun's waterfall, the hottest functions and the slow-query log."""
+    steps = pd.DataFrame(run.steps, columns=["Kind", "Step", "Start (ms)", "End (ms)", "Rows"]).sort_values("Start (ms)", ignore_index=True)
+    with st.sidebar.expander("⏱️ Query profiler"):
+        statements = (steps["Kind"] == "SQL").sum()
+        st.caption(f"{run.page}: {run.elapsed_ms():.0f} ms, {statements} quer{'y' if statements == 1 else 'ies'}")
+        if not steps.empty:
+            steps["Duration (ms)"] = (steps["End (ms)"] - steps["Start (ms)"]).round(2)
+            steps["#"] = range(1, len(steps) + 1)
+            waterfall = alt.Chart(steps).mark_bar().encode(
+                x=alt.X("Start (ms)", title="ms since the rerun started"), x2="End (ms)",
+                y=alt.Y("#:O", title=None), color="Kind", tooltip=["Step", "Duration (ms)", "Rows"],
+            )
+            st.altair_chart(waterfall, use_container_width=True)
+            st.dataframe(steps[["Kind", "Step", "Start (ms)", "Duration (ms)", "Rows"]].round(2), hide_index=True)
+
+        st.markdown("**Functions (since start)**")
+        st.dataframe(function_summary(), hide_index=True)
+
+        slow = slow_queries()
+        st.markdown(f"**Slow queries (≥ {SLOW_QUERY_MS:.0f} ms)**")
+        if not slow:
+            st.caption("None yet.")
+        for entry in reversed(slow[-10:]):
+            st.caption(f"{entry['at']:%H:%M:%S} · {entry['ms']:.0f} ms · {entry['function'] or 'unknown caller'}")
+            st.code(entry["statement"], language="sql")
+            if entry["plan"] is not None:
+                st.dataframe(entry["plan"], hide_index=True)
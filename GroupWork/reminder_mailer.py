@@ -0,0 +1,188 @@
+"""
+Sends today's reminders by email in one run.
+
+Reminders (see reminder_queue) are grouped per friend, so a friend with
+several books due gets one message listing all of them, sent to every
+email contact they have. Messages go out over a small pool of SMTP
+connections: SMTP_CONNECTIONS workers, each reusing one connection for
+all of its messages. Once everything is sent, the delivered loans'
+reminders are cleared together with Write.clear_reminders, so a run does
+one DB transaction rather than one per loan.
+
+For a local test, point it at an SMTP stand-in, e.g.
+
+    python -m aiosmtpd -n -l localhost:8025
+    LIBRARY_SMTP_PORT=8025 python reminder_mailer.py
+"""
+import argparse
+import getpass
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from sqlalchemy import create_engine
+
+import library_connection
+import profiler
+import Read
+import Write
+
+SMTP_HOST = os.environ.get("LIBRARY_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("LIBRARY_SMTP_PORT", 25))
+SMTP_USER = os.environ.get("LIBRARY_SMTP_USER")
+SMTP_PASSWORD = os.environ.get("LIBRARY_SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("LIBRARY_SMTP_STARTTLS") == "1"
+SMTP_TIMEOUT = int(os.environ.get("LIBRARY_SMTP_TIMEOUT", 30))  # seconds
+SMTP_CONNECTIONS = int(os.environ.get("LIBRARY_SMTP_CONNECTIONS", 4))
+MAIL_FROM = os.environ.get("LIBRARY_MAIL_FROM", "library@localhost")
+
+
+def connect():
+    """Opens one SMTP connection with the configured host, TLS and login."""
+    smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        smtp.starttls()
+    if SMTP_USER:
+        smtp.login(SMTP_USER, SMTP_PASSWORD or "")
+    return smtp
+
+
+def build_messages(reminders_df, sender=MAIL_FROM):
+    """
+    Turns get_daily_reminders rows into one message per friend.
+    Returns (messages, skipped): messages is a list of (loan_ids, EmailMessage),
+    skipped maps a friend's name to why they got no message.
+    """
+    messages, skipped = [], {}
+    if reminders_df.empty:
+        return messages, skipped
+    is_email = reminders_df["type"].str.lower() == "email"
+    for (friend_id, fname, lname), rows in reminders_df.groupby(["FriendID", "FName", "LName"], sort=False):
+        addresses = list(dict.fromkeys(rows.loc[is_email[rows.index], "contact"]))
+        if not addresses:
+            skipped[f"{fname} {lname}"] = "no email address"
+            continue
+        loans = rows.drop_duplicates("LoanID").sort_values("DueDate")
+        lines = [f"- {title} (due {due_date.strftime('%Y-%m-%d')})" for title, due_date in zip(loans["Title"], loans["DueDate"])]
+
+        message = EmailMessage()
+        message["From"] = sender
+        message["To"] = ", ".join(addresses)
+        message["Subject"] = "Reminder: books due back at Liane's Library"
+        message.set_content(
+            f"Hi {fname},\n\n"
+            "just a friendly reminder that these books are due back soon:\n\n"
+            + "\n".join(lines)
+            + "\n\nThank you!\nLiane's Library\n"
+        )
+        messages.append((loans["LoanID"].tolist(), message))
+    return messages, skipped
+
+
+def _close(smtp):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+
+
+def _send(smtp, message, smtp_factory):
+    """Sends on the worker's connection, (re)connecting if it has none or it was dropped."""
+    if smtp is not None:
+        try:
+            smtp.send_message(message)
+            return smtp
+        except smtplib.SMTPServerDisconnected:
+            # Dropped while idle or after too many messages: let go of its socket, then reconnect once
+            _close(smtp)
+    smtp = smtp_factory()
+    smtp.send_message(message)
+    return smtp
+
+
+def deliver(messages, connections=SMTP_CONNECTIONS, smtp_factory=connect):
+    """
+    Sends (loan_ids, EmailMessage) pairs with up to `connections` SMTP
+    connections at once. Returns (delivered, failures): the loan_ids of
+    every message that was accepted, and the recipients of every message
+    that was not, mapped to the error.
+    """
+    pending = queue.Queue()
+    for item in messages:
+        pending.put(item)
+    delivered, failures = [], {}
+    results_lock = threading.Lock()
+
+    def worker():
+        smtp = None
+        while True:
+            try:
+                loan_ids, message = pending.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                smtp = _send(smtp, message, smtp_factory)
+            except (smtplib.SMTPException, OSError) as e:
+                # Start the next message on a fresh connection
+                if smtp is not None:
+                    _close(smtp)
+                    smtp = None
+                with results_lock:
+                    failures[message["To"]] = str(e)
+                continue
+            with results_lock:
+                delivered.append(loan_ids)
+        if smtp is not None:
+            _close(smtp)
+
+    threads = [threading.Thread(target=worker, name=f"reminder-smtp-{i}")
+               for i in range(max(min(connections, len(messages)), 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return delivered, failures
+
+
+@profiler.profiled
+def send_daily_reminders(engine=None, connections=SMTP_CONNECTIONS, smtp_factory=connect):
+    """
+    Emails today's reminders and clears the delivered ones.
+    Returns {"sent": messages, "cleared": loans, "failed": {...}, "skipped": {...}}.
+    """
+    reminders_df = Read.get_daily_reminders(engine=engine)
+    messages, skipped = build_messages(reminders_df)
+    delivered, failures = deliver(messages, connections, smtp_factory)
+    loan_ids = [loan_id for message_loans in delivered for loan_id in message_loans]
+    cleared = Write.clear_reminders(loan_ids, engine=engine)
+    if not cleared:
+        failures["(database)"] = "the emails were sent but their reminders could not be cleared"
+    return {
+        "sent": len(delivered),
+        "cleared": len(loan_ids) if cleared else 0,
+        "failed": failures,
+        "skipped": skipped,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Email today's reminders and clear the delivered ones.")
+    parser.add_argument("--sqlite", metavar="PATH", help="embedded database file instead of the MySQL server")
+    parser.add_argument("--connections", type=int, default=SMTP_CONNECTIONS, help="SMTP connections used at once")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        engine = library_connection.create_sqlite_engine(args.sqlite)
+    else:
+        engine = create_engine(library_connection.mysql_connection_string(getpass.getpass("MySQL Password: ")))
+    started = time.perf_counter()
+    try:
+        result = send_daily_reminders(engine, args.connections)
+    finally:
+        engine.dispose()
+    print(f"Sent {result['sent']} email(s) covering {result['cleared']} loan(s) in {time.perf_counter() - started:.1f} s.")
+    for name, reason in {**result["skipped"], **result["failed"]}.items():
+        print(f"  {name}: {reason}")
@@ -0,0 +1,192 @@
+"""
+Today's reminders and overdue loans, kept in memory per engine.
+
+Home and Loans used to run the Loans/Friends/Books/Contacts joins on every
+page load. Here they are derived from two change_feed views instead: the
+active loans (with title and borrower) and the friends' contacts. A write
+to those tables (library_cache tells us) only makes the views catch up with
+the keys it changed; the queue is then filtered again from the frames in
+memory, and only when one of them actually changed. That happens
+
+- on the next page load after such a write,
+- in a background scheduler thread, so the page usually finds it done,
+- at day rollover, and every REFRESH_SECONDS, when the views are read again
+  in full for changes made outside the app.
+
+A page then gets its rows straight from memory: today's reminders as they
+are, and the overdue loans as a prefix of a list sorted by due date.
+"""
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+
+import change_feed
+import dialects
+import library_cache
+
+# Changes made by other processes without the change log (MySQL Workbench)
+# show up after at most this long; changes logged by the app show up at once
+REFRESH_SECONDS = int(os.environ.get("LIBRARY_REMINDER_REFRESH_SECONDS", 300))
+
+# The tables whose rows end up in the queue
+TABLES = ("Loans", "Friends", "Books", "Contacts")
+
+# All active loans; Read.list_loans and the loan picker share the view
+ACTIVE_LOANS_QUERY = """
+    SELECT LoanID, FriendID, FName, LName, BorrowDate, DueDate, ReturnReminder, Title, Loans.ISBN
+    FROM Loans
+    JOIN Books USING (ISBN)
+    JOIN Friends USING (FriendID)
+    {where}
+    ORDER BY LoanID
+"""
+CONTACTS_QUERY = """
+    SELECT ContactID, FriendID, type, contact
+    FROM Contacts
+    {where}
+    ORDER BY ContactID
+"""
+# SQLite returns these as text; dialects.parse_datetimes turns them into Timestamps
+LOAN_DATE_COLUMNS = ("BorrowDate", "DueDate", "ReturnReminder")
+
+LOANS_VIEW = change_feed.LiveView(
+    ACTIVE_LOANS_QUERY,
+    key="LoanID",
+    links={"Loans": ("LoanID", "Loans.LoanID"), "Books": ("ISBN", "Loans.ISBN"), "Friends": ("FriendID", "Loans.FriendID")},
+    order_by=["LoanID"],
+    prepare=lambda df: dialects.parse_datetimes(df, *LOAN_DATE_COLUMNS),
+)
+CONTACTS_VIEW = change_feed.LiveView(
+    CONTACTS_QUERY, key="ContactID", links={"Contacts": ("ContactID", "ContactID")}, order_by=["ContactID"],
+)
+
+# The columns pages get, in the order the joins used to return them
+REMINDER_COLUMNS = ["LoanID", "DueDate", "FriendID", "FName", "LName", "Title"]
+OVERDUE_COLUMNS = ["LoanID", "DueDate", "FriendID", "FName", "LName", "Title", "ISBN"]
+
+
+def day_range(day=None):
+    # A half-open range on the raw column lets the ReturnReminder/DueDate indexes be used
+    day_start = datetime.combine(day or date.today(), time.min)
+    return {"day_start": day_start, "day_end": day_start + timedelta(days=1)}
+
+
+class _Queue:
+    """One engine's reminders and overdue loans for one day, and the view frames they came from."""
+
+    def __init__(self, day, version, loans, contacts):
+        self.day = day
+        self.version = version
+        self.loans = loans
+        self.contacts = contacts
+        params = day_range(day)
+        reminded = loans["ReturnReminder"]
+        today = loans[(reminded >= params["day_start"]) & (reminded < params["day_end"])]
+        # One row per contact of the borrowing friend, like the inner join did
+        self.reminders = today[REMINDER_COLUMNS].merge(
+            contacts[["FriendID", "type", "contact"]], on="FriendID"
+        )
+        # Every loan that is overdue by the end of today
+        overdues = loans[loans["DueDate"] < params["day_end"]][OVERDUE_COLUMNS]
+        self.overdues = overdues.sort_values("DueDate", kind="stable").reset_index(drop=True)
+        self.due_dates = self.overdues["DueDate"].to_numpy()
+
+    def overdue_at(self, now):
+        """Loans due before now: a binary search, then a slice of the result size."""
+        return self.overdues.iloc[:np.searchsorted(self.due_dates, np.datetime64(now), side="left")]
+
+
+_lock = threading.RLock()  # Held while catching up, so a page and the scheduler don't both do it
+_queues = {}    # engine -> _Queue
+_version_lock = threading.Lock()  # Not _lock: a write must not wait for a catch-up
+_version = 0    # Bumped whenever TABLES change; a queue checked at an older version may be behind
+_wake = threading.Event()
+_scheduler = None
+
+
+def _current(engine):
+    """
+    The engine's queue. When the day or the data changed since it was
+    checked, the views catch up first, and the queue is filtered again only
+    if that changed their frames.
+    """
+    with _lock:
+        queue = _queues.get(engine)
+        today = date.today()
+        if queue is None or queue.day != today or queue.version != _version:
+            # A write during the catch-up bumps _version again, so it is checked again next time
+            version = _version
+            loans, contacts = LOANS_VIEW.current(engine), CONTACTS_VIEW.current(engine)
+            if queue is not None and queue.day == today and queue.loans is loans and queue.contacts is contacts:
+                queue.version = version  # Nothing the queue shows has changed
+            else:
+                queue = _queues[engine] = _Queue(today, version, loans, contacts)
+        _start_scheduler()
+        return queue
+
+
+def daily_reminders(engine):
+    """Today's reminders, one row per contact of the borrowing friend."""
+    return _current(engine).reminders.copy()
+
+
+def overdue_loans(engine, now=None):
+    """Loans whose due date has passed, oldest first."""
+    return _current(engine).overdue_at(now or datetime.now()).copy()
+
+
+def forget(engine):
+    """Drops an engine's queue, e.g. when its pool is disposed."""
+    with _lock:
+        _queues.pop(engine, None)
+
+
+# --- Keeping the queues current ---
+
+def _mark_stale(tables):
+    global _version
+    if tables is None:
+        # Everything may have changed (library_cache.clear, or the periodic
+        # refresh): read the views again in full rather than catching up
+        for engine in list(_queues):
+            LOANS_VIEW.forget(engine)
+            CONTACTS_VIEW.forget(engine)
+    if tables is None or any(t in TABLES for t in tables):
+        with _version_lock:
+            _version += 1
+        _wake.set()
+
+
+library_cache.add_listener(_mark_stale)
+
+
+def _seconds_until_refresh():
+    midnight = datetime.combine(date.today() + timedelta(days=1), time.min)
+    return min((midnight - datetime.now()).total_seconds() + 1, REFRESH_SECONDS)
+
+
+def _run_scheduler():
+    while True:
+        if not _wake.wait(timeout=_seconds_until_refresh()):
+            # Timed out: a new day, or time to pick up changes made outside the app
+            _mark_stale(None)
+        _wake.clear()
+        with _lock:
+            engines = list(_queues)
+        for engine in engines:
+            try:
+                with _lock:
+                    if engine in _queues:  # Not forgotten in the meantime
+                        _current(engine)
+            except Exception:
+                # Leave it to the next page load, which reports the error
+                forget(engine)
+
+
+def _start_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = threading.Thread(target=_run_scheduler, name="reminder-queue", daemon=True)
+        _scheduler.start()
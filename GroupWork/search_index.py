@@ -0,0 +1,72 @@
+from sqlalchemy import text
+
+# --- Full-text index over Books(Title, Author, Genre) ---
+# MySQL uses an InnoDB FULLTEXT index; the embedded SQLite backend uses an
+# FTS5 table that mirrors Books through triggers. Read.search_catalog queries
+# whichever one the engine's dialect provides.
+
+MYSQL_INDEX_NAME = "ft_books_search"
+SQLITE_TABLE_NAME = "Books_fts"
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS Books_fts USING fts5(
+        Title, Author, Genre,
+        content='Books', content_rowid='rowid', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS Books_fts_insert AFTER INSERT ON Books BEGIN
+        INSERT INTO Books_fts (rowid, Title, Author, Genre)
+        VALUES (new.rowid, new.Title, new.Author, new.Genre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS Books_fts_delete AFTER DELETE ON Books BEGIN
+        INSERT INTO Books_fts (Books_fts, rowid, Title, Author, Genre)
+        VALUES ('delete', old.rowid, old.Title, old.Author, old.Genre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS Books_fts_update AFTER UPDATE ON Books BEGIN
+        INSERT INTO Books_fts (Books_fts, rowid, Title, Author, Genre)
+        VALUES ('delete', old.rowid, old.Title, old.Author, old.Genre);
+        INSERT INTO Books_fts (rowid, Title, Author, Genre)
+        VALUES (new.rowid, new.Title, new.Author, new.Genre);
+    END
+    """,
+]
+
+
+def ensure_search_index(conn):
+    """Creates the full-text index if it is missing. Safe to run repeatedly."""
+    if conn.dialect.name == "sqlite":
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": SQLITE_TABLE_NAME}
+        ).fetchone()
+        for statement in SQLITE_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            # Index the rows that were there before the triggers existed
+            conn.execute(text("INSERT INTO Books_fts (Books_fts) VALUES ('rebuild')"))
+        return
+
+    exists = conn.execute(text("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Books' AND INDEX_NAME = :name
+        LIMIT 1
+    """), {"name": MYSQL_INDEX_NAME}).fetchone()
+    if not exists:
+        conn.execute(text(f"CREATE FULLTEXT INDEX {MYSQL_INDEX_NAME} ON Books (Title, Author, Genre)"))
+
+
+def build_match_expression(dialect_name, words, prefix=True):
+    """
+    Turns search words into a MATCH expression in which every word must occur.
+    With prefix=True each word also matches longer words ("tolk" -> "Tolkien").
+    """
+    if dialect_name == "sqlite":
+        # FTS5: quoted strings are literal tokens, a trailing * makes them prefixes
+        return " ".join('"{}"{}'.format(w.replace('"', '""'), "*" if prefix else "") for w in words)
+    # MySQL boolean mode: + makes a word required, a trailing * makes it a prefix
+    return " ".join("+{}{}".format(w, "*" if prefix else "") for w in words)
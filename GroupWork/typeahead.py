@@ -0,0 +1,80 @@
+"""
+Typeahead pickers: a search box whose matches are looked up on the server,
+so a page sends the browser one page of options instead of every friend or
+every available book.
+
+A lookup is any function (prefix, limit=..., offset=...) returning a frame
+with the key column and a 'display' label, e.g. Read.lookup_friends or
+Read.lookup_books. Each search (Enter in the box) runs one indexed prefix
+query for PAGE_SIZE + 1 rows; the extra row tells whether to offer a next page.
+
+Widgets that trigger a search can't live inside an st.form (a form only
+reruns on submit), so pages place the pickers above their form.
+"""
+import streamlit as st
+
+import Read
+from picker_index import PickerIndex
+
+PAGE_SIZE = Read.TYPEAHEAD_LIMIT
+
+
+def _search(label, lookup, key_column, key, placeholder):
+    """The search box and its paging buttons; returns (PickerIndex of this page, widget suffix)."""
+    page_key = f"{key}_page"
+
+    def new_search():
+        st.session_state[page_key] = 0
+
+    def turn(step):
+        st.session_state[page_key] = max(st.session_state.get(page_key, 0) + step, 0)
+
+    prefix = st.text_input(label, key=f"{key}_query", placeholder=placeholder, on_change=new_search).strip()
+    page = st.session_state.get(page_key, 0)
+    matches = lookup(prefix, limit=PAGE_SIZE + 1, offset=page * PAGE_SIZE)
+    has_next = len(matches) > PAGE_SIZE
+    matches = matches.iloc[:PAGE_SIZE]
+
+    if page or has_next:
+        col1, col2, col3 = st.columns([1, 4, 1])
+        col1.button("◀", key=f"{key}_prev", on_click=turn, args=(-1,), disabled=page == 0, use_container_width=True)
+        col2.caption(f"Matches {page * PAGE_SIZE + 1}–{page * PAGE_SIZE + len(matches)}")
+        col3.button("▶", key=f"{key}_next", on_click=turn, args=(1,), disabled=not has_next, use_container_width=True)
+    picker = PickerIndex(matches, matches["display"] if len(matches) else [], key_column)
+    # A new search or page is a new set of options, so it gets a fresh selectbox
+    return picker, f"{prefix}_{page}"
+
+
+def select_one(label, lookup, key_column, key, placeholder="Type the start of a name or title, then Enter..."):
+    """One row picked from the matches (a Series with key_column and 'display'), or None."""
+    picker, suffix = _search(label, lookup, key_column, key, placeholder)
+    if not len(picker):
+        st.caption("No matches.")
+        return None
+    choice = st.selectbox(
+        f"{label} — matches", options=picker.labels, key=f"{key}_choice_{suffix}",
+        index=0 if len(picker) == 1 else None, placeholder="Select a match...",
+    )
+    return picker.row(choice)
+
+
+def select_many(label, lookup, key_column, key, placeholder="Type the start of a name or title, then Enter..."):
+    """
+    Rows collected over several searches, like a shopping cart; returns
+    them as a list of Series. Call clear(key) once they have been used.
+    """
+    cart_key = f"{key}_cart"
+    cart = st.session_state.get(cart_key, {})  # display -> row, kept across searches
+    picker, _ = _search(label, lookup, key_column, key, placeholder)
+    options = list(dict.fromkeys([*cart, *picker.labels]))
+    # No widget key: a changed option list makes a new widget, which starts from the cart
+    chosen = st.multiselect(f"{label} — selected", options=options, default=list(cart), placeholder="Add matches...")
+    cart = {display: cart[display] if display in cart else picker.row(display) for display in chosen}
+    st.session_state[cart_key] = cart
+    return list(cart.values())
+
+
+def clear(key):
+    """Forgets a picker's search, page and cart, e.g. after a successful checkout."""
+    for name in (f"{key}_query", f"{key}_page", f"{key}_cart"):
+        st.session_state.pop(name, None)